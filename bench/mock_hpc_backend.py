@@ -0,0 +1,383 @@
+'''
+本地模拟 hpc-backend，用于离线压测和回归测试。
+
+按参数生成一个可伸缩的合成集群（节点、分区、作业、用户），实现 infra/hpc_api.py 用到的接口，
+响应结构与 docs/api.txt 一致。可以配置每个请求的延迟和出错概率，用来观察重试、超时和并发限流的表现。
+
+使用：
+    python bench/mock_hpc_backend.py --nodes 1000 --jobs 20000 --users 5000 --port 18080
+然后把 config.ini（或 HPC_CONFIG 指向的配置文件）的 [hpc] base_url 改为 http://127.0.0.1:18080/hpc-backend。
+
+GET /__stats 返回各接口的请求计数，POST /__stats 清零。
+'''
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PREFIX = '/hpc-backend'
+TIME_FMT = '%Y-%m-%d %H:%M:%S'
+
+# 状态参数 -> 作业状态，与 HpcApi.Status* 对应
+STATUS_FLAGS = {
+    'isRunning': 'RUNNING',
+    'isPending': 'PENDING',
+    'isFinishedOnlySuccessed': 'COMPLETED',
+    'isError': 'FAILED',
+    'isCancelled': 'CANCELLED',
+}
+
+CARD_TYPES = ['gpu:A100', 'tgpu:TG150', 'npu:Ascend910']
+
+
+def _fmt_time(ts):
+    return datetime.fromtimestamp(ts).strftime(TIME_FMT) if ts else None
+
+
+def _fmt_mem(gib):
+    return f'{gib:.3f} GiB'
+
+
+def _noise(*keys):
+    '''由 keys 决定的 [0, 1) 伪随机数，同一节点同一时刻的取值在多次请求间保持一致'''
+    return (zlib.crc32('|'.join(map(str, keys)).encode()) & 0xffff) / 0x10000
+
+
+class SyntheticCluster:
+    '''
+    启动时按 seed 生成的合成集群，生成后只读，多个请求线程可以并发访问。
+
+    每 nodes_per_partition 个节点组成一个分区，每隔一个分区带卡；
+    作业按 运行中/排队中/完成/失败/取消 约 10%/5%/65%/15%/5% 分布，开始时间分布在最近 job_days 天内。
+    使用率曲线按当前时间生成，每 sample_step 秒一个点，共 history_points 个，随时间推移会不断出现新点。
+    '''
+
+    def __init__(self, nodes=100, jobs=2000, users=500, nodes_per_partition=25, history_points=60,
+                 sample_step=60, job_days=30, seed=0):
+        rng = random.Random(seed)
+        self.history_points = history_points
+        self.sample_step = sample_step
+
+        self.nodes = {}
+        self.partitions = {}
+        for i in range(nodes):
+            partition_idx = i // nodes_per_partition
+            partition = f'part{partition_idx:03d}'
+            card_type = CARD_TYPES[partition_idx // 2 % len(CARD_TYPES)] if partition_idx % 2 else None
+            name = f'node{i:05d}'
+            self.nodes[name] = {
+                'name': name,
+                'partition': partition,
+                'cpu': rng.choice([64, 128, 192]),
+                'mem': rng.choice([488.281, 927.734, 1953.125]),
+                'card_type': card_type,
+                'card': rng.choice([4, 8]) if card_type else 0,
+                'ip': f'10.{i // 65536}.{i // 256 % 256}.{i % 256}',
+                'cabinet': f'cabinet{i // 40:03d}',
+                'active': rng.random() > 0.02,
+            }
+            self.partitions.setdefault(partition, []).append(name)
+
+        now = int(time.time())
+        node_names = list(self.nodes)
+        user_names = [f'u{i:06d}' for i in range(max(users, 1))]
+        self.jobs = []
+        for i in range(jobs):
+            status = rng.choices(['RUNNING', 'PENDING', 'COMPLETED', 'FAILED', 'CANCELLED'], [10, 5, 65, 15, 5])[0]
+            node = self.nodes[rng.choice(node_names)]
+            submit = now - rng.randint(60, job_days * 86400)
+            start = None if status == 'PENDING' else submit + rng.randint(0, 600)
+            end = min(start + rng.randint(60, 86400), now) if status in ('COMPLETED', 'FAILED', 'CANCELLED') else None
+            resource = {'mem': f'{rng.choice([16, 32, 64, 128])} GiB', 'cpu': rng.choice([4, 8, 16, 32])}
+            if node['card_type']:
+                resource = {'computingResource': {'name': node['card_type'], 'value': 1}, **resource, node['card_type']: rng.randint(1, node['card'])}
+            self.jobs.append({
+                'slurmJobId': str(10000 + i),
+                'id': str(1900000000000000000 + i),
+                'name': f'job-{i}',
+                'partition': node['partition'],
+                'nodes': '' if status == 'PENDING' else node['name'],
+                'nodeCount': 0 if status == 'PENDING' else 1,
+                'createBy': rng.choice(user_names),
+                'submitTime': _fmt_time(submit),
+                'startTime': _fmt_time(start),
+                'endTime': _fmt_time(end) or '',
+                'duration': f'{((end or now) - start) if start else 0}秒',
+                'resourceUsed': resource,
+                'status': status,
+            })
+        # 接口按 startTime 倒序返回，排队中的作业没有 startTime，排在最后
+        self.jobs.sort(key=lambda x: x['startTime'] or '', reverse=True)
+
+        self.users = [{
+            'id': str(1800000000000000000 + i),
+            'username': username,
+            'realname': f'用户{i}',
+            'email': f'{username}@example.com',
+            'phone': f'138{i:08d}',
+            'roleNameList': ['普通用户'],
+            'createTime': _fmt_time(now - i * 600),
+            'status_dictText': '正常' if i % 20 else '冻结',
+        } for i, username in enumerate(user_names[:users])]
+
+        # 节点/分区已用资源由运行中的作业累计
+        self.used = {name: Counter() for name in self.nodes}
+        for job in self.jobs:
+            if job['status'] == 'RUNNING':
+                used = self.used[job['nodes']]
+                used['cpu'] += job['resourceUsed']['cpu']
+                used['mem'] += int(job['resourceUsed']['mem'].split()[0])
+                used['card'] += job['resourceUsed'].get(self.nodes[job['nodes']]['card_type'], 0)
+
+    def _resource(self, node, idled=False):
+        used = self.used[node['name']] if idled else Counter()
+        resource = {
+            'mem': _fmt_mem(max(node['mem'] - used['mem'], 0)),
+            'cpu': max(node['cpu'] - used['cpu'], 0),
+        }
+        if node['card_type']:
+            resource[node['card_type']] = max(node['card'] - used['card'], 0)
+        return resource
+
+    def overview(self):
+        node_resource = {name: self._resource(node) for name, node in self.nodes.items()}
+        node_idled = {name: self._resource(node, idled=True) for name, node in self.nodes.items()}
+
+        def total(resources, names):
+            ret = Counter()
+            for name in names:
+                for key, value in resources[name].items():
+                    ret[key] += float(value.split()[0]) if key == 'mem' else value
+            return {key: _fmt_mem(value) if key == 'mem' else int(value) for key, value in ret.items()}
+
+        return {
+            'partitionComputingResource': {p: total(node_resource, names) for p, names in self.partitions.items()},
+            'partitionComputingResourceIdled': {p: total(node_idled, names) for p, names in self.partitions.items()},
+            'nodeComputingResource': node_resource,
+            'nodeComputingResourceIdled': node_idled,
+            'partitionNode': self.partitions,
+        }
+
+    def deployment(self):
+        cabinets = {}
+        for name, node in self.nodes.items():
+            cabinets.setdefault(node['cabinet'], []).append({
+                'name': name,
+                'ip': node['ip'],
+                'state': 'active' if node['active'] else 'inactive',
+                'slurmState': ('mixed' if self.used[name]['cpu'] else 'idle') if node['active'] else 'down',
+            })
+        return [{'cabinet': cabinet, 'nodes': nodes} for cabinet, nodes in cabinets.items()]
+
+    def tasks(self, params):
+        statuses = {status for flag, status in STATUS_FLAGS.items() if params.get(flag, '').lower() == 'true'}
+        jobs = self.jobs
+        if statuses:
+            jobs = [job for job in jobs if job['status'] in statuses]
+        if params.get('partition'):
+            jobs = [job for job in jobs if job['partition'] == params['partition']]
+        if params.get('createBy'):
+            jobs = [job for job in jobs if job['createBy'] == params['createBy']]
+        if params.get('name'):
+            jobs = [job for job in jobs if params['name'] in job['name']]
+        if params.get('startTime'):
+            jobs = [job for job in jobs if job['startTime'] and job['startTime'] >= params['startTime']]
+        if params.get('endTime'):
+            jobs = [job for job in jobs if job['startTime'] and job['startTime'] <= params['endTime']]
+        return jobs
+
+    def series(self, node_name, metric, count=1):
+        '''最近 history_points 个采样点，时间戳按 sample_step 对齐'''
+        last = int(time.time()) // self.sample_step * self.sample_step
+        timestamps = range(last - (self.history_points - 1) * self.sample_step, last + 1, self.sample_step)
+        return [{
+            'metric': {'instance': node_name, 'index': str(idx)},
+            'values': [[ts, f'{_noise(node_name, metric, idx, ts) * 100:.2f}'] for ts in timestamps],
+        } for idx in range(count)]
+
+    def card_metrics(self, node_name):
+        node = self.nodes.get(node_name)
+        if not node or not node['card_type']:
+            return {}
+        now = int(time.time()) // self.sample_step
+        return {str(idx): {
+            'name': node['card_type'].split(':')[-1],
+            'mem': '80 GiB',
+            'memUsed': f'{_noise(node_name, "mem", idx, now) * 80:.1f} GiB',
+            'usedRatio': round(_noise(node_name, 'gpu', idx, now) * 100, 1),
+            'temperature': 30 + int(_noise(node_name, 'temp', idx, now) * 50),
+        } for idx in range(node['card'])}
+
+
+def _page(records, params, default_size=10):
+    page_no = max(int(params.get('pageNo') or 1), 1)
+    pagesize = max(int(params.get('pageSize') or default_size), 1)
+    return {
+        'records': records[(page_no - 1) * pagesize: page_no * pagesize],
+        'total': len(records),
+        'size': pagesize,
+        'current': page_no,
+        'pages': (len(records) + pagesize - 1) // pagesize,
+    }
+
+
+class MockBackend(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cluster, latency=0.0, jitter=0.0, error_rate=0.0, token_ttl=0, seed=0):
+        super().__init__(address, MockHandler)
+        self.cluster = cluster
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def issue_token(self):
+        # 模拟 JWT：只有 payload 里的 exp 有意义，客户端据此判断提前刷新的时机
+        exp = int(time.time()) + (self.token_ttl or 86400 * 365)
+        payload = base64.urlsafe_b64encode(json.dumps({'exp': exp}).encode()).decode().rstrip('=')
+        return f'mock.{payload}.sig'
+
+    def token_valid(self, cookie):
+        if not self.token_ttl:
+            return True
+        token = (cookie or '').partition('X-Access-Token=')[2].split(';')[0]
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(payload))['exp'] > time.time()
+        except Exception:
+            return False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server: MockBackend
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _ok(self, result, code=200):
+        self._reply({'success': True, 'message': '', 'code': code, 'result': result, 'timestamp': int(time.time() * 1000)})
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = {}
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+        if url.path == '/__stats':
+            with self.server.lock:
+                if method == 'POST':
+                    self.server.stats.clear()
+                return self._reply(dict(self.server.stats))
+
+        path = url.path[len(PREFIX):] if url.path.startswith(PREFIX) else url.path
+        with self.server.lock:
+            self.server.stats[path] += 1
+            fail = self.server.rng.random() < self.server.error_rate
+        delay = self.server.latency + self.server.jitter * _noise(path, time.time())
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self._reply({'success': False, 'message': 'mock error', 'code': 500, 'result': None}, 500)
+        if path == '/sys/encryptLogin':
+            return self._ok({'token': self.server.issue_token()})
+        if not self.server.token_valid(self.headers.get('Cookie')):
+            return self._reply({'success': False, 'message': 'token失效', 'code': 401, 'result': None})
+
+        cluster = self.server.cluster
+        if path == '/qos/compositeComputingResourceRelation':
+            return self._ok(cluster.overview())
+        if path == '/realtime-monitoring/deployment':
+            return self._ok(cluster.deployment())
+        if path == '/sys/user/activeStatistics':
+            return self._ok({'total': len(cluster.users), 'active': sum(1 for user in cluster.users if user['status_dictText'] == '正常')})
+        if path == '/task/pageList':
+            return self._ok(_page(cluster.tasks(params), params))
+        if path == '/sys/user/listAll':
+            users = cluster.users
+            if params.get('username'):
+                users = [user for user in users if params['username'] in user['username']]
+            if params.get('realname'):
+                users = [user for user in users if params['realname'] in user['realname']]
+            # 真实接口此处 code 为 0
+            return self._ok(_page(users, params), code=0)
+        if path == '/realtime-monitoring/cpuUsage':
+            return self._ok(cluster.series(body.get('node'), 'cpu'))
+        if path == '/realtime-monitoring/memoryUsage':
+            return self._ok(cluster.series(body.get('node'), 'mem'))
+        if path == '/monitoring/card/metrics':
+            return self._ok(cluster.card_metrics(params.get('node')))
+        if path == '/monitoring/card/usageTrend':
+            node = cluster.nodes.get(params.get('node'))
+            return self._ok(cluster.series(params.get('node'), 'gpu', node['card'] if node else 0))
+        self._reply({'success': False, 'message': f'未实现的接口：{path}', 'code': 404, 'result': None}, 404)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+def serve(host='127.0.0.1', port=18080, nodes=100, jobs=2000, users=500, nodes_per_partition=25, history_points=60,
+          sample_step=60, latency=0.0, jitter=0.0, error_rate=0.0, token_ttl=0, seed=0):
+    '''创建并返回模拟服务（未启动），调用方负责 serve_forever / shutdown'''
+    cluster = SyntheticCluster(nodes=nodes, jobs=jobs, users=users, nodes_per_partition=nodes_per_partition,
+                               history_points=history_points, sample_step=sample_step, seed=seed)
+    return MockBackend((host, port), cluster, latency=latency, jitter=jitter, error_rate=error_rate, token_ttl=token_ttl, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟 hpc-backend')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--nodes', type=int, default=100, help='节点数')
+    parser.add_argument('--jobs', type=int, default=2000, help='作业数')
+    parser.add_argument('--users', type=int, default=500, help='用户数')
+    parser.add_argument('--nodes-per-partition', type=int, default=25, help='每个分区的节点数')
+    parser.add_argument('--history-points', type=int, default=60, help='使用率曲线每条 series 的点数')
+    parser.add_argument('--sample-step', type=int, default=60, help='使用率曲线采样间隔（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='在固定延迟之上附加的随机延迟上限（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='请求返回 500 的概率')
+    parser.add_argument('--token-ttl', type=int, default=0, help='token 有效期（秒），0 为不校验 token')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.time()
+    server = serve(**{key: value for key, value in vars(args).items()})
+    cluster = server.cluster
+    print(f'模拟 hpc-backend 已启动：http://{args.host}:{server.server_address[1]}{PREFIX}，'
+          f'节点：{len(cluster.nodes)}，分区：{len(cluster.partitions)}，作业：{len(cluster.jobs)}，用户：{len(cluster.users)}，'
+          f'生成耗时：{time.time() - start:.2f}秒', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import os
 import loguru
 import configparser
 
@@ -5,4 +6,5 @@ loguru.logger.add("./logs/hutb_hpc.log", colorize=True, level="INFO", encoding="
 logger = loguru.logger
 
 cfg = configparser.ConfigParser()
-cfg.read('config.ini', encoding="utf-8")
\ No newline at end of file
+# 压测/回归测试时可用 HPC_CONFIG 指向另一份配置（例如 base_url 指向本地模拟服务）
+cfg.read(os.environ.get('HPC_CONFIG', 'config.ini'), encoding="utf-8")
\ No newline at end of file
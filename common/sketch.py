@@ -0,0 +1,99 @@
+import math
+import numpy as np
+
+
+class QuantileSketch:
+    '''
+    可合并的分位数草图，按对数分桶（DDSketch 的做法，效果与相对精度固定的 HDR 直方图相同）。
+
+    正数 v 落在第 ceil(log_gamma(v)) 个桶，gamma = (1 + a) / (1 - a)，分位数取所在桶的估计值，相对误差不超过 a；
+    0 和负数单独计数。合并两个草图就是把对应桶的计数相加，与顺序无关，所以可以按小时分别保存，再按任意时间窗口合并。
+    桶只保存有计数的部分，排队时长从 1 秒到 30 天在 a = 1% 时最多约 740 个桶。
+    '''
+    __slots__ = ('relative_accuracy', 'gamma', '_log_gamma', 'bins', 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        # 桶编号 -> 计数
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = self.max = None
+
+    def add(self, values):
+        '''加入一批数值（NaN 忽略），返回自身'''
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] = self.bins.get(key, 0) + count
+        self.count += len(values)
+        self.sum += float(values.sum())
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        return self
+
+    def merge(self, other):
+        '''把 other 合并进来，返回自身；精度不同的草图桶边界不同，不能合并'''
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f'草图精度不同，不能合并：{self.relative_accuracy} != {other.relative_accuracy}')
+        if not other.count:
+            return self
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantiles(self, qs):
+        '''一次求多个分位数（0 <= q <= 1），空草图返回 None'''
+        if not self.count:
+            return [None] * len(qs)
+        keys = np.array(sorted(self.bins), dtype=np.int64)
+        cumulative = self.zero_count + np.cumsum([self.bins[key] for key in keys.tolist()], dtype=np.int64)
+        result = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zero_count:
+                result.append(min(self.min, 0.0))
+                continue
+            i = min(int(np.searchsorted(cumulative, rank, side='right')), len(keys) - 1)
+            # 桶 k 覆盖 (gamma^(k-1), gamma^k]，取 2 * gamma^k / (gamma + 1) 使相对误差不超过 a
+            value = 2 * self.gamma ** int(keys[i]) / (self.gamma + 1)
+            result.append(min(max(value, self.min), self.max))
+        return result
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self):
+        '''可 JSON 序列化的表示，桶编号转成字符串作为键'''
+        return {'a': self.relative_accuracy, 'bins': {str(key): count for key, count in self.bins.items()},
+                'zero': self.zero_count, 'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['a'])
+        sketch.bins = {int(key): count for key, count in data['bins'].items()}
+        sketch.zero_count = data['zero']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
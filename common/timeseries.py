@@ -0,0 +1,149 @@
+import numpy as np
+
+EMPTY_TIMESTAMPS = np.empty(0, dtype=np.int64)
+EMPTY_VALUES = np.empty(0, dtype=np.float64)
+
+
+def aggregate_series(series):
+    '''
+    把上游返回的多条使用率曲线按时间戳求平均，返回按时间戳升序的 (timestamps, values) 两个数组。
+
+    series 形如 [{'metric': {...}, 'values': [[时间戳, "值"], ...]}, ...]，多卡节点的 GPU 曲线每张卡一条，
+    结果即同一时刻各卡的平均使用率。全部用 NumPy 一次完成：展开、丢弃 NaN、np.unique 分组、bincount 求和计数。
+    '''
+    if not series or isinstance(series, dict):
+        return EMPTY_TIMESTAMPS, EMPTY_VALUES
+    count = sum(len(s['values']) for s in series)
+    if not count:
+        return EMPTY_TIMESTAMPS, EMPTY_VALUES
+    timestamps = np.fromiter((point[0] for s in series for point in s['values']), dtype=np.float64, count=count)
+    values = np.fromiter((point[1] for s in series for point in s['values']), dtype=np.float64, count=count)
+
+    valid = ~np.isnan(values)
+    if not valid.all():
+        timestamps, values = timestamps[valid], values[valid]
+    uniq, inverse = np.unique(timestamps.astype(np.int64), return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq))
+    return uniq, sums / counts
+
+
+def bucket_minmax(timestamps, values, start, step):
+    '''
+    按 start + k * step 分桶取最小值和最大值，与数据库降采样的分桶方式一致，timestamps 须升序。
+    返回 (桶起点, 桶内最小值, 桶内最大值) 三个数组。
+    '''
+    if not len(timestamps):
+        return EMPTY_TIMESTAMPS, EMPTY_VALUES, EMPTY_VALUES
+    idx = (timestamps.astype(np.int64) - start) // step
+    # 时间戳升序，桶编号也升序，每个桶是连续的一段，reduceat 在段首位置分段求最值
+    starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    return start + idx[starts] * step, np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+
+def lttb(timestamps, values, n_out):
+    '''
+    Largest-Triangle-Three-Buckets 降采样，返回不超过 n_out 个点的 (timestamps, values)。
+
+    首尾两点固定，中间等分为 n_out - 2 个桶，每个桶选出与「上一个选中点」「下一个桶均值」构成三角形面积最大的点，
+    尖峰和低谷都会被保留，不会像取最大值那样整体偏高，也不会像等间隔抽点那样丢掉尖峰。
+    各桶均值用 reduceat 一次算出，逐桶选点只对桶内切片做向量运算，总开销与点数成线性。
+    '''
+    n = len(timestamps)
+    if n_out >= n or n_out < 3:
+        return timestamps, values
+    x = timestamps.astype(np.float64)
+    y = values.astype(np.float64)
+    # n > n_out 时相邻边界至少相差 1，每个桶都不为空
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    lengths = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / lengths
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / lengths
+    # 第 i 个桶使用第 i + 1 个桶的均值，最后一个桶使用终点
+    next_x = np.r_[avg_x[1:], x[-1]]
+    next_y = np.r_[avg_y[1:], y[-1]]
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return timestamps[selected], values[selected]
+
+
+def minmax_lttb(buckets, mins, maxs, step, n_out):
+    '''
+    数据库（或内存）按细粒度桶下推 MIN/MAX 后的二次降采样：每个桶展开成桶起点的最小值和桶中点的最大值两个候选点，
+    再用 LTTB 选出 n_out 个点。桶宽远小于图表一个像素对应的时间，候选点的时间偏差不可见。
+    '''
+    buckets = np.asarray(buckets, dtype=np.int64)
+    if not len(buckets):
+        return EMPTY_TIMESTAMPS, EMPTY_VALUES
+    mins = np.asarray(mins, dtype=np.float64)
+    maxs = np.asarray(maxs, dtype=np.float64)
+    timestamps = np.empty(len(buckets) * 2, dtype=np.int64)
+    values = np.empty(len(buckets) * 2, dtype=np.float64)
+    timestamps[0::2], timestamps[1::2] = buckets, buckets + step // 2
+    values[0::2], values[1::2] = mins, maxs
+    # 最小值与最大值相同的桶只保留一个点
+    keep = np.ones(len(timestamps), dtype=bool)
+    keep[1::2] = maxs != mins
+    return lttb(timestamps[keep], values[keep], n_out)
+
+
+class RingBuffer:
+    '''
+    定长环形缓冲区，保存一条曲线最近 capacity 个点，时间戳 int32、数值 float32，每个点 8 字节。
+
+    只接受比已有最后一个点更新的数据，写满后覆盖最旧的点，写入和读取都是整段数组操作。
+    '''
+    __slots__ = ('timestamps', 'values', 'capacity', 'size', 'head')
+
+    def __init__(self, capacity):
+        self.timestamps = np.empty(capacity, dtype=np.int32)
+        self.values = np.empty(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.size = 0
+        # 下一个写入位置
+        self.head = 0
+
+    @property
+    def last(self):
+        return int(self.timestamps[self.head - 1]) if self.size else None
+
+    @property
+    def first(self):
+        return int(self.timestamps[(self.head - self.size) % self.capacity]) if self.size else None
+
+    def extend(self, timestamps, values):
+        if self.size:
+            newer = timestamps > self.last
+            timestamps, values = timestamps[newer], values[newer]
+        n = len(timestamps)
+        if not n:
+            return
+        if n >= self.capacity:
+            timestamps, values, n = timestamps[-self.capacity:], values[-self.capacity:], self.capacity
+        # 最多分两段写入：head 到数组末尾，再从数组开头继续
+        first = min(n, self.capacity - self.head)
+        self.timestamps[self.head:self.head + first] = timestamps[:first]
+        self.values[self.head:self.head + first] = values[:first]
+        self.timestamps[:n - first] = timestamps[first:]
+        self.values[:n - first] = values[first:]
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def since(self, start):
+        '''按时间升序返回时间戳不早于 start 的 (timestamps, values) 副本'''
+        begin = (self.head - self.size) % self.capacity
+        if begin + self.size <= self.capacity:
+            timestamps = self.timestamps[begin:begin + self.size]
+            values = self.values[begin:begin + self.size]
+        else:
+            timestamps = np.concatenate((self.timestamps[begin:], self.timestamps[:self.head]))
+            values = np.concatenate((self.values[begin:], self.values[:self.head]))
+        i = np.searchsorted(timestamps, start)
+        return timestamps[i:].copy(), values[i:].copy()
@@ -28,6 +28,37 @@ def search_params(search: str) -> dict:
     return parameters
 
 
+def grid_sort_keys(sort_model, fields):
+    '''
+    AG Grid 的 sortModel 转成 [(列, 是否降序)]。fields 为 表格字段 -> 数据列 的映射，不在映射中的字段忽略
+    '''
+    return [(fields[item['colId']], item.get('sort') == 'desc')
+            for item in sort_model or [] if fields.get(item.get('colId'))]
+
+
+# 表格文本筛选方式 -> SQLAlchemy 条件，like 类条件转义 % 和 _
+GRID_SQL_CONDITIONS = {
+    'contains': lambda c, v: c.contains(v, autoescape=True),
+    'notContains': lambda c, v: ~c.contains(v, autoescape=True),
+    'equals': lambda c, v: c == v,
+    'notEqual': lambda c, v: c != v,
+    'startsWith': lambda c, v: c.startswith(v, autoescape=True),
+    'endsWith': lambda c, v: c.endswith(v, autoescape=True),
+}
+
+
+def grid_text_filters(filter_model, fields):
+    '''
+    AG Grid 的 filterModel 转成 [(列, 匹配方式, 值)]，只支持单条件的文本筛选，不在映射中的字段忽略
+    '''
+    filters = []
+    for field, model in (filter_model or {}).items():
+        column = fields.get(field)
+        if column and model.get('filterType') == 'text' and model.get('filter') not in (None, ''):
+            filters.append((column, model.get('type'), model['filter']))
+    return filters
+
+
 
 # INSERT_YOUR_CODE
 # 兼容给windows和linux，启动前杀死占用端口8050的进程（优先于PID文件）
@@ -6,12 +6,13 @@ create table t_node_cpu_history_info (
     `cpu_usage` float not null,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
-    primary key (`id`),
+    primary key (`id`, `timestamp`),
     INDEX node_idx (node),
     UNIQUE (node, timestamp),
     INDEX timestamp_idx (timestamp),
     INDEX node_timestamp_idx (node, timestamp)
-) COMMENT='节点CPU历史信息表';
+) COMMENT='节点CPU历史信息表'
+PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
 
 create table t_node_mem_history_info (
     `id` int(11) not null auto_increment,
@@ -20,12 +21,13 @@ create table t_node_mem_history_info (
     `mem_usage` float not null,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
-    primary key (`id`),
+    primary key (`id`, `timestamp`),
     INDEX node_idx (node),
     UNIQUE (node, timestamp),
     INDEX timestamp_idx (timestamp),
     INDEX node_timestamp_idx (node, timestamp)
-) COMMENT='节点内存历史信息表';
+) COMMENT='节点内存历史信息表'
+PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
 
 create table t_node_gpu_history_info (
     `id` int(11) not null auto_increment,
@@ -34,12 +36,13 @@ create table t_node_gpu_history_info (
     `gpu_usage` float not null,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
-    primary key (`id`),
+    primary key (`id`, `timestamp`),
     INDEX node_idx (node),
     UNIQUE (node, timestamp),
     INDEX timestamp_idx (timestamp),
     INDEX node_timestamp_idx (node, timestamp)
-) COMMENT='节点GPU历史信息表';
+) COMMENT='节点GPU历史信息表'
+PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
 
 create table t_daily_report_info (
     `id` int(11) not null auto_increment,
@@ -66,6 +69,84 @@ create table t_daily_report_info (
 -- ALTER TABLE t_node_mem_history_info ADD INDEX node_ts_mem_idx (node, timestamp, mem_usage);
 -- ALTER TABLE t_node_gpu_history_info ADD INDEX node_ts_gpu_idx (node, timestamp, gpu_usage);
 
+create table t_node_history_rollup_5m (
+    `node` varchar(255) not null comment '节点名称',
+    `metric` varchar(16) not null comment '指标：CPU/Memory/GPU',
+    `bucket` int(11) not null comment '时间桶起点（时间戳）',
+    `min_val` float not null comment '最小值',
+    `max_val` float not null comment '最大值',
+    `sum_val` double not null comment '求和，平均值为 sum_val / cnt',
+    `cnt` int(11) not null comment '样本数',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    primary key (`node`, `metric`, `bucket`)
+) COMMENT='节点历史5分钟汇总表'
+PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+create table t_node_history_rollup_1h (
+    `node` varchar(255) not null comment '节点名称',
+    `metric` varchar(16) not null comment '指标：CPU/Memory/GPU',
+    `bucket` int(11) not null comment '时间桶起点（时间戳）',
+    `min_val` float not null comment '最小值',
+    `max_val` float not null comment '最大值',
+    `sum_val` double not null comment '求和，平均值为 sum_val / cnt',
+    `cnt` int(11) not null comment '样本数',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    primary key (`node`, `metric`, `bucket`)
+) COMMENT='节点历史1小时汇总表'
+PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+create table t_node_history_rollup_1d (
+    `node` varchar(255) not null comment '节点名称',
+    `metric` varchar(16) not null comment '指标：CPU/Memory/GPU',
+    `bucket` int(11) not null comment '时间桶起点（时间戳）',
+    `min_val` float not null comment '最小值',
+    `max_val` float not null comment '最大值',
+    `sum_val` double not null comment '求和，平均值为 sum_val / cnt',
+    `cnt` int(11) not null comment '样本数',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    primary key (`node`, `metric`, `bucket`)
+) COMMENT='节点历史1天汇总表'
+PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+-- 已有历史数据时，建表后执行 service.history.history_rollup.backfill() 从原始表生成汇总
+
+create table t_node_dict (
+    id smallint unsigned not null auto_increment,
+    node varchar(255) not null comment '节点名称',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    primary key (`id`),
+    unique key (`node`)
+) COMMENT='节点字典表';
+
+create table t_node_history (
+    node_id smallint unsigned not null comment '节点ID，对应 t_node_dict.id',
+    ts int(11) not null comment '时间戳',
+    cpu float comment 'CPU使用率',
+    mem float comment '内存使用率',
+    gpu float comment 'GPU使用率',
+    primary key (`node_id`, `ts`)
+) COMMENT='节点历史宽表（[history] storage=wide）'
+PARTITION BY RANGE (`ts`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
+-- 从三张分表迁移到宽表：建表后执行 service.history.history_wide.migrate()（可重复执行），
+-- 确认数据完整后把 config.ini 的 [history] storage 改为 wide 并重启，旧表保留到确认无误后再删除
+
+-- 历史表按月 RANGE 分区（时间戳按 UTC 月初划分），过期数据由 service.retention 的定时任务 DROP PARTITION 删除。
+-- 以上建表语句只建一个 MAXVALUE 分区，维护任务会把它拆分出当月及未来 [retention] future_months 个月的分区，
+-- 第一次拆出的当月分区同时承接更早的历史数据。
+-- 已有库迁移时单独执行以下语句，会重建整表，请在低峰期执行。
+-- 分区表的每个唯一键都必须包含分区列，原始表的主键需要先改为 (id, timestamp)：
+-- ALTER TABLE t_node_cpu_history_info DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp);
+-- ALTER TABLE t_node_mem_history_info DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp);
+-- ALTER TABLE t_node_gpu_history_info DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp);
+-- ALTER TABLE t_node_cpu_history_info PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_mem_history_info PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_gpu_history_info PARTITION BY RANGE (`timestamp`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_history PARTITION BY RANGE (`ts`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_history_rollup_5m PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_history_rollup_1h PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+-- ALTER TABLE t_node_history_rollup_1d PARTITION BY RANGE (`bucket`) (PARTITION pmax VALUES LESS THAN MAXVALUE);
+
 create table t_hpc_user_info (
     id int(11) not null auto_increment,
     hpc_id varchar(255) not null default '' comment 'HPC ID',
@@ -79,9 +160,67 @@ create table t_hpc_user_info (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
     primary key (`id`),
-    unique key (username)
+    unique key (username),
+    key idx_status_register_time (status, register_time),
+    key idx_register_time (register_time)
 ) COMMENT='HPC用户信息表';
 
+-- 已有库补建用户表索引（用户表格按状态筛选、按注册时间排序分页），单独执行以下语句：
+-- alter table t_hpc_user_info add index idx_status_register_time (status, register_time), add index idx_register_time (register_time);
+
+create table t_job_archive (
+    job_id varchar(64) not null comment '作业ID（slurmJobId）',
+    name varchar(255) not null default '' comment '作业名',
+    status varchar(16) not null comment '状态：已完成/失败',
+    partition_name varchar(255) not null default '' comment '分区',
+    nodes varchar(512) not null default '' comment '节点',
+    create_by varchar(255) not null default '' comment '申请人',
+    submit_time datetime comment '提交时间',
+    start_time datetime comment '开始时间',
+    end_time datetime comment '结束时间',
+    duration varchar(64) comment '运行时长',
+    cpu int(11) comment 'CPU核数',
+    mem varchar(32) comment '内存',
+    card int(11) comment '加速卡数',
+    card_type varchar(64) comment '加速卡类型',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    primary key (`job_id`),
+    key idx_create_by_submit (create_by, submit_time),
+    key idx_partition_submit (partition_name, submit_time),
+    key idx_nodes_submit (nodes, submit_time),
+    key idx_status_submit (status, submit_time),
+    key idx_submit_time (submit_time),
+    key idx_start_time (start_time)
+) COMMENT='已结束作业归档表';
+
+-- 刷新时把本轮拉取到的已完成/失败作业按 job_id 覆盖写入；上线前已结束的作业可手动回填一次：
+--   from service.hpc_manager import hpc_manager
+--   hpc_manager.backfill_job_archive()
+
+create table t_job_event (
+    job_id varchar(64) not null comment '作业ID（slurmJobId）',
+    event tinyint unsigned not null comment '事件：1 submitted，2 started，3 finished，4 failed',
+    ts int(11) not null comment '事件时间戳（取上游的提交/开始/结束时间）',
+    partition_name varchar(255) not null default '' comment '分区',
+    create_by varchar(255) not null default '' comment '申请人',
+    card_type varchar(64) comment '加速卡类型',
+    wait_seconds int(11) comment '排队时长（秒），只有 started 事件有值',
+    primary key (`job_id`, `event`),
+    key idx_event_ts (event, ts),
+    key idx_partition_event_ts (partition_name, event, ts)
+) COMMENT='作业状态变化事件表（只追加）';
+
+create table t_queue_wait_sketch (
+    hour int(11) not null comment '小时起点（时间戳），按作业开始时间归入',
+    partition_name varchar(255) not null comment '分区',
+    card_type varchar(64) not null default '' comment '加速卡类型，不用卡的作业为空字符串',
+    cnt int(11) not null comment '作业数',
+    sketch json not null comment '排队时长（秒）的分位数草图，格式见 common.sketch.QuantileSketch.to_dict',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    primary key (`hour`, `partition_name`, `card_type`)
+) COMMENT='排队时长分位数草图表（每分区每卡型每小时一行）';
+
 
 set @start = 1769247047;
 set @step = 3600;
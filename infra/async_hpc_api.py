@@ -0,0 +1,203 @@
+import asyncio
+import time
+from functools import wraps
+import aiohttp
+from common import logger, cfg
+from infra.hpc_api import HpcApi, api
+
+
+def async_check_login(func):
+    '''check_login 的协程版本：遇到 401 时按 token 代数刷新 token 后重试一次'''
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        generation = self.sync_api.token_generation
+        r = await func(self, *args, **kwargs)
+        if not r:
+            return r
+        if isinstance(r, dict) and r.get('code', '') == 401:
+            await self.renew_token(generation)
+            r = await func(self, *args, **kwargs)
+        return r
+    return wrapper
+
+
+class AsyncHpcApi:
+    '''
+    HpcApi 的 asyncio 版本，用于在一个事件循环内对所有节点并发请求。
+
+    连接池按上游主机大小配置（[hpc] pool_size），每个接口另有并发上限（[hpc] endpoint_concurrency），
+    避免单个接口把连接池占满。登录态与同步的 HpcApi 共享（同一个 Cookie），任一方重新登录后另一方立即可用。
+
+    aiohttp 的会话绑定事件循环，因此每次使用需要在 async with 内创建：
+        async with AsyncHpcApi() as aapi:
+            results = await aapi.fan_out(aapi.get_node_cpu_usage, nodes)
+    '''
+    StatusRunning = HpcApi.StatusRunning
+    StatusPending = HpcApi.StatusPending
+    StatusCompleted = HpcApi.StatusCompleted
+    StatusFailed = HpcApi.StatusFailed
+    StatusCancelled = HpcApi.StatusCancelled
+
+    def __init__(self, sync_api: HpcApi = api, pool_size=None, endpoint_concurrency=None, timeout=None) -> None:
+        self.sync_api = sync_api
+        self.pool_size = pool_size or cfg.getint('hpc', 'pool_size', fallback=32)
+        self.endpoint_concurrency = endpoint_concurrency or cfg.getint('hpc', 'endpoint_concurrency', fallback=16)
+        self.timeout = timeout or cfg.getint('hpc', 'request_timeout', fallback=30)
+        self.session = None
+        self._semaphores = {}
+        # 显卡信息 key -> 正在请求的 Task，同一事件循环内的相同请求只发一次
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size, ssl=False)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._semaphores = {}
+        self._in_flight = {}
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    def _semaphore(self, endpoint):
+        if endpoint not in self._semaphores:
+            self._semaphores[endpoint] = asyncio.Semaphore(self.endpoint_concurrency)
+        return self._semaphores[endpoint]
+
+    @property
+    def _headers(self):
+        # 每次请求时读取，保证拿到同步客户端最新的 token
+        cookie = self.sync_api.session.headers.get('Cookie')
+        return {'Cookie': cookie} if cookie else {}
+
+    async def _request(self, method, endpoint, url, **kwargs) -> dict:
+        async with self._semaphore(endpoint):
+            async with self.session.request(method, url, headers=self._headers, **kwargs) as response:
+                return await response.json(content_type=None)
+
+    async def fan_out(self, method, node_names, timeout=None) -> dict:
+        '''
+        对每个节点并发调用 method，返回 {节点名: 结果}。
+
+        单个节点异常记为 None；指定 timeout（秒）时，到期仍未返回的节点会被取消，不出现在结果中。
+        '''
+        tasks = {asyncio.ensure_future(method(node)): node for node in node_names}
+        if not tasks:
+            return {}
+        done, pending = await asyncio.wait(tasks.keys(), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"并发请求{method.__name__}超时，{len(pending)}/{len(tasks)}个节点未在{timeout}秒内返回")
+        ret = {}
+        for task in done:
+            node = tasks[task]
+            if task.exception() is not None:
+                logger.error(f"并发请求节点{node}失败: {task.exception()!r}")
+                ret[node] = None
+            else:
+                ret[node] = task.result()
+        return ret
+
+    async def login(self) -> bool:
+        # 登录很少发生，直接复用同步实现，放到线程里执行避免阻塞事件循环
+        return await asyncio.to_thread(self.sync_api.login)
+
+    async def renew_token(self, stale_generation) -> bool:
+        # 与同步客户端共用同一套 token 代数，保证同一代 token 全进程只登录一次
+        return await asyncio.to_thread(self.sync_api.renew_token, stale_generation)
+
+    @async_check_login
+    async def get_overview(self) -> dict:
+        url = f'{self.sync_api.base_url}/qos/compositeComputingResourceRelation?_t={int(time.time() * 1000)}'
+        data = await self._request('GET', 'overview', url)
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPCOverview失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_nodes_info(self) -> dict:
+        '''主要用于获得节点的ip地址，是否可用'''
+        url = f'{self.sync_api.base_url}/realtime-monitoring/deployment?_t={int(time.time() * 1000)}'
+        data = await self._request('GET', 'nodes_info', url)
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPC节点信息失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_user_total(self) -> dict:
+        url = f'{self.sync_api.base_url}/sys/user/activeStatistics?_t={int(time.time() * 1000)}'
+        data = await self._request('GET', 'user_total', url)
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPCUserTotal失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_node_cpu_usage(self, node_name=None) -> dict:
+        url = f'{self.sync_api.base_url}/realtime-monitoring/cpuUsage'
+        data = await self._request('POST', 'cpu_usage', url, json={"node": node_name})
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPC节点{node_name}CPU占用失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_node_memory_usage(self, node_name=None) -> dict:
+        url = f'{self.sync_api.base_url}/realtime-monitoring/memoryUsage'
+        data = await self._request('POST', 'memory_usage', url, json={"node": node_name})
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPC节点{node_name}内存占用失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    async def get_node_gpu_info(self, node_name=None) -> dict:
+        # 与同步客户端共用响应缓存和命中统计，key 与 HpcApi.get_node_gpu_info 一致；并发的相同请求在事件循环内合并
+        key = ('gpu_info', (node_name,), ())
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.sync_api.cache.count('gpu_info', 'coalesced')
+            return await asyncio.shield(task)
+        data = self.sync_api.cache.get_fresh('gpu_info', key)
+        if data is not None:
+            return data
+        task = self._in_flight[key] = asyncio.ensure_future(self._get_node_gpu_info(node_name))
+        try:
+            data = await task
+        finally:
+            self._in_flight.pop(key, None)
+        self.sync_api.cache.store('gpu_info', key, data)
+        return data
+
+    @async_check_login
+    async def _get_node_gpu_info(self, node_name=None) -> dict:
+        url = f'{self.sync_api.base_url}/monitoring/card/metrics?node={node_name}&_t={int(time.time() * 1000)}'
+        data = await self._request('GET', 'gpu_info', url)
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPC节点{node_name}显卡信息失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_gpu_usage(self, node_name=None) -> dict:
+        '''获得节点所有显卡的使用率'''
+        url = f'{self.sync_api.base_url}/monitoring/card/usageTrend?node={node_name}&_t={int(time.time() * 1000)}'
+        data = await self._request('GET', 'gpu_usage', url)
+        if data.get('code', '') != 200:
+            logger.error(f"获取HPC节点{node_name}显卡使用率失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']
+
+    @async_check_login
+    async def get_all_users(self, page_no=1, pagesize=1000, username=None) -> list[dict]:
+        url = f'{self.sync_api.base_url}/sys/user/listAll?column=createTime&order=desc&pageNo={page_no}&pageSize={pagesize}&_t={int(time.time() * 1000)}'
+        if username:
+            url += f'&username={username}'
+        data = await self._request('GET', 'all_users', url)
+        if data.get('code', '') != 0:
+            logger.error(f"获取HPC所有用户失败，状态码：{data.get('code', '')}，响应内容：{data}")
+            return data
+        return data['result']['records']
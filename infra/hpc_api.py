@@ -7,23 +7,125 @@ import time
 from common import logger, cfg
 import threading
 import os
+import json
+from datetime import datetime
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import wraps
 
 
 def check_login(func):
+    '''
+    遇到 401 时刷新 token 后重试一次
+
+    请求前记下 token 代数，401 时交给 renew_token 判断：如果其他调用方已经换过 token 就直接重试，
+    否则只有一个调用方去登录，其余的等待登录完成后用新 token 重试。请求本身不在任何锁内执行。
+    '''
+    @wraps(func)
     def wrapper(self, *args, **kwargs):
+        generation = self.token_generation
         r = func(self, *args, **kwargs)
         if not r:
             return r
         if isinstance(r, dict) and r.get('code', '') == 401:
-            with self.lock:
-                r = func(self, *args, **kwargs)
-                if isinstance(r, dict) and r.get('code', '') == 401:
-                    self.login()
-                    r = func(self, *args, **kwargs)
-                    # logger.warning(f'ticket {self.ticket} 失效')
+            self.renew_token(generation)
+            r = func(self, *args, **kwargs)
         return r
     return wrapper
 
+
+class ResponseCache:
+    '''
+    按接口配置 TTL 的响应缓存，并合并并发的相同请求（single-flight）
+
+    同一个 key 同时只有一个请求在路上，其他调用方等待这一个请求的结果；成功的响应在 TTL 内直接复用。
+    错误响应（带 code 的原始返回）不缓存。TTL 在 [hpc_cache] 中按接口配置，0 表示只合并不缓存。
+    过期条目每隔 SWEEP_INTERVAL 秒随写入清理一次，避免按节点、按用户名的 key 无限增长。
+    '''
+    SWEEP_INTERVAL = 60
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.in_flight = {}
+        self.counters = defaultdict(lambda: {'hit': 0, 'miss': 0, 'coalesced': 0})
+        self.next_sweep = time.time() + self.SWEEP_INTERVAL
+
+    @staticmethod
+    def ttl(endpoint):
+        return cfg.getfloat('hpc_cache', endpoint, fallback=0)
+
+    @staticmethod
+    def cacheable(value):
+        return bool(value) and not (isinstance(value, dict) and 'code' in value)
+
+    def get_fresh(self, endpoint, key):
+        '''只查缓存不合并，未命中时记一次 miss；供异步客户端使用，它不能在事件循环里阻塞等待 Future'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                self.counters[endpoint]['hit'] += 1
+                return entry[1]
+            self.counters[endpoint]['miss'] += 1
+        return None
+
+    def count(self, endpoint, kind):
+        with self.lock:
+            self.counters[endpoint][kind] += 1
+
+    def store(self, endpoint, key, value):
+        ttl = self.ttl(endpoint)
+        if ttl > 0 and self.cacheable(value):
+            with self.lock:
+                now = time.time()
+                self.entries[key] = (now + ttl, value)
+                if now >= self.next_sweep:
+                    self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+                    self.next_sweep = now + self.SWEEP_INTERVAL
+
+    def get_or_call(self, endpoint, key, func):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                self.counters[endpoint]['hit'] += 1
+                return entry[1]
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.counters[endpoint]['miss'] += 1
+            else:
+                self.counters[endpoint]['coalesced'] += 1
+        if not leader:
+            return future.result()
+        try:
+            value = func()
+            self.store(endpoint, key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {endpoint: dict(counter) for endpoint, counter in self.counters.items()}
+
+
+def cached(endpoint):
+    '''用 HpcApi.cache 缓存接口返回，需放在 check_login 外层，合并的调用方拿到的是登录重试后的结果'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = (endpoint, args, tuple(sorted(kwargs.items())))
+            return self.cache.get_or_call(endpoint, key, lambda: func(self, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
 class HpcApi:
     StatusRunning = 'isRunning'
     StatusPending = 'isPending'
@@ -35,12 +137,65 @@ class HpcApi:
         self.username = username
         self.passwd = passwd
         self.signature = signature
+        self.base_url = cfg.get('hpc', 'base_url', fallback='http://hpc.hutb.edu.cn/hpc-backend').rstrip('/')
+        self.token_file = cfg.get('hpc', 'token_file', fallback='assets/token.txt')
         self.session = requests.Session()
-        if os.path.exists('assets/token.txt'):
-            token = open('assets/token.txt', 'r').read().strip()
-            self.session.headers['Cookie'] = f'X-Access-Token={token}'
-        self.lock = threading.Lock()
+        # token 每更换一次代数加一，请求遇到 401 时据此判断 token 是否已经被别人换过
+        self.token_generation = 0
+        self.token_expire_at = None
+        self._token_cond = threading.Condition()
+        self._logging_in = False
+        if os.path.exists(self.token_file):
+            token = open(self.token_file, 'r').read().strip()
+            self._set_token(token)
+        self.cache = ResponseCache()
 
+    def _set_token(self, token):
+        self.session.headers['Cookie'] = f'X-Access-Token={token}'
+        self.token_expire_at = self._token_expire_at(token)
+
+    @staticmethod
+    def _token_expire_at(token):
+        '''从 JWT 的 payload 里读取过期时间，解析不了时按 [hpc] token_ttl 估算'''
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+        except Exception:
+            ttl = cfg.getint('hpc', 'token_ttl', fallback=0)
+            return time.time() + ttl if ttl else None
+
+    def renew_token(self, stale_generation) -> bool:
+        '''
+        用代数为 stale_generation 的 token 请求失败后调用，返回 token 是否已更新
+
+        同一代 token 只有一个调用方真正登录；登录进行中时其他调用方在条件变量上等待，
+        登录的网络请求不持有锁。
+        '''
+        with self._token_cond:
+            if self.token_generation != stale_generation:
+                return True
+            if self._logging_in:
+                self._token_cond.wait_for(lambda: not self._logging_in, timeout=cfg.getint('hpc', 'request_timeout', fallback=30))
+                return self.token_generation != stale_generation
+            self._logging_in = True
+        ok = False
+        try:
+            ok = self.login()
+        finally:
+            with self._token_cond:
+                self._logging_in = False
+                if ok:
+                    self.token_generation += 1
+                self._token_cond.notify_all()
+        return ok
+
+    def refresh_token_if_expiring(self):
+        '''后台定时调用：token 快过期时提前登录，避免用户请求撞上 401'''
+        margin = cfg.getint('hpc', 'token_refresh_margin', fallback=300)
+        if self.token_expire_at is not None and self.token_expire_at - time.time() < margin:
+            logger.info(f"token 将于 {datetime.fromtimestamp(self.token_expire_at)} 过期，提前刷新")
+            self.renew_token(self.token_generation)
 
     def login(self) -> bool:
         try:
@@ -51,47 +206,59 @@ class HpcApi:
                 "captcha": "",
                 "checkKey": int(time.time() * 1000)
             }
-            response = self.session.post("http://hpc.hutb.edu.cn/hpc-backend/sys/encryptLogin", json=body, verify=False)
+            response = self.session.post(f"{self.base_url}/sys/encryptLogin", json=body, verify=False)
             if response.status_code != 200:
                 logger.error(f"登录失败，状态码：{response.status_code}，响应内容：{response.text}")
-            with open('assets/token.txt', 'w+') as f:
+            with open(self.token_file, 'w+') as f:
                 token = response.json()['result']['token']
-                self.session.headers['Cookie'] = f'X-Access-Token={token}'
+                self._set_token(token)
                 f.write(token)
+            return True
         except Exception as e:
             logger.error(f"登录请求异常：{e}")
+            return False
             
+    @cached('overview')
     @check_login
     def get_overview(self) -> dict:
-        url = f'http://hpc.hutb.edu.cn/hpc-backend/qos/compositeComputingResourceRelation?_t={int(time.time() * 1000)}'
+        url = f'{self.base_url}/qos/compositeComputingResourceRelation?_t={int(time.time() * 1000)}'
         data = self.session.get(url).json()
         if data.get('code', '') != 200:
             logger.error(f"获取HPCOverview失败，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
         return data['result']
 
+    @cached('nodes_info')
     @check_login
     def get_nodes_info(self) -> dict:
         '''主要用于获得节点的ip地址，是否可用'''
-        url = 'http://hpc.hutb.edu.cn/hpc-backend/realtime-monitoring/deployment?_t=1767923755865'
+        url = f'{self.base_url}/realtime-monitoring/deployment?_t=1767923755865'
         data = self.session.get(url).json()
         if data.get('code', '') != 200:
             logger.error(f"获取HPC节点信息失败，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
         return data['result']
 
+    @cached('user_total')
     @check_login
     def get_user_total(self) -> dict:
-        url = f'http://hpc.hutb.edu.cn/hpc-backend/sys/user/activeStatistics?_t={int(time.time() * 1000)}'
+        url = f'{self.base_url}/sys/user/activeStatistics?_t={int(time.time() * 1000)}'
         data = self.session.get(url).json()
         if data.get('code', '') != 200:
             logger.error(f"获取HPCUserTotal失败，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
         return data['result']
 
-    @check_login
     def get_tasks(self, status=None, partition=None, createBy=None, task_name=None, startTime=None, endTime=None, page_no=1, pagesize=1000) -> dict:
-        url = 'http://hpc.hutb.edu.cn/hpc-backend/task/pageList'
+        data = self.get_tasks_page(status, partition, createBy, task_name, startTime, endTime, page_no, pagesize)
+        if isinstance(data, dict) and 'records' in data:
+            return data['records']
+        return data
+
+    @check_login
+    def get_tasks_page(self, status=None, partition=None, createBy=None, task_name=None, startTime=None, endTime=None, page_no=1, pagesize=1000) -> dict:
+        '''获取一页作业，返回包含 records/total/pages 的分页结果'''
+        url = f'{self.base_url}/task/pageList'
         
         params = {
             'column': 'startTime',
@@ -120,11 +287,11 @@ class HpcApi:
         if data.get('code', '') != 200:
             logger.error(f"获取HPC任务失败，参数：{params}，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
-        return data['result']['records']
+        return data['result']
 
     @check_login
     def get_user_list(self, username=None, realname=None, page_no=1, pagesize=10) -> dict:
-        url = 'http://hpc.hutb.edu.cn/hpc-backend/sys/user/listAll'
+        url = f'{self.base_url}/sys/user/listAll'
         params = {
             'column': 'createTime',
             'order': 'desc',
@@ -143,7 +310,7 @@ class HpcApi:
 
     @check_login
     def get_node_cpu_usage(self, node_name=None) -> dict:
-        url = 'http://hpc.hutb.edu.cn/hpc-backend/realtime-monitoring/cpuUsage'
+        url = f'{self.base_url}/realtime-monitoring/cpuUsage'
         body = {
         "node": node_name
         }
@@ -156,7 +323,7 @@ class HpcApi:
 
     @check_login
     def get_node_memory_usage(self, node_name=None) -> dict:
-        url = 'http://hpc.hutb.edu.cn/hpc-backend/realtime-monitoring/memoryUsage'
+        url = f'{self.base_url}/realtime-monitoring/memoryUsage'
         body = {
             "node": node_name
         }
@@ -167,9 +334,10 @@ class HpcApi:
             return data
         return data['result']
 
+    @cached('gpu_info')
     @check_login
     def get_node_gpu_info(self, node_name=None) -> dict:
-        url = f'http://hpc.hutb.edu.cn/hpc-backend/monitoring/card/metrics?node={node_name}&_t={int(time.time() * 1000)}'
+        url = f'{self.base_url}/monitoring/card/metrics?node={node_name}&_t={int(time.time() * 1000)}'
         data = self.session.get(url).json()
         if data.get('code', '') != 200:
             logger.error(f"获取HPC节点{node_name}显卡信息失败，状态码：{data.get('code', '')}，响应内容：{data}")
@@ -179,23 +347,92 @@ class HpcApi:
     @check_login
     def get_gpu_usage(self, node_name=None) -> dict:
         '''获得节点所有显卡的使用率'''
-        url = f'http://hpc.hutb.edu.cn/hpc-backend/monitoring/card/usageTrend?node={node_name}&_t={int(time.time() * 1000)}'
+        url = f'{self.base_url}/monitoring/card/usageTrend?node={node_name}&_t={int(time.time() * 1000)}'
         data = self.session.get(url).json()
         if data.get('code', '') != 200:
             logger.error(f"获取HPC节点{node_name}显卡使用率失败，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
         return data['result']
 
-    @check_login
     def get_all_users(self, page_no=1, pagesize=1000, username=None) -> list[dict]:
-        url = f'http://hpc.hutb.edu.cn/hpc-backend/sys/user/listAll?column=createTime&order=desc&pageNo={page_no}&pageSize={pagesize}&_t={int(time.time() * 1000)}'
+        data = self.get_users_page(page_no, pagesize, username)
+        if isinstance(data, dict) and 'records' in data:
+            return data['records']
+        return data
+
+    @cached('all_users')
+    def get_users_page(self, page_no=1, pagesize=1000, username=None) -> dict:
+        '''获取一页用户（按 [hpc_cache] all_users 缓存），返回包含 records/total/pages 的分页结果'''
+        return self._get_users_page(page_no, pagesize, username)
+
+    @check_login
+    def _get_users_page(self, page_no=1, pagesize=1000, username=None) -> dict:
+        url = f'{self.base_url}/sys/user/listAll?column=createTime&order=desc&pageNo={page_no}&pageSize={pagesize}&_t={int(time.time() * 1000)}'
         if username:
             url += f'&username={username}'
         data = self.session.get(url).json()
         if data.get('code', '') != 0:
             logger.error(f"获取HPC所有用户失败，状态码：{data.get('code', '')}，响应内容：{data}")
             return data
-        return data['result']['records']
+        return data['result']
+
+    def iter_pages(self, fetch_page, pagesize=None, limit=None):
+        '''
+        流式遍历分页接口，逐页 yield 当前页的 records 列表
+
+        fetch_page(page_no, pagesize) 返回分页结果（含 records、pages）。解析第 N 页时，
+        后面最多 [hpc] pages_in_flight 页已经在后台并发请求，内存里同时只保留这几页原始数据。
+        limit 为最多返回的记录数（接口按时间倒序时可用来只取最新的 N 条）。
+        单页失败会重试，仍失败则抛出 RuntimeError，调用方不会拿到被截断的结果。
+        '''
+        pagesize = pagesize or cfg.getint('hpc', 'page_size', fallback=200)
+        in_flight = max(1, cfg.getint('hpc', 'pages_in_flight', fallback=2))
+
+        def fetch(page_no):
+            for i in range(3):
+                data = fetch_page(page_no, pagesize)
+                if isinstance(data, dict) and 'records' in data:
+                    return data
+            raise RuntimeError(f"获取第{page_no}页失败：{data}")
+
+        first = fetch(1)
+        pages = first.get('pages') or 1
+        if limit:
+            pages = min(pages, (limit + pagesize - 1) // pagesize)
+        remaining = limit
+        with ThreadPoolExecutor(max_workers=in_flight) as executor:
+            futures = deque()
+            next_page = 2
+            while next_page <= pages and len(futures) < in_flight:
+                futures.append(executor.submit(fetch, next_page))
+                next_page += 1
+            page = first
+            while True:
+                records = page['records']
+                if remaining is not None:
+                    records = records[:remaining]
+                    remaining -= len(records)
+                yield records
+                if not futures or not page['records'] or remaining == 0:
+                    for future in futures:
+                        future.cancel()
+                    return
+                page = futures.popleft().result()
+                if next_page <= pages:
+                    futures.append(executor.submit(fetch, next_page))
+                    next_page += 1
+
+    def iter_tasks(self, status=None, pagesize=None, limit=None, **kwargs):
+        '''流式遍历作业，参数同 get_tasks'''
+        return self.iter_pages(lambda page_no, size: self.get_tasks_page(status, page_no=page_no, pagesize=size, **kwargs), pagesize, limit)
+
+    def iter_all_users(self, username=None, pagesize=None, limit=None):
+        '''流式遍历用户；不走页缓存，否则一次遍历可能混用缓存的旧页和新页，重复或漏掉用户'''
+        return self.iter_pages(lambda page_no, size: self._get_users_page(page_no, size, username), pagesize, limit)
+
+    def cache_stats(self) -> dict:
+        '''各接口缓存的命中、未命中、合并次数'''
+        return self.cache.stats()
 
     # 简化版本，直接使用UTF-8编码的字节作为密钥和IV
     def _encrypt_username_simple(self, username):
@@ -1,5 +1,6 @@
 # coding: utf-8
-from sqlalchemy import Column, Enum, Float, ForeignKey, Integer, JSON, String, TIMESTAMP, Text, text, BIGINT
+from sqlalchemy import Column, DateTime, Enum, Float, ForeignKey, Integer, JSON, String, TIMESTAMP, Text, text, BIGINT, PrimaryKeyConstraint, UniqueConstraint, Index
+from sqlalchemy.dialects.mysql import DOUBLE, SMALLINT, TINYINT
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from models.base import Base
@@ -26,9 +27,10 @@ class TNodeGpuHistoryInfo(Base):
     __tablename__ = 't_node_gpu_history_info'
     __table_args__ = {'comment': '节点GPU历史信息表'}
     serialize_only = ('id', 'node', 'timestamp', 'gpu_usage', 'created_at', 'updated_at')
-    id = Column(Integer, primary_key=True)
+    # 按 timestamp 分区要求主键包含分区列
+    id = Column(Integer, primary_key=True, autoincrement=True)
     node = Column(String(255), nullable=False, server_default=text("''"), comment='节点名称')
-    timestamp = Column(Integer, nullable=False, server_default=text("'0'"), comment='时间戳')
+    timestamp = Column(Integer, primary_key=True, nullable=False, server_default=text("'0'"), comment='时间戳')
     gpu_usage = Column(Float, nullable=False, server_default=text("'0'"), comment='GPU使用率')
     created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
     updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
@@ -38,9 +40,10 @@ class TNodeMemHistoryInfo(Base):
     __tablename__ = 't_node_mem_history_info'
     __table_args__ = {'comment': '节点内存历史信息表'}
     serialize_only = ('id', 'node', 'timestamp', 'mem_usage', 'created_at', 'updated_at')
-    id = Column(Integer, primary_key=True)
+    # 按 timestamp 分区要求主键包含分区列
+    id = Column(Integer, primary_key=True, autoincrement=True)
     node = Column(String(255), nullable=False, server_default=text("''"), comment='节点名称')
-    timestamp = Column(Integer, nullable=False, server_default=text("'0'"), comment='时间戳')
+    timestamp = Column(Integer, primary_key=True, nullable=False, server_default=text("'0'"), comment='时间戳')
     mem_usage = Column(Float, nullable=False, server_default=text("'0'"), comment='内存使用率')
     created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
     updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
@@ -50,17 +53,81 @@ class TNodeCpuHistoryInfo(Base):
     __tablename__ = 't_node_cpu_history_info'
     __table_args__ = {'comment': '节点CPU历史信息表'}
     serialize_only = ('id', 'node', 'timestamp', 'cpu_usage', 'created_at', 'updated_at')
-    id = Column(Integer, primary_key=True)
+    # 按 timestamp 分区要求主键包含分区列
+    id = Column(Integer, primary_key=True, autoincrement=True)
     node = Column(String(255), nullable=False, server_default=text("''"), comment='节点名称')
-    timestamp = Column(Integer, nullable=False, server_default=text("'0'"), comment='时间戳')
+    timestamp = Column(Integer, primary_key=True, nullable=False, server_default=text("'0'"), comment='时间戳')
     cpu_usage = Column(Float, nullable=False, server_default=text("'0'"), comment='CPU使用率')
     created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
     updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
 
 
+class TNodeDict(Base):
+    __tablename__ = 't_node_dict'
+    __table_args__ = (UniqueConstraint('node'), {'comment': '节点字典表'})
+    serialize_only = ('id', 'node', 'created_at')
+    id = Column(SMALLINT(unsigned=True), primary_key=True, autoincrement=True)
+    node = Column(String(255), nullable=False, comment='节点名称')
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
+
+
+class TNodeHistory(Base):
+    __tablename__ = 't_node_history'
+    __table_args__ = (PrimaryKeyConstraint('node_id', 'ts'), {'comment': '节点历史宽表（[history] storage=wide）'})
+    serialize_only = ('node_id', 'ts', 'cpu', 'mem', 'gpu')
+    node_id = Column(SMALLINT(unsigned=True), nullable=False, comment='节点ID，对应 t_node_dict.id')
+    ts = Column(Integer, nullable=False, comment='时间戳')
+    cpu = Column(Float, comment='CPU使用率')
+    mem = Column(Float, comment='内存使用率')
+    gpu = Column(Float, comment='GPU使用率')
+
+
+class TNodeHistoryRollup5m(Base):
+    __tablename__ = 't_node_history_rollup_5m'
+    __table_args__ = (PrimaryKeyConstraint('node', 'metric', 'bucket'), {'comment': '节点历史5分钟汇总表'})
+    serialize_only = ('node', 'metric', 'bucket', 'min_val', 'max_val', 'sum_val', 'cnt')
+    node = Column(String(255), nullable=False, comment='节点名称')
+    metric = Column(String(16), nullable=False, comment='指标：CPU/Memory/GPU')
+    bucket = Column(Integer, nullable=False, comment='时间桶起点（时间戳）')
+    min_val = Column(Float, nullable=False, comment='最小值')
+    max_val = Column(Float, nullable=False, comment='最大值')
+    sum_val = Column(DOUBLE, nullable=False, comment='求和，平均值为 sum_val / cnt')
+    cnt = Column(Integer, nullable=False, comment='样本数')
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
+
+
+class TNodeHistoryRollup1h(Base):
+    __tablename__ = 't_node_history_rollup_1h'
+    __table_args__ = (PrimaryKeyConstraint('node', 'metric', 'bucket'), {'comment': '节点历史1小时汇总表'})
+    serialize_only = ('node', 'metric', 'bucket', 'min_val', 'max_val', 'sum_val', 'cnt')
+    node = Column(String(255), nullable=False, comment='节点名称')
+    metric = Column(String(16), nullable=False, comment='指标：CPU/Memory/GPU')
+    bucket = Column(Integer, nullable=False, comment='时间桶起点（时间戳）')
+    min_val = Column(Float, nullable=False, comment='最小值')
+    max_val = Column(Float, nullable=False, comment='最大值')
+    sum_val = Column(DOUBLE, nullable=False, comment='求和，平均值为 sum_val / cnt')
+    cnt = Column(Integer, nullable=False, comment='样本数')
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
+
+
+class TNodeHistoryRollup1d(Base):
+    __tablename__ = 't_node_history_rollup_1d'
+    __table_args__ = (PrimaryKeyConstraint('node', 'metric', 'bucket'), {'comment': '节点历史1天汇总表'})
+    serialize_only = ('node', 'metric', 'bucket', 'min_val', 'max_val', 'sum_val', 'cnt')
+    node = Column(String(255), nullable=False, comment='节点名称')
+    metric = Column(String(16), nullable=False, comment='指标：CPU/Memory/GPU')
+    bucket = Column(Integer, nullable=False, comment='时间桶起点（时间戳）')
+    min_val = Column(Float, nullable=False, comment='最小值')
+    max_val = Column(Float, nullable=False, comment='最大值')
+    sum_val = Column(DOUBLE, nullable=False, comment='求和，平均值为 sum_val / cnt')
+    cnt = Column(Integer, nullable=False, comment='样本数')
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
+
+
 class THpcUserInfo(Base):
     __tablename__ = 't_hpc_user_info'
-    __table_args__ = {'comment': 'HPC用户信息表'}
+    __table_args__ = (Index('idx_status_register_time', 'status', 'register_time'), Index('idx_register_time', 'register_time'),
+                      {'comment': 'HPC用户信息表'})
     serialize_only = ('id', 'hpc_id', 'username', 'realname', 'email', 'phone', 'role_name', 'status', 'register_time', 'created_at', 'updated_at')
     id = Column(Integer, primary_key=True)
     hpc_id = Column(String(255), nullable=False, server_default=text("''"), comment='HPC ID')
@@ -72,4 +139,61 @@ class THpcUserInfo(Base):
     status = Column(String(255), nullable=False, server_default=text("'0'"), comment='状态')
     register_time = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='注册时间')
     created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
-    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
\ No newline at end of file
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
+
+
+class TJobArchive(Base):
+    __tablename__ = 't_job_archive'
+    __table_args__ = (Index('idx_create_by_submit', 'create_by', 'submit_time'),
+                      Index('idx_partition_submit', 'partition_name', 'submit_time'),
+                      Index('idx_nodes_submit', 'nodes', 'submit_time'),
+                      Index('idx_status_submit', 'status', 'submit_time'),
+                      Index('idx_submit_time', 'submit_time'),
+                      Index('idx_start_time', 'start_time'),
+                      {'comment': '已结束作业归档表'})
+    serialize_only = ('job_id', 'name', 'status', 'partition_name', 'nodes', 'create_by', 'submit_time', 'start_time', 'end_time',
+                      'duration', 'cpu', 'mem', 'card', 'card_type')
+    job_id = Column(String(64), primary_key=True, comment='作业ID（slurmJobId）')
+    name = Column(String(255), nullable=False, server_default=text("''"), comment='作业名')
+    status = Column(String(16), nullable=False, comment='状态：已完成/失败')
+    partition_name = Column(String(255), nullable=False, server_default=text("''"), comment='分区')
+    nodes = Column(String(512), nullable=False, server_default=text("''"), comment='节点')
+    create_by = Column(String(255), nullable=False, server_default=text("''"), comment='申请人')
+    submit_time = Column(DateTime, comment='提交时间')
+    start_time = Column(DateTime, comment='开始时间')
+    end_time = Column(DateTime, comment='结束时间')
+    duration = Column(String(64), comment='运行时长')
+    cpu = Column(Integer, comment='CPU核数')
+    mem = Column(String(32), comment='内存')
+    card = Column(Integer, comment='加速卡数')
+    card_type = Column(String(64), comment='加速卡类型')
+    created_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP"), comment='创建时间')
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
+
+
+class TJobEvent(Base):
+    __tablename__ = 't_job_event'
+    __table_args__ = (PrimaryKeyConstraint('job_id', 'event'),
+                      Index('idx_event_ts', 'event', 'ts'),
+                      Index('idx_partition_event_ts', 'partition_name', 'event', 'ts'),
+                      {'comment': '作业状态变化事件表（只追加）'})
+    serialize_only = ('job_id', 'event', 'ts', 'partition_name', 'create_by', 'card_type', 'wait_seconds')
+    job_id = Column(String(64), nullable=False, comment='作业ID（slurmJobId）')
+    event = Column(TINYINT(unsigned=True), nullable=False, comment='事件：1 submitted，2 started，3 finished，4 failed')
+    ts = Column(Integer, nullable=False, comment='事件时间戳（取上游的提交/开始/结束时间）')
+    partition_name = Column(String(255), nullable=False, server_default=text("''"), comment='分区')
+    create_by = Column(String(255), nullable=False, server_default=text("''"), comment='申请人')
+    card_type = Column(String(64), comment='加速卡类型')
+    wait_seconds = Column(Integer, comment='排队时长（秒），只有 started 事件有值')
+
+
+class TQueueWaitSketch(Base):
+    __tablename__ = 't_queue_wait_sketch'
+    __table_args__ = (PrimaryKeyConstraint('hour', 'partition_name', 'card_type'), {'comment': '排队时长分位数草图表（每分区每卡型每小时一行）'})
+    serialize_only = ('hour', 'partition_name', 'card_type', 'cnt', 'sketch')
+    hour = Column(Integer, nullable=False, comment='小时起点（时间戳），按作业开始时间归入')
+    partition_name = Column(String(255), nullable=False, comment='分区')
+    card_type = Column(String(64), nullable=False, server_default=text("''"), comment='加速卡类型，不用卡的作业为空字符串')
+    cnt = Column(Integer, nullable=False, comment='作业数')
+    sketch = Column(JSON, nullable=False, comment='排队时长（秒）的分位数草图，格式见 common.sketch.QuantileSketch.to_dict')
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"), comment='更新时间')
@@ -4,7 +4,7 @@ import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 from datetime import datetime, timedelta
 import random
-from service.hpc_manager import hpc_manager
+from service.hpc_manager import hpc_manager, format_duration
 
 dash.register_page(__name__, path='/daily', name='日报')
 
@@ -158,6 +158,28 @@ layout = html.Div([
             )
         ], className="bg-gray-900 rounded-xl p-6 border border-gray-800"),
 
+        # Queue Wait Section
+        html.Section([
+            html.Div([
+                html.H2("排队等待时间（当日开始运行的作业）", className="font-medium text-white"),
+            ], className="flex items-center justify-between mb-4"),
+
+            dag.AgGrid(
+                id="daily-queue-wait-grid",
+                columnDefs=[
+                    {"headerName": "分区", "field": "partition", "sortable": True, 'flex': 1.5},
+                    {"headerName": "卡型", "field": "card_type", "sortable": True, 'flex': 1.5},
+                    {"headerName": "作业数", "field": "count", "sortable": True, 'flex': 1},
+                    {"headerName": "p50", "field": "p50", 'flex': 1.2},
+                    {"headerName": "p90", "field": "p90", 'flex': 1.2},
+                    {"headerName": "p99", "field": "p99", 'flex': 1.2},
+                ],
+                defaultColDef={"resizable": True, "cellStyle": {"textAlign": "center"}},
+                style={"height": "300px"},
+                className="ag-theme-alpine-dark",
+            )
+        ], className="bg-gray-900 rounded-xl p-6 border border-gray-800"),
+
         # User Stats Section
         html.Section([
             html.Div([
@@ -245,7 +267,8 @@ def update_daily_location(pathname):
      Output("daily-total-users", "children"),
      Output("daily-online-users", "children"),
      Output("daily-abnormal-nodes-grid", "rowData"),
-     Output("daily-queued-jobs-grid", "rowData")],
+     Output("daily-queued-jobs-grid", "rowData"),
+     Output("daily-queue-wait-grid", "rowData")],
     [Input("daily-date-picker", "value")]
 )
 def update_daily_report(selected_date):
@@ -265,10 +288,19 @@ def update_daily_report(selected_date):
     # 4. Queued Jobs
     queued_jobs = statistic_data.get('queuing_jobs', []) # generate_queued_jobs(selected_date)
     
+    # 5. Queue Wait：当天各小时草图合并出的分位数
+    queue_wait = []
+    if selected_date:
+        start = int(datetime.strptime(selected_date, '%Y-%m-%d').timestamp())
+        queue_wait = [{**row, 'card_type': row['card_type'] or '-', 'p50': format_duration(row['p50']),
+                       'p90': format_duration(row['p90']), 'p99': format_duration(row['p99'])}
+                      for row in hpc_manager.get_queue_wait_percentiles(start, start + 86400)]
+
     return (
         resource_data,
         f"{user_data['total_users']}",
         f"{user_data['online_users']}",
         abnormal_nodes,
         queued_jobs,
+        queue_wait,
     )
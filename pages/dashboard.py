@@ -2,9 +2,11 @@ import dash
 from dash import html, dcc, Input, Output, State, callback, ALL
 import dash_bootstrap_components as dbc
 import pandas as pd
+import plotly.graph_objects as go
 import random
 from datetime import datetime
-from service.hpc_manager import hpc_manager
+import time
+from service.hpc_manager import hpc_manager, format_duration
 from common.utils import search_params
 
 dash.register_page(__name__, path='/', name='总览')
@@ -26,6 +28,12 @@ def generate_partitions():
         p['updatedAt'] = datetime.now().strftime("%H:%M:%S")
     return partitions
 
+TREND_METRICS = {'CPU': 'CPU', 'Memory': '内存', 'GPU': 'GPU'}
+TREND_PERIODS = {1: '最近1天', 7: '最近1周', 30: '最近1月', 90: '最近3月'}
+TREND_MAX_POINTS = 500
+WAIT_QUANTILES = {'p50': ('p50', '#22c55e'), 'p90': ('p90', '#f59e0b'), 'p99': ('p99', '#ef4444')}
+
+
 def calculate_util_rate(p):
     cpu_util = 1 - (p['freeCpu'] / p['totalCpu'])
     mem_util = 1 - (p['freeMem'] / p['totalMem'])
@@ -115,6 +123,50 @@ layout = html.Div([
         html.Div(id='partitions-grid', className="grid grid-cols-1 lg:grid-cols-2 xl:grid-cols-3 gap-4")
     ], className="bg-gray-900 rounded-xl p-6 border border-gray-800"),
 
+    # Partition Trend Section
+    html.Section([
+        html.Div([
+            html.H2("分区利用率趋势", className="font-medium mr-auto"),
+            dcc.Dropdown(
+                id='trend-partition',
+                options=[{'label': p, 'value': p} for p in hpc_manager.partitions],
+                value=next(iter(hpc_manager.partitions), None),
+                clearable=False,
+                className="w-48"
+            ),
+            dcc.Dropdown(
+                id='trend-metric',
+                options=[{'label': label, 'value': value} for value, label in TREND_METRICS.items()],
+                value='CPU',
+                clearable=False,
+                className="w-32"
+            ),
+            dcc.Dropdown(
+                id='trend-period',
+                options=[{'label': label, 'value': days} for days, label in TREND_PERIODS.items()],
+                value=7,
+                clearable=False,
+                className="w-32"
+            ),
+        ], className="flex flex-wrap gap-3 items-center mb-4"),
+        dcc.Graph(id='partition-trend-chart', config={'displayModeBar': False}, className="h-72")
+    ], className="bg-gray-900 rounded-xl p-6 border border-gray-800 mt-6"),
+
+    # Queue Wait Section
+    html.Section([
+        html.Div([
+            html.H2("排队等待时间", className="font-medium mr-auto"),
+            dcc.Dropdown(
+                id='wait-period',
+                options=[{'label': label, 'value': days} for days, label in TREND_PERIODS.items()],
+                value=7,
+                clearable=False,
+                className="w-32"
+            ),
+        ], className="flex flex-wrap gap-3 items-center mb-4"),
+        dcc.Graph(id='queue-wait-chart', config={'displayModeBar': False}, className="h-72")
+    ], className="bg-gray-900 rounded-xl p-6 border border-gray-800 mt-6"),
+
     dcc.Interval(id='interval-component', interval=10000, n_intervals=0)
 ])
 
@@ -144,10 +196,11 @@ def update_interval(value):
      Input('url', 'search')]
 )
 def update_partitions(n, partition_filter, sort_val, search):
-    partions = list(hpc_manager.partitions.values())
+    snapshot = hpc_manager.snapshot
+    partions = list(snapshot.partitions.values())
 
     params = search_params(search)
-    if params.get('partition', '') in hpc_manager.partitions:
+    if params.get('partition', '') in snapshot.partitions:
         partition_filter = params['partition']
 
     if partition_filter != 'all':
@@ -217,4 +270,65 @@ def update_partitions(n, partition_filter, sort_val, search):
         ], className="rounded-xl border border-gray-800 bg-gray-900 hover:border-gray-700 transition p-4")
         cards.append(card)
         
-    return cards, hpc_manager.user_active, hpc_manager.total_user, partition_filter
+    return cards, snapshot.user_active, snapshot.total_user, partition_filter
+
+
+@callback(
+    Output('partition-trend-chart', 'figure'),
+    [Input('trend-partition', 'value'),
+     Input('trend-metric', 'value'),
+     Input('trend-period', 'value')]
+)
+def update_partition_trend(partition, metric, days):
+    # 分区内所有节点按时间桶聚合，数据库一次算出均值和 p95
+    history = hpc_manager.get_partition_history(partition, metric, days, max_points=TREND_MAX_POINTS)
+    x = [datetime.fromtimestamp(row['timestamp']) for row in history]
+    customdata = [[row['sum'], row['nodes']] for row in history]
+    fig = go.Figure([
+        go.Scatter(x=x, y=[row['mean'] for row in history], name='平均', mode='lines', line=dict(color='#a855f7', width=2),
+                   customdata=customdata, hovertemplate='平均 %{y:.1f}%<br>合计 %{customdata[0]:.0f}%（%{customdata[1]}个节点）<extra></extra>'),
+        go.Scatter(x=x, y=[row['p95'] for row in history], name='p95', mode='lines', line=dict(color='#f59e0b', width=2, dash='dot'),
+                   hovertemplate='p95 %{y:.1f}%<extra></extra>'),
+    ])
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=20, b=20),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(showgrid=False, tickfont=dict(color='#9ca3af', size=10), nticks=6),
+        yaxis=dict(showgrid=True, gridcolor='#374151', tickfont=dict(color='#9ca3af'), range=[0, 100]),
+        legend=dict(orientation='h', font=dict(color='#9ca3af'), x=0, y=1.1),
+        height=280,
+        hovermode='x unified',
+        hoverlabel=dict(bgcolor='#0f172a', bordercolor='#334155', font=dict(color='#ffffff'))
+    )
+    return fig
+
+
+@callback(
+    Output('queue-wait-chart', 'figure'),
+    Input('wait-period', 'value')
+)
+def update_queue_wait(days):
+    # 按分区、卡型合并窗口内的小时草图，不扫描作业
+    end = time.time()
+    rows = hpc_manager.get_queue_wait_percentiles(int(end - days * 86400), int(end))
+    x = [f"{row['partition']} / {row['card_type']}" if row['card_type'] else row['partition'] for row in rows]
+    fig = go.Figure([
+        go.Bar(x=x, y=[row[key] / 60 for row in rows], name=name, marker_color=color,
+               customdata=[[format_duration(row[key]), row['count']] for row in rows],
+               hovertemplate=f'{name} %{{customdata[0]}}（%{{customdata[1]}}个作业）<extra></extra>')
+        for key, (name, color) in WAIT_QUANTILES.items()
+    ])
+    fig.update_layout(
+        barmode='group',
+        margin=dict(l=0, r=0, t=20, b=20),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(showgrid=False, tickfont=dict(color='#9ca3af', size=10)),
+        # 线性坐标：立即开始的作业排队时长为 0，对数坐标画不出 0 值的柱子
+        yaxis=dict(showgrid=True, gridcolor='#374151', tickfont=dict(color='#9ca3af'), rangemode='tozero', title=dict(text='分钟', font=dict(color='#9ca3af'))),
+        legend=dict(orientation='h', font=dict(color='#9ca3af'), x=0, y=1.1),
+        height=280,
+        hoverlabel=dict(bgcolor='#0f172a', bordercolor='#334155', font=dict(color='#ffffff'))
+    )
+    return fig
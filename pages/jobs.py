@@ -1,11 +1,14 @@
 import dash
 from common import utils
-from dash import html, dcc, Input, Output, State, callback
+from dash import html, dcc, Input, Output, State, callback, clientside_callback
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 import pandas as pd
 import random
-from service.hpc_manager import hpc_manager, Task, map2resourcedesc
+from datetime import datetime, timedelta
+from service.hpc_manager import hpc_manager, map2resourcedesc
+from service.task_store import TASK_FIELDS
+from service.job_archive import job_archive, FINAL_STATUSES
 
 dash.register_page(__name__, path='/jobs', name='作业管理')
 
@@ -67,22 +70,40 @@ dash.register_page(__name__, path='/jobs', name='作业管理')
 #     return pd.DataFrame(data)
 
 
+# 表格字段 -> 作业列存中的列，服务端按这些列排序和筛选；不在其中的字段（资源描述）不能排序和筛选
+GRID_FIELDS = {
+    'slurmJobId': 'slurmJobId',
+    'status_html': 'status',
+    'submitTime': 'submitTime',
+    'endTime': 'endTime',
+    'duration': 'duration',
+    'createBy_html': 'createBy',
+    'node_html': 'nodes',
+    'partition_html': 'partition',
+}
+
+# 每次请求的行数（分页大小的整数倍），浏览器最多缓存 maxBlocksInCache 块
+GRID_BLOCK_SIZE = 100
+GRID_FILTER_PARAMS = {"filterOptions": ["contains", "notContains", "equals", "notEqual", "startsWith", "endsWith"], "maxNumConditions": 1}
+
 columnDefs = [
     {"headerName": "作业ID", "field": "slurmJobId", "sortable": True, "filter": True, "flex": 7, "cellClass": "font-mono text-gray-300"},
     {"headerName": "状态", "field": "status_html", "cellRenderer": "markdown", "sortable": True, "flex": 6},
-    {"headerName": "CPU/内存/GPU", "field": "resources", "sortable": False, "flex": 16},
+    {"headerName": "CPU/内存/GPU", "field": "resources", "sortable": False, "filter": False, "flex": 16},
     {"headerName": "开始时间", "field": "submitTime", "sortable": True, "cellClass": "text-gray-400", "flex": 12},
     {"headerName": "结束时间", "field": "endTime", "sortable": True, "cellClass": "text-gray-500", "flex": 12,},
     {"headerName": "运行时长", "field": "duration", "sortable": True, "flex": 11},
     {"headerName": "申请人", "field": "createBy_html", "cellRenderer": "markdown", "sortable": True, "flex": 10},
-    {"headerName": "节点", "field": "node_html", "cellRenderer": "markdown", "flex": 7, "cellClass": "text-gray-400"},
-    {"headerName": "分区", "field": "partition_html", "cellRenderer": "markdown", "flex": 7},
+    {"headerName": "节点", "field": "node_html", "cellRenderer": "markdown", "sortable": True, "flex": 7, "cellClass": "text-gray-400"},
+    {"headerName": "分区", "field": "partition_html", "cellRenderer": "markdown", "sortable": True, "flex": 7},
     # {"headerName": "查看节点", "field": "view_node_html", "cellRenderer": "markdown", "minWidth": 110}
     # {"headerName": "查看分区", "field": "view_part_html", "cellRenderer": "markdown", "minWidth": 110},
 ]
 
 layout = html.Div([
     dcc.Location(id='jobs-url', refresh=False),
+    # 当前的 状态/分区/节点/用户 筛选条件，变化时清空表格缓存、重新分页请求
+    dcc.Store(id='jobs-query-store'),
     
     html.Div([
         html.Div(id='jobs-badges', className="flex items-center gap-2 mb-4"),
@@ -107,7 +128,12 @@ layout = html.Div([
             ], className="flex flex-col"),
             html.Div([
                 html.Label("用户", className="text-xs text-gray-400"),
-                dcc.Input(id='job-user-filter', placeholder="按申请人", className="mt-1 bg-gray-800 border border-gray-700 rounded px-3 py-2 text-white w-48")
+                dcc.Input(id='job-user-filter', placeholder="包含匹配，不区分大小写", className="mt-1 bg-gray-800 border border-gray-700 rounded px-3 py-2 text-white w-48")
+            ], className="flex flex-col"),
+            html.Div([
+                html.Label("提交时间", className="text-xs text-gray-400"),
+                dcc.DatePickerRange(id='job-date-filter', display_format='YYYY-MM-DD', clearable=True,
+                                    start_date_placeholder_text="开始日期", end_date_placeholder_text="结束日期", className="mt-1")
             ], className="flex flex-col"),
             # html.Div([
             #     html.Label("资源需求", className="text-xs text-gray-400"),
@@ -121,14 +147,17 @@ layout = html.Div([
         dag.AgGrid(
             id="jobs-grid",
             columnDefs=columnDefs,
-            # rowData=df_jobs.to_dict("records"),
-            defaultColDef={"resizable": True, "sortable": True, "filter": True},
+            # 无限行模型：表格按块请求 getRowsRequest，服务端排序、筛选后只返回这一块的行
+            rowModelType="infinite",
+            defaultColDef={"resizable": True, "sortable": True, "filter": "agTextColumnFilter", "filterParams": GRID_FILTER_PARAMS},
             dashGridOptions={
                 "domLayout": "autoHeight", 
                 "rowHeight": 48, 
                 "pagination": True,
                 "paginationPageSize": 10,
                 "paginationPageSizeSelector": [10, 20, 50, 100],
+                "cacheBlockSize": GRID_BLOCK_SIZE,
+                "maxBlocksInCache": 10,
                 "enableRangeSelection": True,
                 "enableCellTextSelection": True,
                 "clipboard": {
@@ -143,16 +172,18 @@ layout = html.Div([
 ])
 
 @callback(
-    [Output('jobs-grid', 'rowData'),
-     Output('jobs-badges', 'children')],
-     Output('job-user-filter', 'value'),
+    [Output('jobs-query-store', 'data'),
+     Output('jobs-badges', 'children'),
+     Output('job-user-filter', 'value')],
     [Input('jobs-url', 'search'),
-    Input('job-status-filter', 'value'),
+     Input('job-status-filter', 'value'),
      Input('job-user-filter', 'value'),
+     Input('job-date-filter', 'start_date'),
+     Input('job-date-filter', 'end_date'),
     #  Input('job-res-filter', 'value')
      ]
 )
-def update_jobs(search, status, user, res_str=None):
+def update_jobs(search, status, user, start_date, end_date, res_str=None):
     params = utils.search_params(search)
 
     part_param = params.get('partition')
@@ -167,22 +198,61 @@ def update_jobs(search, status, user, res_str=None):
     if node_param:
         badges.append(html.Span(f"节点: {node_param}", className="px-2 py-0.5 bg-indigo-900/50 text-indigo-300 rounded text-xs border border-indigo-700/50"))
 
-    filtered_df = pd.DataFrame(Task.tasks_info)  # regenerate to keep links consistent
-    filtered_df['status_html'] = filtered_df['status'].apply(map2status_html)
-    filtered_df['resources'] = filtered_df.apply(map2resourcedesc, axis=1)
-    filtered_df['partition_html'] = filtered_df['partition'].apply(map2partition)
-    filtered_df['node_html'] = filtered_df['nodes'].apply(map2node)
-    filtered_df['createBy_html'] = filtered_df['createBy'].apply(map2username)
+    query = {
+        'status': status if status and status != 'all' else None,
+        'partition': part_param or None,
+        'node': node_param or None,
+        'user': username_param or None,
+        'res': res_str or None,
+        # 结束日期当天也包含在内
+        'start': start_date or None,
+        'end': (datetime.strptime(end_date[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d') if end_date else None,
+    }
+    return query, badges, username_param
 
-    if part_param:
-        filtered_df = filtered_df[filtered_df['partition'] == part_param]
-    if node_param:
-        filtered_df = filtered_df[filtered_df['node'] == node_param]
-    if status and status != 'all':
-        filtered_df = filtered_df[filtered_df['status'] == status]
-    if username_param:
-        filtered_df = filtered_df[filtered_df['createBy'].str.contains(username_param, case=False)]
 
+clientside_callback(
+    """
+    function purgeJobsGrid(query) {
+        // 筛选条件变化后丢弃已缓存的块，表格会按新条件重新发出 getRowsRequest
+        dash_ag_grid.getApiAsync('jobs-grid').then(function(api) {
+            api.purgeInfiniteCache();
+        });
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output('jobs-grid', 'getRowsResponse', allow_duplicate=True),
+    Input('jobs-query-store', 'data'),
+    prevent_initial_call=True
+)
+
+
+@callback(
+    Output('jobs-grid', 'getRowsResponse'),
+    Input('jobs-grid', 'getRowsRequest'),
+    State('jobs-query-store', 'data'),
+    prevent_initial_call=True
+)
+def get_job_rows(request, query):
+    if not request:
+        return dash.no_update
+    query = query or {}
+    start_row, end_row = request.get('startRow', 0), request.get('endRow', GRID_BLOCK_SIZE)
+    sort_keys = utils.grid_sort_keys(request.get('sortModel'), GRID_FIELDS)
+    filters = utils.grid_text_filters(request.get('filterModel'), GRID_FIELDS)
+    if query.get('status') in FINAL_STATUSES:
+        # 已结束的作业从归档表分页查询，不受内存中只保留最近若干个的限制
+        tasks, total = job_archive.query(start=query.get('start'), end=query.get('end'), status=query['status'],
+                                         partition=query.get('partition'), node=query.get('node'), user=query.get('user'),
+                                         sort_keys=sort_keys, filters=filters, start_row=start_row, end_row=end_row)
+        return {'rowData': render_jobs(pd.DataFrame.from_records(tasks, columns=list(TASK_FIELDS))), 'rowCount': total}
+
+    # 分区/节点/状态/用户都是列存上的索引查找，排序用每列预先算好的名次，展示行在刷新时已随快照构建好，只按行号取出当前这一块
+    store = hpc_manager.snapshot.task_store
+    positions = store.select(status=query.get('status'), partition=query.get('partition'),
+                             node=query.get('node'), user=query.get('user'))
+
+    res_str = query.get('res')
     if res_str:
         parts = res_str.split(' ')
         for p in parts:
@@ -192,18 +262,31 @@ def update_jobs(search, status, user, res_str=None):
             if m:
                 key, op, val = m.groups()
                 val = int(val)
+                column = pd.to_numeric(store.rows(positions)[{'gpu': 'card'}.get(key, key)], errors='coerce')
                 if op == '>':
-                    filtered_df = filtered_df[filtered_df[key] > val]
+                    positions = positions[(column > val).to_numpy(dtype=bool, na_value=False)]
                 elif op == '<':
-                    filtered_df = filtered_df[filtered_df[key] < val]
+                    positions = positions[(column < val).to_numpy(dtype=bool, na_value=False)]
                 elif op == '>=':
-                    filtered_df = filtered_df[filtered_df[key] >= val]
+                    positions = positions[(column >= val).to_numpy(dtype=bool, na_value=False)]
                 elif op == '<=':
-                    filtered_df = filtered_df[filtered_df[key] <= val]
+                    positions = positions[(column <= val).to_numpy(dtype=bool, na_value=False)]
                 elif op == '=' or op == '==':
-                    filtered_df = filtered_df[filtered_df[key] == val]
+                    positions = positions[(column == val).to_numpy(dtype=bool, na_value=False)]
 
-    return filtered_df.to_dict("records"), badges, username_param
+    if query.get('start') or query.get('end'):
+        # 时间是 YYYY-MM-DD HH:MM:SS 格式的字符串，按字符串比较即按时间比较
+        submit = store.rows(positions)['submitTime'].fillna('')
+        keep = (submit >= (query.get('start') or '')) & (submit != '')
+        if query.get('end'):
+            keep &= submit < query['end']
+        positions = positions[keep.to_numpy(dtype=bool)]
+    for column, kind, value in filters:
+        positions = store.filter_text(positions, column, kind, value)
+    positions = store.sort(positions, sort_keys)
+
+    rows = store.view('jobs', build_jobs_rows)
+    return {'rowData': [rows[i] for i in positions[start_row:end_row]], 'rowCount': len(positions)}
 
 def map2status_html(status):
     status_color_class = ""
@@ -235,3 +318,26 @@ def map2node(node):
     else:
         view_node_html = '-'
     return view_node_html
+
+
+def build_jobs_rows(store):
+    '''把快照内全部作业渲染成表格行，每个快照只构建一次'''
+    return render_jobs(store.frame)
+
+
+def render_jobs(frame):
+    '''
+    作业表渲染成表格行。状态/分区/用户是 category 列时只对去重后的取值生成 HTML；
+    缺失值转成 None，保证可以直接序列化为 JSON。
+    '''
+    frame = frame.copy()
+    frame['status_html'] = frame['status'].map(map2status_html).astype(object)
+    frame['resources'] = [map2resourcedesc(task) for task in frame[['cpu', 'mem', 'card', 'card_type']].to_dict('records')]
+    frame['partition_html'] = frame['partition'].map(map2partition).astype(object)
+    frame['node_html'] = frame['nodes'].map(map2node)
+    frame['createBy_html'] = frame['createBy'].map(map2username).astype(object)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict('records')
+
+
+hpc_manager.register_task_view('jobs', build_jobs_rows)
@@ -4,10 +4,10 @@ import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import random
 from datetime import datetime, timedelta
-from service.hpc_manager import Node, hpc_manager
+from service.hpc_manager import hpc_manager
+from service.history import HISTORY_TABLES
 from common import utils, logger
 import time
-import concurrent.futures
 
 dash.register_page(__name__, path='/nodes', name='节点管理')
 
@@ -39,49 +39,10 @@ period2days = {
     '6m': 180,
 }
 
-# 降采样配置：当数据量超过此值时进行降采样
+# 降采样配置：历史曲线用 LTTB 降采样到此点数以内
 MAX_CHART_POINTS = 2000  # 最大图表点数，可根据性能需求调整（默认2000点）
-
-def downsample_history(history, max_points=MAX_CHART_POINTS):
-    """
-    对历史数据进行降采样，减少数据量以提高图表渲染性能
-    
-    使用均匀采样方法，保留首尾两点，中间点均匀分布
-    
-    Args:
-        history: 历史数据列表，每条记录包含 timestamp 和对应的 usage 字段
-        max_points: 最大保留的数据点数，默认使用 MAX_CHART_POINTS
-        
-    Returns:
-        降采样后的历史数据列表
-    """
-    if not history or len(history) <= max_points:
-        return history
-    
-    # 数据量超过阈值，进行降采样
-    original_count = len(history)
-    
-    # 如果需要降采样，使用均匀间隔采样
-    # 计算采样步长，确保最终点数不超过 max_points
-    step = (original_count - 1) / (max_points - 1)
-    
-    sampled = []
-    for i in range(max_points):
-        index = int(i * step)
-        # 确保索引不超出范围
-        if index >= original_count:
-            index = original_count - 1
-        sampled.append(history[index])
-        
-        # 如果已经到达最后一个点，提前结束
-        if index >= original_count - 1:
-            break
-    
-    # 确保最后一个点被包含（处理浮点数误差）
-    if sampled[-1] != history[-1]:
-        sampled[-1] = history[-1]
-    
-    return sampled
+MAX_COMPARE_NODES = 10  # 节点对比最多选择的节点数
+COMPARE_MAX_POINTS = 500  # 节点对比每条曲线的点数
 
 def gen_nodes():
     return [
@@ -249,6 +210,58 @@ layout = html.Div([
                 ], className="overflow-hidden border border-gray-800 rounded-lg")
             ])
         ]),
+
+        # 多节点对比：同一指标多个节点的曲线一次查询取回
+        html.Div([
+            html.Div([
+                html.H2([
+                    html.I(className="fa-solid fa-code-compare text-indigo-500"),
+                    html.Span("节点对比", className="ml-2"),
+                ], className="text-lg font-bold flex items-center mr-auto"),
+                dcc.Dropdown(
+                    id='compare-nodes',
+                    options=[{'label': n.node, 'value': n.node} for n in hpc_manager.snapshot.nodes],
+                    value=[],
+                    multi=True,
+                    placeholder=f"选择节点（最多{MAX_COMPARE_NODES}个）",
+                    className="w-96"
+                ),
+                dcc.Dropdown(
+                    id='compare-metric',
+                    options=[{'label': 'CPU', 'value': 'CPU'}, {'label': '内存', 'value': 'Memory'}, {'label': '显卡', 'value': 'GPU'}],
+                    value='CPU',
+                    clearable=False,
+                    className="w-32"
+                ),
+            ], className="flex flex-wrap gap-3 items-center mb-4"),
+            html.Div(dcc.Graph(id='compare-chart', config={'displayModeBar': False}), className="w-full border border-gray-800 rounded-lg bg-gray-800/20 p-2")
+        ], className="bg-gray-900 border border-gray-800 rounded-xl p-6 mt-8"),
+
+        # 集群热力图：矩阵以 uint8 base64 下发，由前端解码绘制
+        html.Div([
+            html.Div([
+                html.H2([
+                    html.I(className="fa-solid fa-table-cells text-indigo-500"),
+                    html.Span("集群热力图", className="ml-2"),
+                ], className="text-lg font-bold flex items-center mr-auto"),
+                dcc.Dropdown(
+                    id='heatmap-metric',
+                    options=[{'label': 'CPU', 'value': 'CPU'}, {'label': '内存', 'value': 'Memory'}, {'label': '显卡', 'value': 'GPU'}],
+                    value='CPU',
+                    clearable=False,
+                    className="w-32"
+                ),
+                dcc.Dropdown(
+                    id='heatmap-period',
+                    options=[{'label': '最近1天', 'value': 1}, {'label': '最近1周', 'value': 7}, {'label': '最近1月', 'value': 30}],
+                    value=7,
+                    clearable=False,
+                    className="w-32"
+                ),
+            ], className="flex flex-wrap gap-3 items-center mb-4"),
+            dcc.Store(id='heatmap-store', data=None),
+            dcc.Loading(dcc.Graph(id='heatmap-chart', config={'displayModeBar': False}), type='circle'),
+        ], className="bg-gray-900 border border-gray-800 rounded-xl p-6 mt-8"),
         
         # 回到顶部按钮
         html.Button(
@@ -359,7 +372,7 @@ def update_node_grid(search, selected_id, part_filter, health_filter):
     if url_node:
         badges.append(html.Span(f"节点: {url_node}", className="px-2 py-0.5 bg-indigo-900/50 text-indigo-300 rounded text-xs border border-indigo-700/50"))
         
-    filtered_nodes = Node.nodes_info
+    filtered_nodes = hpc_manager.snapshot.nodes
     target_part = url_part if url_part else (part_filter if part_filter != 'all' else None)
     
     if target_part:
@@ -495,7 +508,7 @@ def update_detail_panel(selected_id, period):
     if not selected_id:
         return btn_classes, "hidden", "", [], {}, {}, {}
         
-    node = next((n for n in Node.nodes_info if n.node == selected_id), None)
+    node = hpc_manager.snapshot.get_node(selected_id)
     if not node:
         return btn_classes, "hidden", "", [], {}, {}, {}
         
@@ -503,7 +516,6 @@ def update_detail_panel(selected_id, period):
     if node.card == 0:
         gpu_rows.append(html.Tr(html.Td("无GPU资源", colSpan=5, className="px-3 py-4 text-center text-gray-500")))
     else:
-        # gpu_history = node.get_history('GPU', period2days[period])
         gpu_infos = node.gpu_info
         if gpu_infos:
             for idx, gpu_info in gpu_infos.items():
@@ -523,29 +535,98 @@ def update_detail_panel(selected_id, period):
                 gpu_rows.append(row)
 
 
-    def get_chart_data(data_type, color, days):
-        # 传递max_points参数，让数据库层面进行降采样（更高效）
-        history = node.get_history(data_type, days, max_points=MAX_CHART_POINTS)
-        # 数据库层面已经进行了降采样，如果数据量仍然超过阈值，再进行应用层降采样（双重保险）
-        #if len(history) > MAX_CHART_POINTS:
-        #    history = downsample_history(history, MAX_CHART_POINTS)
-        
-        ret = create_chart(data_type, color, history)
-        # 注意：时间统计已由get_history内部记录，这里只记录总体时间
-        return ret
-
-    # 使用 ThreadPoolExecutor 实现并行生成
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_gpu = executor.submit(get_chart_data, "GPU", "#6366f1", period2days[period])
-        future_cpu = executor.submit(get_chart_data, "CPU", "#a855f7", period2days[period])
-        future_mem = executor.submit(get_chart_data, "Memory", "#3b82f6", period2days[period])
-        
-        gpu_fig = future_gpu.result()
-        cpu_fig = future_cpu.result()
-        mem_fig = future_mem.result()
+    # 三条曲线一次取回（汇总表/宽表一条语句），数据库下推 MIN/MAX 后用 LTTB 降到 MAX_CHART_POINTS 以内
+    histories = node.get_histories(period2days[period], max_points=MAX_CHART_POINTS)
+    gpu_fig = create_chart("GPU", "#6366f1", histories['GPU'])
+    cpu_fig = create_chart("CPU", "#a855f7", histories['CPU'])
+    mem_fig = create_chart("Memory", "#3b82f6", histories['Memory'])
 
     endtime = time.time()
     logger.info(f"update_detail_panel time: {endtime - starttime}s")
     return btn_classes, "bg-gray-900 border border-gray-800 rounded-xl p-6 animate-fade-in-up", f"{selected_id} 详情", gpu_rows, gpu_fig, cpu_fig, mem_fig
 
 
+@callback(
+    Output('compare-chart', 'figure'),
+    [Input('compare-nodes', 'value'),
+     Input('compare-metric', 'value'),
+     Input('chart-period-store', 'data')]
+)
+def update_compare_chart(nodes, metric, period):
+    nodes = (nodes or [])[:MAX_COMPARE_NODES]
+    histories = hpc_manager.get_nodes_history(metric, nodes, period2days[period], max_points=COMPARE_MAX_POINTS) if nodes else {}
+    _, usage_field = HISTORY_TABLES[metric]
+    fig = go.Figure([
+        go.Scatter(
+            x=[datetime.fromtimestamp(row['timestamp']) for row in history],
+            y=[row[usage_field] for row in history],
+            name=node, mode='lines', line=dict(width=2),
+            hovertemplate=f'{node} %{{y:.1f}}%<extra></extra>'
+        )
+        for node, history in histories.items()
+    ])
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=20, b=20),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(showgrid=False, tickfont=dict(color='#9ca3af', size=10), nticks=6),
+        yaxis=dict(showgrid=True, gridcolor='#374151', tickfont=dict(color='#9ca3af'), range=[0, 100]),
+        legend=dict(orientation='h', font=dict(color='#9ca3af'), x=0, y=1.1),
+        height=280,
+        hovermode='x unified',
+        hoverlabel=dict(bgcolor='#0f172a', bordercolor='#334155', font=dict(color='#ffffff'))
+    )
+    return fig
+
+
+@callback(
+    Output('heatmap-store', 'data'),
+    [Input('heatmap-metric', 'value'),
+     Input('heatmap-period', 'value')]
+)
+def update_heatmap(metric, days):
+    return hpc_manager.get_heatmap(metric, days)
+
+
+clientside_callback(
+    """
+    function renderHeatmap(payload) {
+        if (!payload) {
+            return window.dash_clientside.no_update;
+        }
+        // base64 -> Uint8Array，每行是一个节点，每列是一个时间桶
+        var bytes = Uint8Array.from(atob(payload.data), function(c) { return c.charCodeAt(0); });
+        var z = new Array(payload.rows);
+        for (var i = 0; i < payload.rows; i++) {
+            var row = Array.from(bytes.subarray(i * payload.cols, (i + 1) * payload.cols));
+            for (var j = 0; j < payload.cols; j++) {
+                if (row[j] === payload.missing) {
+                    row[j] = null;
+                }
+            }
+            z[i] = row;
+        }
+        var x = new Array(payload.cols);
+        for (var j = 0; j < payload.cols; j++) {
+            x[j] = new Date((payload.start + j * payload.step) * 1000);
+        }
+        return {
+            data: [{
+                type: 'heatmap', z: z, x: x, y: payload.nodes, zmin: 0, zmax: 100,
+                colorscale: 'Viridis', hoverongaps: false,
+                hovertemplate: '%{y} %{x}<br>%{z}%<extra></extra>'
+            }],
+            layout: {
+                margin: {l: 80, r: 0, t: 10, b: 30},
+                paper_bgcolor: 'rgba(0,0,0,0)',
+                plot_bgcolor: 'rgba(0,0,0,0)',
+                xaxis: {tickfont: {color: '#9ca3af', size: 10}},
+                yaxis: {tickfont: {color: '#9ca3af', size: 9}, autorange: 'reversed'},
+                height: Math.max(300, payload.rows * 12)
+            }
+        };
+    }
+    """,
+    Output('heatmap-chart', 'figure'),
+    Input('heatmap-store', 'data')
+)
@@ -1,6 +1,6 @@
 import dash
 from common import utils
-from dash import html, dcc, Input, Output, State, callback
+from dash import html, dcc, Input, Output, State, callback, clientside_callback
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 import pandas as pd
@@ -10,6 +10,20 @@ from service.user import user_service
 dash.register_page(__name__, path='/users', name='用户管理')
 
 
+# 表格字段 -> 用户表的列，服务端按这些列排序和筛选
+GRID_FIELDS = {
+    'username': 'username',
+    'realname': 'realname',
+    'email': 'email',
+    'phone': 'phone',
+    'role_name': 'role_name',
+    'register_time': 'register_time',
+    'status_html': 'status',
+}
+# 每次请求的行数（分页大小的整数倍），浏览器最多缓存 maxBlocksInCache 块
+GRID_BLOCK_SIZE = 100
+GRID_FILTER_PARAMS = {"filterOptions": ["contains", "notContains", "equals", "notEqual", "startsWith", "endsWith"], "maxNumConditions": 1}
+
 columnDefs = [
     {"headerName": "用户名", "field": "username", "sortable": True, "filter": True, "flex": 12,},
     {"headerName": "昵称", "field": "realname", "cellRenderer": "markdown", "sortable": True, "flex": 12},
@@ -18,11 +32,13 @@ columnDefs = [
     {"headerName": "角色", "field": "role_name", "sortable": True, "flex": 20},
     {"headerName": "注册时间", "field": "register_time", "sortable": True, "flex": 12},
     {"headerName": "状态", "field": "status_html", "cellRenderer": "markdown","sortable": True, "flex": 5},
-    {"headerName": "作业", "field": "jobs", "cellRenderer": "markdown", "sortable": False, "flex": 5},
+    {"headerName": "作业", "field": "jobs", "cellRenderer": "markdown", "sortable": False, "filter": False, "flex": 5},
 ]
 
 layout = html.Div([
     dcc.Location(id='users-url', refresh=False),
+    # 当前的 状态/角色/用户 筛选条件，变化时清空表格缓存、重新分页请求
+    dcc.Store(id='users-query-store'),
     
     html.Div([
         html.Div(id='users-badges', className="flex items-center gap-2 mb-4"),
@@ -77,14 +93,17 @@ layout = html.Div([
         dag.AgGrid(
             id="users-grid",
             columnDefs=columnDefs,
-            # rowData=df_jobs.to_dict("records"),
-            defaultColDef={"resizable": True, "sortable": True, "filter": True},
+            # 无限行模型：表格按块请求 getRowsRequest，数据库排序、筛选、分页后只返回这一块的行
+            rowModelType="infinite",
+            defaultColDef={"resizable": True, "sortable": True, "filter": "agTextColumnFilter", "filterParams": GRID_FILTER_PARAMS},
             dashGridOptions={
                 "domLayout": "autoHeight", 
                 "rowHeight": 48, 
                 "pagination": True,
                 "paginationPageSize": 10,
                 "paginationPageSizeSelector": [10, 20, 50, 100],
+                "cacheBlockSize": GRID_BLOCK_SIZE,
+                "maxBlocksInCache": 10,
                 "enableRangeSelection": True,
                 "enableCellTextSelection": True,
                 "clipboard": {
@@ -99,7 +118,7 @@ layout = html.Div([
 ])
 
 @callback(
-    [Output('users-grid', 'rowData'),
+    [Output('users-query-store', 'data'),
      Output('users-badges', 'children'),
      Output('user-user-filter', 'value')],
     [Input('users-url', 'search'),
@@ -119,14 +138,44 @@ def update_jobs(search, status, user, role, res_str=None):
     #     badges.append(html.Span(f"用户: {username_param}", className="px-2 py-0.5 bg-indigo-900/50 text-indigo-300 rounded text-xs border border-indigo-700/50"))
     # if status:
     #     badges.append(html.Span(f"状态: {status}", className="px-2 py-0.5 bg-indigo-900/50 text-indigo-300 rounded text-xs border border-indigo-700/50"))
-    users = user_service.get_and_update_users(username=username_param, status=status, role=role)
-    if not users:
-        return [], badges, username_param
-    filtered_df = pd.DataFrame(users)  # regenerate to keep links consistent
-    filtered_df['status_html'] = filtered_df['status'].apply(map2status_html)
-    filtered_df['jobs'] = filtered_df['username'].apply(map2jobs)
+    return {'username': username_param, 'status': status, 'role': role}, badges, username_param
+
+
+clientside_callback(
+    """
+    function purgeUsersGrid(query) {
+        // 筛选条件变化后丢弃已缓存的块，表格会按新条件重新发出 getRowsRequest
+        dash_ag_grid.getApiAsync('users-grid').then(function(api) {
+            api.purgeInfiniteCache();
+        });
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output('users-grid', 'getRowsResponse', allow_duplicate=True),
+    Input('users-query-store', 'data'),
+    prevent_initial_call=True
+)
 
-    return filtered_df.to_dict("records"), badges, username_param
+
+@callback(
+    Output('users-grid', 'getRowsResponse'),
+    Input('users-grid', 'getRowsRequest'),
+    State('users-query-store', 'data'),
+    prevent_initial_call=True
+)
+def get_user_rows(request, query):
+    if not request:
+        return dash.no_update
+    query = query or {}
+    users, total = user_service.query_users(
+        username=query.get('username') or '', status=query.get('status'), role=query.get('role'),
+        sort_keys=utils.grid_sort_keys(request.get('sortModel'), GRID_FIELDS),
+        filters=utils.grid_text_filters(request.get('filterModel'), GRID_FIELDS),
+        start_row=request.get('startRow', 0), end_row=request.get('endRow', GRID_BLOCK_SIZE))
+    for row in users:
+        row['status_html'] = map2status_html(row['status'])
+        row['jobs'] = map2jobs(row['username'])
+    return {'rowData': users, 'rowCount': total}
 
 def map2status_html(status):
     status_color_class = ""
@@ -1,20 +1,33 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from service.hpc_manager import hpc_manager
 from service.user import user_service
+from service.retention import history_retention
 from datetime import datetime, timedelta
-from common import logger
+from common import logger, cfg
+from infra.hpc_api import api
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(hpc_manager.refresh_info, 'interval', seconds=20, 
             max_instances=1, id='refresh_info')
 scheduler.add_job(hpc_manager.save_history, 'interval', seconds=450,
             max_instances=1, id='save_history', next_run_time=datetime.now() + timedelta(seconds=1))
+# 启动后在后台把最近几天的历史加载到内存缓冲区，只执行一次
+scheduler.add_job(hpc_manager.load_history_buffer, 'date', run_date=datetime.now() + timedelta(seconds=1),
+            id='load_history_buffer')
 scheduler.add_job(hpc_manager.daily_statistic, 'cron', hour=23, minute=59, 
             max_instances=1, id='daily_statistic')
 scheduler.add_job(user_service.get_and_update_users, 'interval', seconds=3600, 
             max_instances=1, id='update_all_users', next_run_time=datetime.now())
+scheduler.add_job(api.refresh_token_if_expiring, 'interval', seconds=60,
+            max_instances=1, id='refresh_token')
+# 历史表分区维护：预建未来分区、压实并删除过期分区，启动后先执行一次保证当月及以后的分区存在
+if cfg.getboolean('retention', 'enabled', fallback=True):
+    scheduler.add_job(history_retention.maintain, 'cron', hour=cfg.getint('retention', 'hour', fallback=3),
+                max_instances=1, id='history_retention', next_run_time=datetime.now() + timedelta(seconds=60))
 
-scheduler.start()
-logger.info(f"定时任务启动完成")
+# 压测等场景需要手动调用各任务，可在配置中关闭定时任务
+if cfg.getboolean('service', 'scheduler', fallback=True):
+    scheduler.start()
+    logger.info(f"定时任务启动完成")
 
 
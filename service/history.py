@@ -0,0 +1,527 @@
+import time
+from threading import Lock
+import numpy as np
+from sqlalchemy import func, text, bindparam
+from sqlalchemy.dialects.mysql import insert
+from common import logger, cfg
+from common.timeseries import RingBuffer, bucket_minmax
+from models.model import TNodeCpuHistoryInfo, TNodeGpuHistoryInfo, TNodeMemHistoryInfo, \
+    TNodeHistoryRollup5m, TNodeHistoryRollup1h, TNodeHistoryRollup1d, TNodeDict, TNodeHistory
+from models import get_db_context_session
+
+# 历史数据存储方式：split 为每个指标一张表（默认），wide 为节点字典 + 一张 (node_id, ts, cpu, mem, gpu) 宽表
+HISTORY_STORAGE = cfg.get('history', 'storage', fallback='split')
+
+# data_type -> (历史表, 使用率字段)
+HISTORY_TABLES = {
+    'CPU': (TNodeCpuHistoryInfo, 'cpu_usage'),
+    'Memory': (TNodeMemHistoryInfo, 'mem_usage'),
+    'GPU': (TNodeGpuHistoryInfo, 'gpu_usage'),
+}
+
+# data_type -> 宽表中的列
+WIDE_COLUMNS = {'CPU': 'cpu', 'Memory': 'mem', 'GPU': 'gpu'}
+
+# 汇总级别 (桶宽秒数, 汇总表)，由细到粗，每一级由上一级（第一级由原始表）重算
+ROLLUP_LEVELS = [
+    (300, TNodeHistoryRollup5m),
+    (3600, TNodeHistoryRollup1h),
+    (86400, TNodeHistoryRollup1d),
+]
+
+
+class HistoryWatermark:
+    '''
+    每个节点每种指标已入库的最大时间戳（高水位线）。
+
+    上游每次返回的都是一整段曲线，其中绝大部分点上一轮已经入库。save_history 在写库前用水位线
+    过滤掉不晚于水位线的点，只把新点交给 INSERT IGNORE，往返次数、binlog 和唯一索引探测都只和新点数量相关。
+
+    水位线不单独存表：历史表本身就是持久化，save_history 每轮开始时调用 ensure_loaded，尚未加载的指标按
+    MAX(timestamp) GROUP BY node 从库里加载（走 (node, timestamp) 索引），之后在内存中随写库推进。
+    只有写库成功后才推进，失败的点下一轮会重新发送。
+
+    宽表存储时各指标共用一行，按列求最大值没有索引可用，改为从 5 分钟汇总表取每个节点最后一个桶的起点，
+    最后一个桶内的点会重发一次，宽表按主键覆盖写入，重复写入不影响结果。
+    '''
+
+    def __init__(self) -> None:
+        self.marks = {}     # (data_type, node) -> 已入库的最大时间戳
+        self.loaded = set()
+        self.lock = Lock()
+
+    def _load(self, data_type):
+        table, _ = HISTORY_TABLES[data_type]
+        try:
+            with get_db_context_session() as session:
+                if HISTORY_STORAGE == 'wide':
+                    rollup = ROLLUP_LEVELS[0][1]
+                    rows = session.query(rollup.node, func.max(rollup.bucket) - 1).filter(rollup.metric == data_type).group_by(rollup.node).all()
+                else:
+                    rows = session.query(table.node, func.max(table.timestamp)).group_by(table.node).all()
+        except Exception as e:
+            # 加载失败时不过滤，由 INSERT IGNORE 兜底去重，下一轮再加载
+            logger.error(f"加载{data_type}历史水位线失败: {e}")
+            return
+        self.marks.update({(data_type, node): ts for node, ts in rows})
+        self.loaded.add(data_type)
+        logger.info(f"加载{data_type}历史水位线完成，节点数：{len(rows)}")
+
+    def ensure_loaded(self):
+        with self.lock:
+            for data_type in HISTORY_TABLES:
+                if data_type not in self.loaded:
+                    self._load(data_type)
+
+    def filter(self, data_type, node, timestamps, values):
+        '''返回 (timestamps, values) 两个数组中时间戳晚于水位线的部分，水位线未加载时不过滤'''
+        with self.lock:
+            mark = self.marks.get((data_type, node))
+        if mark is None:
+            return timestamps, values
+        newer = timestamps > mark
+        return timestamps[newer], values[newer]
+
+    def advance(self, data_type, node, timestamp):
+        with self.lock:
+            if timestamp > self.marks.get((data_type, node), -1):
+                self.marks[(data_type, node)] = timestamp
+
+
+
+class HistoryRollup:
+    '''
+    节点历史的多级汇总（5 分钟 / 1 小时 / 1 天），每个桶保存 min/max/sum/cnt。
+
+    汇总是按范围重算而不是累加：save_history 每写入一批原始样本，就对这批样本涉及的节点和时间范围，
+    用 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 从原始表重算 5 分钟桶，再由 5 分钟桶重算 1 小时桶、
+    由 1 小时桶重算 1 天桶，重复写入或重试都不会重复计数。get_history 按请求的步长选用不超过步长的最粗级别，
+    长时间范围的曲线只扫描少量汇总行，与原始数据保留多久无关。
+    '''
+
+    @staticmethod
+    def _level_sql(data_type, level, with_nodes):
+        width, table = ROLLUP_LEVELS[level]
+        node_filter = 'node IN :nodes AND ' if with_nodes else ''
+        if level == 0 and HISTORY_STORAGE == 'wide':
+            column = WIDE_COLUMNS[data_type]
+            node_filter = 'd.node IN :nodes AND ' if with_nodes else ''
+            select = f"""SELECT d.node, :metric AS metric, h.ts DIV {width} * {width} AS b,
+                    MIN(h.{column}) AS min_val, MAX(h.{column}) AS max_val, SUM(h.{column}) AS sum_val, COUNT(*) AS cnt
+                FROM {TNodeHistory.__tablename__} h JOIN {TNodeDict.__tablename__} d ON d.id = h.node_id
+                WHERE {node_filter}h.ts >= :lo AND h.ts < :hi AND h.{column} IS NOT NULL
+                GROUP BY d.node, b"""
+        elif level == 0:
+            raw_table, usage_field = HISTORY_TABLES[data_type]
+            select = f"""SELECT node, :metric AS metric, timestamp DIV {width} * {width} AS b,
+                    MIN({usage_field}) AS min_val, MAX({usage_field}) AS max_val, SUM({usage_field}) AS sum_val, COUNT(*) AS cnt
+                FROM {raw_table.__tablename__}
+                WHERE {node_filter}timestamp >= :lo AND timestamp < :hi
+                GROUP BY node, b"""
+        else:
+            source = ROLLUP_LEVELS[level - 1][1].__tablename__
+            select = f"""SELECT node, metric, bucket DIV {width} * {width} AS b,
+                    MIN(min_val) AS min_val, MAX(max_val) AS max_val, SUM(sum_val) AS sum_val, SUM(cnt) AS cnt
+                FROM {source}
+                WHERE {node_filter}metric = :metric AND bucket >= :lo AND bucket < :hi
+                GROUP BY node, b"""
+        # 外面包一层派生表，ON DUPLICATE KEY UPDATE 里的 VALUES() 才能引用带 GROUP BY 的查询结果
+        sql = text(f"""INSERT INTO {table.__tablename__} (node, metric, bucket, min_val, max_val, sum_val, cnt)
+            SELECT * FROM ({select}) t
+            ON DUPLICATE KEY UPDATE min_val = VALUES(min_val), max_val = VALUES(max_val), sum_val = VALUES(sum_val), cnt = VALUES(cnt)""")
+        if with_nodes:
+            sql = sql.bindparams(bindparam('nodes', expanding=True))
+        return sql
+
+    def update(self, data_type, nodes, start, end):
+        '''重算 nodes（None 表示所有节点）在 [start, end] 时间范围内涉及的各级汇总桶'''
+        with get_db_context_session(transaction=True) as session:
+            for level, (width, _) in enumerate(ROLLUP_LEVELS):
+                params = {'metric': data_type, 'lo': start // width * width, 'hi': end // width * width + width}
+                if nodes is not None:
+                    params['nodes'] = list(nodes)
+                session.execute(self._level_sql(data_type, level, nodes is not None), params)
+
+    def update_level(self, data_type, level, start, end):
+        '''只重算 level 级汇总在 [start, end) 内的桶（所有节点），start/end 按该级桶宽对齐'''
+        with get_db_context_session(transaction=True) as session:
+            session.execute(self._level_sql(data_type, level, False), {'metric': data_type, 'lo': start, 'hi': end})
+
+    @staticmethod
+    def stale_days(data_type, level, start, end):
+        '''
+        [start, end) 内 level 级汇总与其数据源样本数不一致的天（UTC 天起点），两边各一条按天分组的计数语句，不重算。
+        save_history 正常运行时汇总是最新的，返回空列表；汇总上线前或写入失败留下的缺口才需要补算
+        '''
+        _, table = ROLLUP_LEVELS[level]
+        params = {'metric': data_type, 'lo': start, 'hi': end}
+        if level == 0 and HISTORY_STORAGE == 'wide':
+            source = f"""SELECT ts DIV 86400 * 86400 AS d, COUNT({WIDE_COLUMNS[data_type]}) AS cnt FROM {TNodeHistory.__tablename__}
+                WHERE ts >= :lo AND ts < :hi GROUP BY d"""
+        elif level == 0:
+            source = f"""SELECT timestamp DIV 86400 * 86400 AS d, COUNT(*) AS cnt FROM {HISTORY_TABLES[data_type][0].__tablename__}
+                WHERE timestamp >= :lo AND timestamp < :hi GROUP BY d"""
+        else:
+            source = f"""SELECT bucket DIV 86400 * 86400 AS d, SUM(cnt) AS cnt FROM {ROLLUP_LEVELS[level - 1][1].__tablename__}
+                WHERE metric = :metric AND bucket >= :lo AND bucket < :hi GROUP BY d"""
+        target = f"""SELECT bucket DIV 86400 * 86400 AS d, SUM(cnt) AS cnt FROM {table.__tablename__}
+            WHERE metric = :metric AND bucket >= :lo AND bucket < :hi GROUP BY d"""
+        with get_db_context_session() as session:
+            expected = dict(session.execute(text(source), params).fetchall())
+            actual = dict(session.execute(text(target), params).fetchall())
+        return sorted(day for day, cnt in expected.items() if cnt and actual.get(day) != cnt)
+
+    def backfill(self, start=None, end=None, chunk_days=1):
+        '''
+        从原始表重建 [start, end) 范围的汇总，默认覆盖原始表的全部数据。
+
+        首次上线或汇总数据有疑问时手动执行，按 chunk_days 分段提交，避免一个事务过大：
+            from service.history import history_rollup
+            history_rollup.backfill()
+        '''
+        for data_type, (raw_table, _) in HISTORY_TABLES.items():
+            with get_db_context_session() as session:
+                if HISTORY_STORAGE == 'wide':
+                    lo, hi = session.query(func.min(TNodeHistory.ts), func.max(TNodeHistory.ts)).one()
+                else:
+                    lo, hi = session.query(func.min(raw_table.timestamp), func.max(raw_table.timestamp)).one()
+            if lo is None:
+                continue
+            lo = start if start is not None else lo
+            hi = end if end is not None else hi + 1
+            chunk = chunk_days * 86400
+            begin = time.time()
+            for chunk_start in range(lo // 86400 * 86400, hi, chunk):
+                self.update(data_type, None, max(chunk_start, lo), min(chunk_start + chunk, hi) - 1)
+            logger.info(f"重建{data_type}历史汇总完成，范围：{lo} - {hi}，耗时：{round(time.time() - begin, 2)}秒")
+
+    @staticmethod
+    def level_for(step):
+        '''步长不小于桶宽的最粗级别，没有时返回 None（需要读原始表）'''
+        level = None
+        for i, (width, _) in enumerate(ROLLUP_LEVELS):
+            if width <= step:
+                level = i
+        return level
+
+    def query(self, node, metrics, level, start, step):
+        '''
+        按 step 把 level 级汇总再分桶，返回 [(指标, 桶起点, 桶内最小值, 桶内最大值)]，与原始表降采样的取值方式一致
+
+        多个指标在主键 (node, metric, bucket) 上是相邻的几段范围，一条语句取回。
+        '''
+        _, table = ROLLUP_LEVELS[level]
+        with get_db_context_session() as session:
+            return session.execute(text(f"""SELECT metric, :start + (bucket - :start) DIV :step * :step AS time_bucket, MIN(min_val), MAX(max_val)
+                FROM {table.__tablename__}
+                WHERE node = :node AND metric IN :metrics AND bucket >= :start
+                GROUP BY metric, time_bucket
+                ORDER BY metric, time_bucket""").bindparams(bindparam('metrics', expanding=True)),
+                {'node': node, 'metrics': list(metrics), 'start': start, 'step': step}).fetchall()
+
+
+class NodeDict:
+    '''节点名到 t_node_dict.id 的映射，进程内缓存，新节点首次写入时登记'''
+
+    def __init__(self) -> None:
+        self.ids = {}
+        self.lock = Lock()
+
+    def get_ids(self, nodes, create=True):
+        with self.lock:
+            missing = [node for node in set(nodes) if node not in self.ids]
+            if missing:
+                with get_db_context_session() as session:
+                    if create:
+                        session.execute(insert(TNodeDict).prefix_with('IGNORE'), [{'node': node} for node in missing])
+                        session.commit()
+                    rows = session.query(TNodeDict.node, TNodeDict.id).filter(TNodeDict.node.in_(missing)).all()
+                self.ids.update(dict(rows))
+            return {node: self.ids[node] for node in nodes if node in self.ids}
+
+
+class HistoryWide:
+    '''
+    宽表存储（[history] storage=wide）：t_node_dict 把节点名映射为 smallint，t_node_history 以 (node_id, ts) 为主键，
+    CPU/内存/GPU 同一时刻共用一行。相比三张分表，行数约为三分之一，没有 varchar 节点名和二级索引，
+    节点详情的三条曲线一次主键范围扫描即可取回。
+
+    从分表迁移：建表后执行一次 migrate()，确认数据完整后把 storage 改为 wide 并重启：
+        from service.history import history_wide
+        history_wide.migrate()
+    '''
+
+    def save(self, data_type, rows):
+        '''写入一批 get_history 同格式的行，按主键覆盖当前指标的列，返回是否成功'''
+        _, usage_field = HISTORY_TABLES[data_type]
+        column = WIDE_COLUMNS[data_type]
+        try:
+            ids = node_dict.get_ids([row['node'] for row in rows])
+            values = [{'node_id': ids[row['node']], 'ts': row['timestamp'], column: row[usage_field]} for row in rows]
+            stmt = insert(TNodeHistory)
+            stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column]})
+            with get_db_context_session() as session:
+                session.execute(stmt, values)
+                session.commit()
+        except Exception as e:
+            logger.error(f"写入{data_type}历史宽表失败: {e}")
+            return False
+        return True
+
+    def query(self, node, start, step):
+        '''按 step 降采样，返回 [(桶起点, CPU最小值, CPU最大值, 内存最小值, 内存最大值, GPU最小值, GPU最大值)]，没有数据的列为 None'''
+        node_id = node_dict.get_ids([node], create=False).get(node)
+        if node_id is None:
+            return []
+        with get_db_context_session() as session:
+            return session.execute(text(f"""SELECT :start + (ts - :start) DIV :step * :step AS time_bucket, MIN(cpu), MAX(cpu), MIN(mem), MAX(mem), MIN(gpu), MAX(gpu)
+                FROM {TNodeHistory.__tablename__}
+                WHERE node_id = :node_id AND ts >= :start
+                GROUP BY time_bucket
+                ORDER BY time_bucket"""), {'node_id': node_id, 'start': start, 'step': step}).fetchall()
+
+    def migrate(self, chunk_days=1):
+        '''把三张分表的数据按时间分段复制到宽表，可重复执行'''
+        begin = time.time()
+        for data_type, (table, usage_field) in HISTORY_TABLES.items():
+            with get_db_context_session() as session:
+                nodes = [row[0] for row in session.query(table.node).distinct().all()]
+                lo, hi = session.query(func.min(table.timestamp), func.max(table.timestamp)).one()
+            if lo is None:
+                continue
+            node_dict.get_ids(nodes)
+            column = WIDE_COLUMNS[data_type]
+            sql = text(f"""INSERT INTO {TNodeHistory.__tablename__} (node_id, ts, {column})
+                SELECT * FROM (SELECT d.id, t.timestamp, t.{usage_field}
+                    FROM {table.__tablename__} t JOIN {TNodeDict.__tablename__} d ON d.node = t.node
+                    WHERE t.timestamp >= :lo AND t.timestamp < :hi) s
+                ON DUPLICATE KEY UPDATE {column} = VALUES({column})""")
+            chunk = chunk_days * 86400
+            for chunk_start in range(lo, hi + 1, chunk):
+                with get_db_context_session(transaction=True) as session:
+                    session.execute(sql, {'lo': chunk_start, 'hi': chunk_start + chunk})
+            logger.info(f"迁移{data_type}历史数据到宽表完成，节点数：{len(nodes)}，累计耗时：{round(time.time() - begin, 2)}秒")
+
+
+class HistoryBuffer:
+    '''
+    最近 [history] buffer_days 天的节点曲线常驻内存，每个 (指标, 节点) 一个 RingBuffer，短时间范围的图表直接在内存中降采样，
+    不再查库。容量按 [history] buffer_interval（上游采样间隔）估算，每点 8 字节，
+    例如 7 天、60 秒间隔约 80KB/条曲线，1000 个节点三种指标约 240MB，buffer_days=0 关闭。
+
+    save_history 每批写库成功后追加；启动后由 load 在后台从库里补齐，补齐之前、窗口超出缓冲范围以及节点加载失败时返回 None，
+    调用方改查数据库。
+    '''
+
+    def __init__(self) -> None:
+        self.days = cfg.getint('history', 'buffer_days', fallback=7)
+        interval = cfg.getint('history', 'buffer_interval', fallback=60)
+        # 查询起点会按小时向前对齐，多留一小时
+        self.capacity = (self.days * 86400 + 3600) // interval + 1
+        self.buffers = {}
+        self.covered_from = None
+        # 加载失败、缓冲区数据不完整的节点
+        self.missing = set()
+        self.lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.days > 0
+
+    def append(self, data_type, node, timestamps, values):
+        if not self.enabled:
+            return
+        with self.lock:
+            buffer = self.buffers.get((data_type, node))
+            if buffer is None:
+                buffer = self.buffers[(data_type, node)] = RingBuffer(self.capacity)
+            buffer.extend(timestamps, values)
+
+    def append_rows(self, data_type, rows):
+        '''追加一批 save_history 格式的行（同一节点的行按时间升序）'''
+        _, usage_field = HISTORY_TABLES[data_type]
+        by_node = {}
+        for row in rows:
+            by_node.setdefault(row['node'], []).append((row['timestamp'], row[usage_field]))
+        for node, points in by_node.items():
+            points = np.array(points, dtype=np.float64)
+            self.append(data_type, node, points[:, 0].astype(np.int64), points[:, 1])
+
+    def query(self, data_type, node, start, step):
+        '''按 step 降采样返回 [(桶起点, 桶内最小值, 桶内最大值)]，缓冲区不能完整覆盖 [start, 当前] 时返回 None'''
+        if self.covered_from is None or start < self.covered_from:
+            return None
+        with self.lock:
+            if node in self.missing:
+                return None
+            buffer = self.buffers.get((data_type, node))
+            if buffer is None:
+                return []
+            # 写满后最旧的点被覆盖，窗口起点早于缓冲区第一个点时数据不完整
+            if buffer.size == buffer.capacity and buffer.first > start:
+                return None
+            timestamps, values = buffer.since(start)
+        buckets, mins, maxs = bucket_minmax(timestamps, values.astype(np.float64), start, step)
+        return list(zip(buckets.tolist(), mins.tolist(), maxs.tolist()))
+
+    def load(self, node_names):
+        '''
+        从库里加载最近 buffer_days 天的数据，与加载期间 save_history 追加的新点合并，返回加载失败的节点。
+        单个节点失败不影响其他节点，失败的节点查询时回退到数据库，再次 load 这些节点成功后恢复；重试沿用第一次加载的起点
+        '''
+        if not self.enabled:
+            return []
+        start_time = time.time()
+        since = self.covered_from if self.covered_from is not None else int(start_time) - self.days * 86400 - 3600
+        loaded = {}
+        failed = []
+        count = 0
+        for node in node_names:
+            try:
+                for data_type, (timestamps, values) in self._load_node(node, since).items():
+                    if len(timestamps):
+                        buffer = loaded[(data_type, node)] = RingBuffer(self.capacity)
+                        buffer.extend(timestamps, values)
+                        count += len(timestamps)
+            except Exception as e:
+                logger.error(f"加载节点{node}最近历史到内存失败: {e}")
+                failed.append(node)
+        with self.lock:
+            for key, buffer in self.buffers.items():
+                if key in loaded:
+                    timestamps, values = buffer.since(0)
+                    loaded[key].extend(timestamps, values)
+                else:
+                    loaded[key] = buffer
+            self.buffers = loaded
+            self.missing = (self.missing - set(node_names)) | set(failed)
+            self.covered_from = since
+        logger.info(f"加载最近{self.days}天历史到内存完成，节点数：{len(node_names) - len(failed)}，失败：{len(failed)}，"
+                    f"点数：{count}，耗时：{round(time.time() - start_time, 2)}秒")
+        return failed
+
+    @staticmethod
+    def _load_node(node, since):
+        # 逐个节点按 (node, timestamp) 索引范围读取，单条语句的结果集有界
+        ret = {}
+        with get_db_context_session() as session:
+            if HISTORY_STORAGE == 'wide':
+                node_id = node_dict.get_ids([node], create=False).get(node)
+                if node_id is None:
+                    return ret
+                rows = session.execute(text(f"""SELECT ts, cpu, mem, gpu FROM {TNodeHistory.__tablename__}
+                    WHERE node_id = :node_id AND ts >= :since ORDER BY ts"""), {'node_id': node_id, 'since': since}).fetchall()
+                data = np.array([[np.nan if v is None else v for v in row] for row in rows], dtype=np.float64).reshape(-1, 4)
+                for i, data_type in enumerate(HISTORY_TABLES, start=1):
+                    valid = ~np.isnan(data[:, i])
+                    ret[data_type] = data[valid, 0].astype(np.int64), data[valid, i]
+                return ret
+            for data_type, (table, usage_field) in HISTORY_TABLES.items():
+                rows = session.execute(text(f"""SELECT timestamp, {usage_field} FROM {table.__tablename__}
+                    WHERE node = :node AND timestamp >= :since ORDER BY timestamp"""), {'node': node, 'since': since}).fetchall()
+                data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+                ret[data_type] = data[:, 0].astype(np.int64), data[:, 1]
+        return ret
+
+
+class HistoryBatch:
+    '''
+    多节点 / 分区级历史查询：每个指标一条分组语句，按 (节点, 时间桶) 求均值，不再逐个节点查询。
+
+    level 不为 None 时读对应级别的汇总表（均值为 SUM(sum_val) / SUM(cnt)），否则读原始表或宽表。
+    分区聚合的 p95 用窗口函数按最近秩计算，需要 MySQL 8.0。
+    '''
+
+    @staticmethod
+    def _per_node_sql(data_type, level):
+        '''子查询：node, time_bucket, mean_val, max_val'''
+        if level is not None:
+            _, table = ROLLUP_LEVELS[level]
+            return f"""SELECT node, :start + (bucket - :start) DIV :step * :step AS time_bucket,
+                    SUM(sum_val) / SUM(cnt) AS mean_val, MAX(max_val) AS max_val
+                FROM {table.__tablename__}
+                WHERE node IN :nodes AND metric = :metric AND bucket >= :start
+                GROUP BY node, time_bucket"""
+        if HISTORY_STORAGE == 'wide':
+            column = WIDE_COLUMNS[data_type]
+            return f"""SELECT d.node, :start + (h.ts - :start) DIV :step * :step AS time_bucket,
+                    AVG(h.{column}) AS mean_val, MAX(h.{column}) AS max_val
+                FROM {TNodeHistory.__tablename__} h JOIN {TNodeDict.__tablename__} d ON d.id = h.node_id
+                WHERE d.node IN :nodes AND h.ts >= :start AND h.{column} IS NOT NULL
+                GROUP BY d.node, time_bucket"""
+        table, usage_field = HISTORY_TABLES[data_type]
+        return f"""SELECT node, :start + (timestamp - :start) DIV :step * :step AS time_bucket,
+                AVG({usage_field}) AS mean_val, MAX({usage_field}) AS max_val
+            FROM {table.__tablename__}
+            WHERE node IN :nodes AND timestamp >= :start
+            GROUP BY node, time_bucket"""
+
+    @staticmethod
+    def _execute(sql, data_type, nodes, start, step):
+        with get_db_context_session() as session:
+            return session.execute(text(sql).bindparams(bindparam('nodes', expanding=True)),
+                                   {'nodes': list(nodes), 'metric': data_type, 'start': start, 'step': step}).fetchall()
+
+    def series(self, data_type, nodes, start, step, level=None):
+        '''返回 [(节点, 桶起点, 均值, 最大值)]，按节点、时间排序'''
+        if not nodes:
+            return []
+        sql = f"SELECT * FROM ({self._per_node_sql(data_type, level)}) p ORDER BY node, time_bucket"
+        return self._execute(sql, data_type, nodes, start, step)
+
+    def aggregate(self, data_type, nodes, start, step, level=None):
+        '''返回 [(桶起点, 各节点均值之和, 各节点均值的平均, 各节点均值的 p95, 节点数)]，按时间排序'''
+        if not nodes:
+            return []
+        sql = f"""SELECT time_bucket, SUM(mean_val), AVG(mean_val), MIN(CASE WHEN rn >= CEIL(0.95 * cnt) THEN mean_val END), MAX(cnt)
+            FROM (
+                SELECT time_bucket, mean_val,
+                    ROW_NUMBER() OVER (PARTITION BY time_bucket ORDER BY mean_val) AS rn,
+                    COUNT(*) OVER (PARTITION BY time_bucket) AS cnt
+                FROM ({self._per_node_sql(data_type, level)}) p
+            ) r
+            GROUP BY time_bucket
+            ORDER BY time_bucket"""
+        return self._execute(sql, data_type, nodes, start, step)
+
+
+# 热力图矩阵中表示「没有数据」的取值，使用率取整后在 0~100 之间
+HEATMAP_MISSING = 255
+
+
+class HistoryHeatmap:
+    '''
+    全集群 节点 × 时间桶 的使用率矩阵：对汇总表一次分组查询（按节点走主键范围），
+    结果用 NumPy 一次散列写入 uint8 矩阵，每个格子 1 字节，几百个节点一个月的小时级矩阵只有几百 KB。
+    '''
+
+    def matrix(self, data_type, nodes, start, step, columns, level):
+        '''返回 shape 为 (len(nodes), columns) 的 uint8 矩阵，格子为该节点该时间桶的平均使用率，没有数据为 HEATMAP_MISSING'''
+        matrix = np.full((len(nodes), columns), HEATMAP_MISSING, dtype=np.uint8)
+        if not nodes:
+            return matrix
+        _, table = ROLLUP_LEVELS[level]
+        with get_db_context_session() as session:
+            rows = session.execute(text(f"""SELECT node, (bucket - :start) DIV :step AS col, SUM(sum_val) / SUM(cnt)
+                FROM {table.__tablename__}
+                WHERE node IN :nodes AND metric = :metric AND bucket >= :start
+                GROUP BY node, col""").bindparams(bindparam('nodes', expanding=True)),
+                {'nodes': list(nodes), 'metric': data_type, 'start': start, 'step': step}).fetchall()
+        if not rows:
+            return matrix
+        index = {node: i for i, node in enumerate(nodes)}
+        row_idx = np.fromiter((index.get(row[0], -1) for row in rows), dtype=np.int64, count=len(rows))
+        col_idx = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        valid = (row_idx >= 0) & (col_idx >= 0) & (col_idx < columns)
+        matrix[row_idx[valid], col_idx[valid]] = np.clip(np.rint(values[valid]), 0, 100).astype(np.uint8)
+        return matrix
+
+
+history_watermark = HistoryWatermark()
+history_rollup = HistoryRollup()
+node_dict = NodeDict()
+history_wide = HistoryWide()
+history_buffer = HistoryBuffer()
+history_batch = HistoryBatch()
+history_heatmap = HistoryHeatmap()
@@ -5,16 +5,40 @@ from common import cfg, logger
 from threading import Lock
 from itertools import groupby
 from common.utils import Unit2int
+from common.timeseries import aggregate_series, minmax_lttb
 from datetime import datetime, timedelta
-from functools import reduce
+from itertools import count
 from sqlalchemy import and_, tuple_, text, insert, func
 from sqlalchemy.exc import IntegrityError
 from models.model import TNodeCpuHistoryInfo, TNodeGpuHistoryInfo, TNodeMemHistoryInfo, TDailyReportInfo
 from models import get_db_context_session
-from concurrent.futures import ALL_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
 import time
 import pandas as pd
+import base64
+import math
 from infra.hpc_api import api
+from infra.async_hpc_api import AsyncHpcApi
+from service.snapshot import ClusterSnapshot, freeze
+from service.job_archive import job_archive
+from service.job_events import job_events, queue_wait_sketches
+from service.task_store import TaskStore, TASK_FIELDS
+from service.history import history_watermark, history_rollup, history_wide, history_buffer, history_batch, history_heatmap, HISTORY_TABLES, HISTORY_STORAGE, ROLLUP_LEVELS, HEATMAP_MISSING
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 原始表降采样查询使用的覆盖索引
+RAW_HISTORY_INDEXES = {'CPU': 'node_ts_cpu_idx', 'Memory': 'node_ts_mem_idx', 'GPU': 'node_ts_gpu_idx'}
+# 历史曲线按 step / HISTORY_OVERSAMPLE 的细桶下推 MIN/MAX，再用 LTTB 降到 max_points
+HISTORY_OVERSAMPLE = 4
+
+
+def history_window(recent_days, max_points):
+    '''返回 (起点, 步长, 汇总级别)，级别为 None 表示读原始表'''
+    start_time = int((datetime.now() - timedelta(days=recent_days)).timestamp())
+    start_time = start_time // 3600 * 3600  # 按照小时对齐，一小时以内的查询sql一样就可以复用缓存
+    interval = max(1, int(timedelta(days=recent_days).total_seconds() / max_points))
+    return start_time, interval, history_rollup.level_for(interval)
 
 
 def _extract_gpu_key(info: dict):
@@ -33,14 +57,24 @@ def map2resourcedesc(task):
         resp += f" / {task['card_type']}:{int(task['card'])}卡"
     return resp
 
-class Task:
-    tasks_info = []
-    tasks_by_node = {}
-    tasks_by_partition = {}
-    tasks_by_id = {}
+def format_duration(total_seconds):
+    '''秒数转为易读的字符串'''
+    if total_seconds is None:
+        return '-'
+    days, remainder = divmod(int(total_seconds), 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if days > 0:
+        return f"{days}天{hours}小时{minutes}分"
+    elif hours > 0:
+        return f"{hours}小时{minutes}分"
+    elif minutes > 0:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
 
-    def __init__(self, task_id):
-        self.task_info = Task.tasks_by_id.get(task_id, {})
+class Task:
+    def __init__(self, task_info):
+        self.task_info = task_info
         
     def get_daily_report(self):
         submit_time = datetime.strptime(self.task_info['submitTime'], '%Y-%m-%d %H:%M:%S')
@@ -49,19 +83,7 @@ class Task:
         else:
             start_time = datetime.now()
         wait_time = start_time - submit_time
-        # 将timedelta类型的wait_time转为易读的字符串
-        total_seconds = int(wait_time.total_seconds())
-        days, remainder = divmod(total_seconds, 86400)
-        hours, remainder = divmod(remainder, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        if days > 0:
-            wait_time_str = f"{days}天{hours}小时{minutes}分"
-        elif hours > 0:
-            wait_time_str = f"{hours}小时{minutes}分"
-        elif minutes > 0:
-            wait_time_str = f"{minutes}分{seconds}秒"
-        else:
-            wait_time_str = f"{seconds}秒"
+        wait_time_str = format_duration(wait_time.total_seconds())
 
         return {
             'job_id': self.task_info['slurmJobId'],
@@ -103,32 +125,128 @@ class Task:
             return '未知'
 
     @staticmethod
-    def update_tasks_info():
-        tasks = []
-        for status in [api.StatusRunning, api.StatusPending, api.StatusCompleted, api.StatusFailed]:
-            for i in range(5):
-                tasks_info = api.get_tasks(status)
-                if not tasks_info:
-                    continue
-                list(map(lambda x: x.update({'status': Task.mapstatus2ch(x['status'])}), tasks_info))
-                tasks.extend(tasks_info)
-                break
+    def normalize(tasks):
+        '''
+        状态转中文、解析资源、标注节点，只保留 TASK_FIELDS 中的字段，返回新的作业字典列表；
+        只在作业字典发布前调用，发布后的作业字典不再修改
+        '''
+        ret = []
         for task in tasks:
+            task['status'] = Task.mapstatus2ch(task['status'])
             Task.map2resources(task)
-        Task.tasks_info = tasks
-        Task.tasks_by_node = {node: list(tasks) for node, tasks in groupby(sorted(tasks, key=lambda x: x.get('nodes', '')), lambda x: x.get('nodes', ''))}
-        Task.tasks_by_partition = {partition: list(tasks) for partition, tasks in groupby(sorted(tasks, key=lambda x: x['partition']), lambda x: x['partition'])}
-        Task.tasks_by_id = {task['slurmJobId']: task for task in tasks}
+            task['node'] = task.get('nodes') or None
+            ret.append({field: task.get(field) for field in TASK_FIELDS})
+        return ret
+
+    @staticmethod
+    def fetch_tasks(status, limit=None, **kwargs):
+        '''逐页拉取某个状态的全部作业（或最新的 limit 个），边拉边解析，失败重试，全部失败返回 None'''
+        for i in range(5):
+            try:
+                tasks = []
+                for records in api.iter_tasks(status, limit=limit, **kwargs):
+                    tasks.extend(Task.normalize(records))
+                return tasks
+            except Exception as e:
+                logger.warning(f"获取{status}作业失败（第{i + 1}次），参数：{kwargs}：{e}")
+        logger.error(f"获取{status}作业失败，参数：{kwargs}")
+        return None
+
+    # 增量同步状态，只在 refresh_info 所在的调度线程里读写
+    finished_tasks = {}     # slurmJobId -> 已结束（完成/失败）的作业
+    watermark = None        # 已同步的已结束作业中最大的 startTime
+    running_start = {}      # 上一轮运行中的作业 slurmJobId -> startTime
+    active_tasks = {}       # 运行中/排队中 -> 最近一次拉取成功的作业列表
+    last_full_sync = 0
+
+    @staticmethod
+    def update_tasks_info():
+        '''
+        拉取作业列表，返回新的作业字典列表（不修改任何已发布的数据）
+
+        运行中/排队中的作业每轮全量刷新；已结束的作业不会再变化，只在首次或每隔
+        [hpc] task_full_sync_interval 秒全量拉取一次，其余轮次只用 startTime 过滤拉取水位线之后开始的作业。
+        上一轮还在运行、本轮已经不在运行列表中的作业，其 startTime 可能早于水位线，所以增量起点取两者的较小值。
+        任何一个状态拉取失败都不推进水位线；运行中/排队中拉取失败时沿用上一次的列表，而不是当作没有活跃作业。
+        '''
+        tasks = []
+        succeeded = True
+        for status in [api.StatusRunning, api.StatusPending]:
+            tasks_info = Task.fetch_tasks(status)
+            if tasks_info is None:
+                # 当作没有活跃作业会让快照丢掉这些作业、running_start 被清空，之后结束的作业落在水位线之前被增量同步漏掉
+                succeeded = False
+                tasks_info = Task.active_tasks.get(status, [])
+            else:
+                Task.active_tasks[status] = tasks_info
+            tasks.extend(tasks_info)
+        active_ids = {task['slurmJobId'] for task in tasks}
+
+        now = time.time()
+        full_sync = Task.watermark is None or now - Task.last_full_sync > cfg.getint('hpc', 'task_full_sync_interval', fallback=3600)
+        since = None
+        if not full_sync:
+            ended = [start for job_id, start in Task.running_start.items() if job_id not in active_ids and start]
+            since = min([Task.watermark] + ended)
+
+        keep = cfg.getint('hpc', 'task_finished_keep', fallback=1000)
+        finished = {}
+        fetched = 0
+        for status in [api.StatusCompleted, api.StatusFailed]:
+            # 接口按 startTime 倒序，全量同步时只需要最新的 keep 个
+            tasks_info = Task.fetch_tasks(status, limit=None if since else keep, startTime=since)
+            if tasks_info is None:
+                succeeded = False
+                continue
+            fetched += len(tasks_info)
+            finished.update({task['slurmJobId']: task for task in tasks_info})
+            # 本轮拉到的已结束作业写入归档表，内存里只保留最近的 keep 个
+            job_archive.save(tasks_info)
+        if not full_sync or not succeeded:
+            # 增量结果、或不完整的全量结果，都合并到上一轮的数据上
+            finished = {**Task.finished_tasks, **finished}
+
+        # 每个状态只保留最近开始的若干个，和之前按 pageSize 截断的展示范围一致
+        kept = {}
+        for status, status_tasks in groupby(sorted(finished.values(), key=lambda x: x['status']), lambda x: x['status']):
+            status_tasks = sorted(status_tasks, key=lambda x: x.get('startTime') or '', reverse=True)[:keep]
+            kept.update({task['slurmJobId']: task for task in status_tasks})
+
+        Task.finished_tasks = kept
+        # 有状态拉取失败时不推进水位线，下一轮仍从旧水位线开始，避免漏掉这段时间结束的作业
+        if succeeded:
+            if full_sync:
+                Task.last_full_sync = now
+            starts = [task['startTime'] for task in kept.values() if task.get('startTime')]
+            if starts:
+                Task.watermark = max(starts)
+        running_start = {task['slurmJobId']: task.get('startTime') for task in tasks if task['status'] == '运行中'}
+        if not succeeded:
+            # 本轮没同步成功的，下一轮继续按这些作业的开始时间回溯
+            running_start = {**{job_id: start for job_id, start in Task.running_start.items() if job_id not in active_ids}, **running_start}
+        Task.running_start = running_start
+        logger.info(f"同步作业完成，{'全量' if full_sync else '增量'}，活跃作业：{len(tasks)}，本轮拉取已结束作业：{fetched}，水位线：{Task.watermark}")
+
+        tasks.extend(task for job_id, task in kept.items() if job_id not in active_ids)
+        return tasks
+
+    @staticmethod
+    def index_tasks(tasks, store):
+        '''按节点、分区、作业ID建立索引，节点和分区直接复用列存的行号索引'''
+        tasks_by_node = {node: tuple(tasks[i] for i in positions) for node, positions in store.index['node'].items()}
+        tasks_by_partition = {partition: tuple(tasks[i] for i in positions) for partition, positions in store.index['partition'].items()}
+        tasks_by_id = {task['slurmJobId']: task for task in tasks}
+        return tasks_by_node, tasks_by_partition, tasks_by_id
 
 
 class Node:
-    nodes_info = []
-    nodes_dict_info = []
-    def __init__(self, node, partion):
+    def __init__(self, node, partion, upstream):
         self.partition = partion
         self.node = node
         self.cpu = self.memory = self.card = self.ip = self.active = None
-        self._update_info()
+        # 显卡信息由 HpcManager.refresh_info 并发预取后传入，构造过程不再访问上游
+        self.gpu_info = upstream['gpu_infos'].get(node)
+        self._update_info(upstream)
 
     def get_daily_report(self):
         return {
@@ -146,45 +264,93 @@ class Node:
         Args:
             history_type: 历史类型 ('CPU', 'Memory', 'GPU')
             recent_days: 最近天数
-            max_points: 最大返回数据点数，超过此值会在数据库层面进行降采样
+            max_points: 最大返回数据点数，数据库按更细的桶下推 MIN/MAX 后再用 LTTB 降到此点数以内
         """
-        start_timestampe = time.time()
-        if history_type == 'CPU':
-            table = TNodeCpuHistoryInfo
-            usage_field = 'cpu_usage'
-            index_name = 'node_ts_cpu_idx'
-        elif history_type == 'Memory':
-            table = TNodeMemHistoryInfo
-            usage_field = 'mem_usage'
-            index_name = 'node_ts_mem_idx'
-        elif history_type == 'GPU':
-            table = TNodeGpuHistoryInfo
-            usage_field = 'gpu_usage'
-            index_name = 'node_ts_gpu_idx'
-        else:
+        if history_type not in HISTORY_TABLES:
             return []
-        
-        start_time = int((datetime.now() - timedelta(days=recent_days)).timestamp())
-        start_time = (start_time / 3600) * 3600  # 按照小时对其，一小时以内的查询sql一样就可以复用缓存
-        
+        return self.get_histories(recent_days, max_points, data_types=[history_type])[history_type]
+
+    def get_histories(self, recent_days=30, max_points=2000, data_types=None):
+        '''
+        一次取回多条历史曲线（默认 CPU、内存、GPU 三条），返回 {'CPU': [...], 'Memory': [...], 'GPU': [...]}
+
+        数据来源依次为内存缓冲区、汇总表（步长不小于 5 分钟时）、原始表，汇总表和宽表都只需一条语句，
+        分表存储时各表并发查询。各来源都按 step 的 1/HISTORY_OVERSAMPLE 分桶返回桶内最小值和最大值，
+        再由 minmax_lttb 选出不超过 max_points 个点，既保留尖峰又不整体偏高。
+        '''
+        start_timestampe = time.time()
+        data_types = list(data_types or HISTORY_TABLES)
+        start_time, interval, level = history_window(recent_days, max_points)
+        step = max(1, interval // HISTORY_OVERSAMPLE)
+        if level is not None:
+            # 细分桶取汇总桶宽的整数倍，且不细于原来可用的汇总级别，避免为了过采样退回扫描原始表
+            width = ROLLUP_LEVELS[level][0]
+            step = max(width, step // width * width)
+
+        rows, source = self._query_history(data_types, start_time, step, level)
+        histories = {}
+        for data_type in data_types:
+            usage_field = HISTORY_TABLES[data_type][1]
+            data = rows.get(data_type) or []
+            timestamps, values = minmax_lttb([row[0] for row in data], [row[1] for row in data], [row[2] for row in data], step, max_points)
+            histories[data_type] = [{'timestamp': timestamp, usage_field: value} for timestamp, value in zip(timestamps.tolist(), values.tolist())]
+        logger.info(f"get_histories {data_types} node:{self.node} start: {start_time} step: {step} {source}: "
+                    f"-> {[len(history) for history in histories.values()]}条, 用时：{time.time() - start_timestampe:.3f}s")
+        return histories
+
+    def _query_history(self, data_types, start_time, step, level):
+        '''返回 ({data_type: [(桶起点, 最小值, 最大值)]}, 数据来源)'''
+        buffered = {data_type: history_buffer.query(data_type, self.node, start_time, step) for data_type in data_types}
+        if all(data is not None for data in buffered.values()):
+            return buffered, '内存缓冲区'
+
+        # 步长不小于 5 分钟时从汇总表读取，只扫描 范围/桶宽 行
+        if level is not None:
+            try:
+                rows = {data_type: [] for data_type in data_types}
+                for data_type, timestamp, min_val, max_val in history_rollup.query(self.node, data_types, level, start_time, step):
+                    rows[data_type].append((timestamp, float(min_val), float(max_val)))
+                # 汇总表为空（例如尚未执行 backfill）时改查原始表
+                if any(rows.values()):
+                    return rows, f'汇总表(级别{level})'
+            except Exception as e:
+                logger.error(f"从汇总表获取节点{self.node}历史信息失败，改查原始表: {e}")
+
+        if HISTORY_STORAGE == 'wide':
+            rows = {data_type: [] for data_type in data_types}
+            try:
+                for row in history_wide.query(self.node, start_time, step):
+                    for i, data_type in enumerate(HISTORY_TABLES):
+                        min_val, max_val = row[1 + i * 2], row[2 + i * 2]
+                        if data_type in rows and max_val is not None:
+                            rows[data_type].append((row[0], float(min_val), float(max_val)))
+            except Exception as e:
+                logger.error(f"获取节点{self.node}历史信息失败: {e}")
+            return rows, '宽表降采样'
+
+        if len(data_types) == 1:
+            return {data_types[0]: self._query_raw_history(data_types[0], start_time, step)}, '数据库降采样'
+        with ThreadPoolExecutor(max_workers=len(data_types)) as executor:
+            futures = {data_type: executor.submit(self._query_raw_history, data_type, start_time, step) for data_type in data_types}
+            return {data_type: future.result() for data_type, future in futures.items()}, '数据库降采样'
+
+    def _query_raw_history(self, history_type, start_time, step):
+        table, usage_field = HISTORY_TABLES[history_type]
+        index_name = RAW_HISTORY_INDEXES[history_type]
         with get_db_context_session() as session:
-            interval = max(1,  int(timedelta(days=recent_days).total_seconds() / max_points))
-            # data = session.query(table).filter(and_(table.node == self.node, table.timestamp >= start_time)).order_by(table.timestamp.asc()).all()
             try:
                 data = session.execute(
-                # 解释为什么要用子查询：ROW_NUMBER() 是窗口函数，rn 是 select 阶段动态生成的别名，不能直接在同级 WHERE 子句使用，
-                # 因为 WHERE 在 SELECT 之前执行。必须用子查询先选出带 rn 的表，再在外层 where 过滤 rn=1。
-                # 
-                # 关于 limit：如果把 limit 放在子查询里，仅对子查询的原始行数做限制（不是降采样后的数据点，也不是最终的结果），
-                # 这样可能导致采样区间不完整或有遗漏，最终采样点不足 max_points。所以 limit 只能放到最外层，确保拿到足够的降采样点后再截断。
+                # 解释为什么要用子查询：bucket_idx 是 select 阶段动态生成的别名，先在子查询里按桶分组，
+                # 外层再换算成桶起点并排序。
                 text(f"""SELECT
 	:start + bucket_idx * :step AS time_bucket,
+	min_val,
 	max_val
 FROM
 	(
 	SELECT
 		(timestamp - :start) DIV :step AS bucket_idx,
-		SUBSTRING_INDEX(GROUP_CONCAT({usage_field} ORDER BY timestamp ASC), ',', 1) AS avg_val,
+        min({usage_field}) as min_val,
         max({usage_field}) as max_val
 	FROM
 		{table.__tablename__} FORCE INDEX ({index_name})
@@ -199,68 +365,40 @@ ORDER BY
                         {
                             'node': self.node,
                             'start': start_time,
-                            'step': interval,
+                            'step': step,
                         }
                     ).fetchall()
-                                            
-                # 转换为字典格式
-                data = [
-                    {'timestamp': row[0], usage_field: float(row[1])}
-                    for row in data
-                ]
-                                        
-                logger.info(f"get_history {history_type} node:{self.node} start: {start_time} step: {interval} 数据库降采样:  -> 采样后{len(data)}条, 间隔{interval}秒, 用时：{time.time() - start_timestampe:.3f}s")
-                return data
+                return [(row[0], float(row[1]), float(row[2])) for row in data]
             except Exception as e:
                 logger.error(f"获取节点{self.node}历史信息失败: {e}")
                 return []
 
-    def save_cpu_history(self):
-        data = api.get_node_cpu_usage(self.node)
-        if not data:
-            return {}
+    @staticmethod
+    def parse_usage(node_name, data_type, data):
+        '''把上游的使用率曲线（多条 series 的 values）按时间戳求平均，没有数据时返回空字典'''
         try:
-            cpu = sorted(reduce(lambda x, y: x + y, map(lambda x: x['values'], data)), key=lambda x: x[0])
+            timestamps, values = aggregate_series(data)
         except Exception as e:
-            logger.error(f"保存节点{self.node}CPU历史信息失败: {e}")
+            logger.error(f"解析节点{node_name}{data_type}历史信息失败: {e}")
             return {}
-        cpu = {k: list(v) for k, v in groupby(cpu, lambda x: x[0])}
-        cpu = {k: sum(map(lambda x: float(x[1]), v)) / len(v) for k, v in cpu.items()}
-        cpu = {'data_type': 'CPU', 'data': cpu, 'node': self.node}
-        
-        return cpu
-        # self._save_history_with_dedup(models, TNodeCpuHistoryInfo, 'CPU')
+        if not len(timestamps):
+            return {}
+        return {'data_type': data_type, 'node': node_name, 'timestamps': timestamps, 'values': values}
+
+    def save_cpu_history(self):
+        return Node.parse_usage(self.node, 'CPU', api.get_node_cpu_usage(self.node))
 
     def save_mem_history(self):
-        data = api.get_node_memory_usage(self.node)
-        if not data:
-            return {}
-        mem = sorted(reduce(lambda x, y: x + y, map(lambda x: x['values'], data)), key=lambda x: x[0])
-        mem = {k: list(v) for k, v in groupby(mem, lambda x: x[0])}
-        mem = {k: sum(map(lambda x: float(x[1]), v)) / len(v) for k, v in mem.items()}
-        mem = {'data_type': 'Memory', 'data': mem, 'node': self.node}
-        # models = [TNodeMemHistoryInfo(node=self.node, timestamp=k, mem_usage=v) for k, v in mem.items()]
-        return mem
-        # self._save_history_with_dedup(models, TNodeMemHistoryInfo, '内存')
+        return Node.parse_usage(self.node, 'Memory', api.get_node_memory_usage(self.node))
 
     def save_gpu_history(self):
-        data = api.get_gpu_usage(self.node)
-        if not data:
-            return {}
-        gpu = sorted(reduce(lambda x, y: x + y, map(lambda x: x['values'], data)), key=lambda x: x[0])
-        gpu = {k: list(v) for k, v in groupby(gpu, lambda x: x[0])}
-        gpu = {k: sum(map(lambda x: float(x[1]), v)) / len(v) for k, v in gpu.items()}
-        gpu = {'data_type': 'GPU', 'data': gpu, 'node': self.node}
-        # models = [TNodeGpuHistoryInfo(node=self.node, timestamp=k, gpu_usage=v) for k, v in gpu.items()]
-        return gpu
-        # self._save_history_with_dedup(models, TNodeGpuHistoryInfo, 'GPU')
-
-    def _update_info(self):
-        self.gpu_info = api.get_node_gpu_info(self.node)
-
-        nodeComputingResource = Partition.overview['nodeComputingResource'][self.node]
+        return Node.parse_usage(self.node, 'GPU', api.get_gpu_usage(self.node))
+
+    def _update_info(self, upstream):
+        overview = upstream['overview']
+        nodeComputingResource = overview['nodeComputingResource'][self.node]
         if not nodeComputingResource:
-            logger.error(f"获取节点{self.node}GPU信息失败, 数据为：{Partition.overview['nodeComputingResource']}")
+            logger.error(f"获取节点{self.node}GPU信息失败, 数据为：{overview['nodeComputingResource']}")
             return
         gpu_key = _extract_gpu_key(nodeComputingResource)
         self.card_type = gpu_key.split(':')[-1]
@@ -270,19 +408,18 @@ ORDER BY
         self.cpu = nodeComputingResource['cpu']
         self.card = nodeComputingResource.get(gpu_key, 0)
 
-        nodeComputingResourceIdled = Partition.overview['nodeComputingResourceIdled'][self.node]
+        nodeComputingResourceIdled = overview['nodeComputingResourceIdled'][self.node]
         self.idled_mem_str = nodeComputingResourceIdled['mem']
         self.idled_mem = Unit2int(self.idled_mem_str)
         self.idled_cpu = nodeComputingResourceIdled['cpu']
         self.idled_card = nodeComputingResourceIdled.get(gpu_key, 0)
         
-        for node in Node.nodes_dict_info:
-            if node['name'] == self.node:
-                self.ip = node['ip']
-                self.active = node['state'] == 'active'
-                self.cabinet = node['cabinet']
-                self.slurmState = node['slurmState']
-                break       
+        node = upstream['nodes_dict'].get(self.node)
+        if node:
+            self.ip = node['ip']
+            self.active = node['state'] == 'active'
+            self.cabinet = node['cabinet']
+            self.slurmState = node['slurmState']
 
         self.cpu_util_pct = round((1 - self.idled_cpu / self.cpu) * 100)
         self.mem_util_pct = round((1 - self.idled_mem / self.memory) * 100)
@@ -292,32 +429,28 @@ ORDER BY
         else:
             self.health = '告警' if (self.cpu_util_pct > 85 or self.gpu_util_pct > 85 or self.mem_util_pct > 85) else '健康'
 
-        self.tasks = Task.tasks_by_node.get(self.node, [])  
-        for task in self.tasks:
-            task['node'] = self.node
-            task['partition'] = self.partition.partition_name
+        self.tasks = upstream['tasks_by_node'].get(self.node, ())
         self.updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     @staticmethod
     def update_nodes_info():
+        '''拉取节点部署信息，返回 {节点名: 节点信息}'''
         for i in range(5):
             nodes_info = api.get_nodes_info()
             if not nodes_info:
                 continue
-            nodes = []
+            nodes = {}
             for cabinet in nodes_info:
                 for node in cabinet['nodes']:
-                    node['cabinet'] = cabinet['cabinet']
-                    nodes.append(node)
-            Node.nodes_dict_info = nodes
-            break
+                    # 接口返回可能来自共享缓存，复制后再补充字段
+                    nodes[node['name']] = {**node, 'cabinet': cabinet['cabinet']}
+            return nodes
+        return {}
 
 class Partition:
-    overview = {}
-
-    def __init__(self, partition_name) -> None:
+    def __init__(self, partition_name, upstream) -> None:
         self.partition_name = partition_name
-        self._update_info()
+        self._update_info(upstream)
     
     def statistic(self):
         partition = self.partition_name
@@ -334,8 +467,9 @@ class Partition:
             'nodes_status': f'{len(list(filter(lambda x: x.active, self.nodes.values())))}/{len(self.nodes)}',
         }
 
-    def _update_info(self): 
-        partitionComputingResource = Partition.overview['partitionComputingResource'][self.partition_name]
+    def _update_info(self, upstream): 
+        overview = upstream['overview']
+        partitionComputingResource = overview['partitionComputingResource'][self.partition_name]
         gpu_key = _extract_gpu_key(partitionComputingResource)
         self.card_type = gpu_key.split(':')[-1]
 
@@ -344,16 +478,16 @@ class Partition:
         self.total_cpu = int(partitionComputingResource['cpu'])
         self.total_card = int(partitionComputingResource.get(gpu_key, 0))
 
-        partitionComputingResourceIdled = Partition.overview['partitionComputingResourceIdled'][self.partition_name]
+        partitionComputingResourceIdled = overview['partitionComputingResourceIdled'][self.partition_name]
         self.idled_mem_str = partitionComputingResourceIdled['mem']
         self.idled_mem = Unit2int(self.idled_mem_str)
         self.idled_cpu = partitionComputingResourceIdled['cpu']
         self.idled_card = partitionComputingResourceIdled.get(gpu_key, 0)
 
-        nodes = Partition.overview['partitionNode'][self.partition_name]
-        self.nodes = {node: Node(node, self) for node in nodes}
+        nodes = overview['partitionNode'][self.partition_name]
+        self.nodes = {node: Node(node, self, upstream) for node in nodes}
         self.nodes = {key: value for key, value in self.nodes.items() if hasattr(value, 'cpu')}
-        self.tasks = Task.tasks_by_partition.get(self.partition_name, [])
+        self.tasks = upstream['tasks_by_partition'].get(self.partition_name, ())
         self.updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         self.cpu_util_pct = round((1 - self.idled_cpu/self.total_cpu)*100)
@@ -363,131 +497,252 @@ class Partition:
 
     @staticmethod
     def update_partition_info():
+        '''拉取分区/节点资源总览'''
         for i in range(5):
             partition_overview = api.get_overview()
             if not partition_overview:
                 continue
-            Partition.overview = partition_overview
-            break
+            return partition_overview
+        return {}
 
 
 class HpcManager:
     def __init__(self) -> None:
+        self.snapshot = None
+        self._versions = count(1)
+        self._heatmaps = {}
+        self._heatmaps_lock = Lock()
+        # 名字 -> builder(task_store)，每次刷新在调度线程里预先构建，页面回调直接取用
+        self.task_views = {}
         self.refresh_info()
 
     def refresh_info(self):
-        Task.update_tasks_info()
-        Node.update_nodes_info()
-        Partition.update_partition_info()
-        self.partitions = {partition: Partition(partition) for partition in Partition.overview['partitionComputingResource'].keys()}
-        self.user_total = api.get_user_total()
-        Node.nodes_info = reduce(lambda x, y: x + y, [list(node.nodes.values()) for node in self.partitions.values()])
-        logger.info(f"刷新信息完成，用户数：{self.user_total['total']}，节点数：{len(Node.nodes_info)}，分区数：{len(self.partitions)}")
+        start_time = time.time()
+        tasks = Task.update_tasks_info()
+        # 与上一轮对比，把作业状态变化追加到事件表
+        events = job_events.record(tasks)
+        nodes_dict = Node.update_nodes_info()
+        overview = Partition.update_partition_info()
+        gpu_infos = asyncio.run(self._prefetch_gpu_infos(overview))
+        prefetch_time = time.time()
+        user_total = api.get_user_total()
+
+        # 在局部变量上构建完整的新快照，页面回调看到的始终是上一个完整快照
+        task_store = TaskStore(tasks)
+        for name, builder in self.task_views.items():
+            try:
+                task_store.view(name, builder)
+            except Exception as e:
+                logger.error(f"构建作业视图{name}失败: {e}")
+        tasks_by_node, tasks_by_partition, tasks_by_id = Task.index_tasks(tasks, task_store)
+        upstream = {
+            'overview': overview,
+            'nodes_dict': nodes_dict,
+            'gpu_infos': gpu_infos,
+            'tasks_by_node': tasks_by_node,
+            'tasks_by_partition': tasks_by_partition,
+        }
+        partitions = {partition: Partition(partition, upstream) for partition in overview['partitionComputingResource'].keys()}
+        snapshot = ClusterSnapshot(
+            version=next(self._versions),
+            built_at=time.time(),
+            partitions=freeze(partitions),
+            nodes=tuple(node for partition in partitions.values() for node in partition.nodes.values()),
+            tasks=tuple(tasks),
+            task_store=task_store,
+            tasks_by_node=freeze(tasks_by_node),
+            tasks_by_partition=freeze(tasks_by_partition),
+            tasks_by_id=freeze(tasks_by_id),
+            user_total=freeze(user_total),
+        )
+        # 单次引用赋值完成发布
+        self.snapshot = snapshot
+        logger.debug(f"HPC接口缓存统计：{api.cache_stats()}")
+        logger.info(f"刷新信息完成，版本：{snapshot.version}，用户数：{snapshot.total_user}，节点数：{len(snapshot.nodes)}，分区数：{len(snapshot.partitions)}，作业事件：{events}，"
+                    f"预取耗时：{round(prefetch_time - start_time, 2)}秒，总耗时：{round(time.time() - start_time, 2)}秒")
+
+    async def _prefetch_gpu_infos(self, overview):
+        '''
+        并发预取所有带卡节点的显卡信息，返回 {节点名: 显卡信息}
+
+        并发度由 [hpc] refresh_concurrency 限制，整体不超过 [hpc] refresh_deadline 秒，
+        保证刷新耗时不随节点数增长而超过自身的调度间隔。超时或失败的节点沿用上一轮的数据。
+        '''
+        gpu_nodes = [node for node, resource in overview['nodeComputingResource'].items()
+                     if resource and _extract_gpu_key(resource)]
+        async with AsyncHpcApi(endpoint_concurrency=cfg.getint('hpc', 'refresh_concurrency', fallback=16)) as aapi:
+            gpu_infos = await aapi.fan_out(aapi.get_node_gpu_info, gpu_nodes,
+                                           timeout=cfg.getfloat('hpc', 'refresh_deadline', fallback=15))
+        previous = {node.node: node.gpu_info for node in self.snapshot.nodes} if self.snapshot else {}
+        for node in gpu_nodes:
+            if not gpu_infos.get(node) or isinstance(gpu_infos[node], dict) and 'code' in gpu_infos[node]:
+                gpu_infos[node] = previous.get(node)
+        return gpu_infos
+
+    def backfill_job_archive(self, since=None):
+        '''把上游全部（或 startTime 不早于 since 的）已完成/失败作业写入归档表，上线时手动执行一次'''
+        for status in [api.StatusCompleted, api.StatusFailed]:
+            tasks = Task.fetch_tasks(status, startTime=since) or []
+            logger.info(f"回填{status}作业归档：{job_archive.save(tasks)}个")
+
+    def load_history_buffer(self, retries=5, retry_seconds=60):
+        '''启动后执行一次；加载失败的节点每隔 retry_seconds 秒重试，最多 retries 次，仍失败的节点一直查数据库'''
+        nodes = [node.node for node in self.snapshot.nodes]
+        for attempt in range(retries + 1):
+            nodes = history_buffer.load(nodes)
+            if not nodes:
+                return
+            if attempt < retries:
+                logger.warning(f"{len(nodes)}个节点的最近历史加载失败，{retry_seconds}秒后重试")
+                time.sleep(retry_seconds)
+        logger.error(f"{len(nodes)}个节点的最近历史加载失败，已放弃重试，这些节点的曲线查询数据库: {nodes}")
 
     def save_history(self):
-        # 使用 with 语句确保线程池正确关闭
-        start_time = time.time()    
-        with ThreadPoolExecutor(max_workers=20) as executor:
-            # 提交所有任务（注意：传递函数引用，不要调用函数）
-            futures = []
-            for node in Node.nodes_info:
-                futures.append(executor.submit(node.save_cpu_history))
-                futures.append(executor.submit(node.save_mem_history))
-                futures.append(executor.submit(node.save_gpu_history))
-            
-            # 等待所有任务完成
-            wait(futures, return_when=ALL_COMPLETED)
-            
-            # 收集结果并过滤空字典
-            results = []
-            for future in futures:
+        start_time = time.time()
+        node_names = [node.node for node in self.snapshot.nodes]
+        # 水位线首次加载要查库，放在事件循环之外完成
+        history_watermark.ensure_loaded()
+        stats = asyncio.run(self._save_history_pipeline(node_names))
+        logger.info(f"保存历史信息完成，拉取{stats['fetched']}个点，写入新点{stats['rows']}个（{stats['batches']}批，失败{stats['failed_batches']}批），"
+                    f"首批入库耗时：{stats['first_write']}秒，总耗时：{round(time.time() - start_time, 2)}秒")
+
+    async def _save_history_pipeline(self, node_names):
+        '''
+        拉取与写库的生产者/消费者流水线，返回统计信息
+
+        固定数量的拉取协程（[history] fetch_workers）逐个取 (指标, 节点) 拉取曲线，聚合、按水位线过滤后放入
+        有界队列（[history] queue_size），队列满时拉取方等待；写库协程（[history] write_workers）从队列取数据，
+        按指标攒满 [history] batch_size 行就在线程中执行一次 INSERT IGNORE（宽表为按主键覆盖写入），随后重算这批样本涉及的汇总桶。内存中最多只有队列加各写库协程缓冲区的数据，
+        与节点数无关，第一批数据在拉取完成前就开始入库。
+
+        水位线在全部写完后统一推进，某个节点只要有一批写入失败，本轮就不推进它的水位线。
+        '''
+        start_time = time.time()
+        batch_size = cfg.getint('history', 'batch_size', fallback=1000)
+        work = asyncio.Queue()
+        for data_type in HISTORY_TABLES:
+            for node_name in node_names:
+                work.put_nowait((data_type, node_name))
+        samples = asyncio.Queue(maxsize=cfg.getint('history', 'queue_size', fallback=64))
+        stats = {'fetched': 0, 'rows': 0, 'batches': 0, 'failed_batches': 0, 'first_write': None}
+        new_marks = {}
+        failed = set()
+
+        async def fetcher(aapi):
+            methods = {'CPU': aapi.get_node_cpu_usage, 'Memory': aapi.get_node_memory_usage, 'GPU': aapi.get_gpu_usage}
+            while not work.empty():
+                data_type, node_name = work.get_nowait()
                 try:
-                    result = future.result()
-                    if result and isinstance(result, dict) and result.get('data'):
-                        results.append(result)
+                    payload = await methods[data_type](node_name)
                 except Exception as e:
-                    logger.error(f"获取历史信息结果失败: {e}")
-        
-        # 按 data_type 分组并转换为模型对象
-        cpu_models = []
-        mem_models = []
-        gpu_models = []
-        
-        for result in results:
-            data_type = result.get('data_type')
-            node_name = result.get('node')
-            data = result.get('data', {})
-            
-            if data_type == 'CPU':
-                cpu_models.extend([
-                    TNodeCpuHistoryInfo(node=node_name, timestamp=k, cpu_usage=v)
-                    for k, v in data.items()
-                ])
-            elif data_type == 'Memory':
-                mem_models.extend([
-                    TNodeMemHistoryInfo(node=node_name, timestamp=k, mem_usage=v)
-                    for k, v in data.items()
-                ])
-            elif data_type == 'GPU':
-                gpu_models.extend([
-                    TNodeGpuHistoryInfo(node=node_name, timestamp=k, gpu_usage=v)
-                    for k, v in data.items()
-                ])
-        
-        # 批量保存到数据库
-        if cpu_models:
-            self._save_history_with_dedup(cpu_models, TNodeCpuHistoryInfo)
-        if mem_models:
-            self._save_history_with_dedup(mem_models, TNodeMemHistoryInfo)
-        if gpu_models:
-            self._save_history_with_dedup(gpu_models, TNodeGpuHistoryInfo)
-        end_time = time.time()
-        logger.info(f"保存历史信息完成，CPU：{len(cpu_models)}，内存：{len(mem_models)}，GPU：{len(gpu_models)}，耗时：{round(end_time - start_time, 2)}秒")
-
+                    logger.error(f"拉取节点{node_name}{data_type}历史信息失败: {e!r}")
+                    continue
+                result = Node.parse_usage(node_name, data_type, payload)
+                if not result:
+                    continue
+                stats['fetched'] += len(result['timestamps'])
+                timestamps, values = history_watermark.filter(data_type, node_name, result['timestamps'], result['values'])
+                if len(timestamps):
+                    await samples.put((data_type, node_name, timestamps, values))
 
-    def _save_history_with_dedup(self, models, model_class):
+        async def flush(data_type, rows):
+            model_class, _ = HISTORY_TABLES[data_type]
+            try:
+                if HISTORY_STORAGE == 'wide':
+                    ok = await asyncio.to_thread(history_wide.save, data_type, rows)
+                else:
+                    ok = await asyncio.to_thread(self._save_history_with_dedup, rows, model_class)
+            except Exception as e:
+                # 写库异常不能让写库协程退出，否则拉取方会一直阻塞在满队列上
+                logger.error(f"写入{data_type}历史信息失败: {e}")
+                ok = False
+            if stats['first_write'] is None:
+                stats['first_write'] = round(time.time() - start_time, 2)
+            stats['batches'] += 1
+            marks = {}
+            for row in rows:
+                marks[row['node']] = max(marks.get(row['node'], 0), row['timestamp'])
+            if ok:
+                stats['rows'] += len(rows)
+                history_buffer.append_rows(data_type, rows)
+                for node_name, timestamp in marks.items():
+                    key = (data_type, node_name)
+                    new_marks[key] = max(new_marks.get(key, 0), timestamp)
+                # 重算这批样本涉及的汇总桶；失败只影响汇总，可用 history_rollup.backfill 补齐
+                try:
+                    await asyncio.to_thread(history_rollup.update, data_type, list(marks),
+                                            min(row['timestamp'] for row in rows), max(marks.values()))
+                except Exception as e:
+                    logger.error(f"更新{data_type}历史汇总失败: {e}")
+            else:
+                stats['failed_batches'] += 1
+                failed.update((data_type, node_name) for node_name in marks)
+
+        async def writer():
+            buffers = {data_type: [] for data_type in HISTORY_TABLES}
+            while True:
+                item = await samples.get()
+                if item is None:
+                    break
+                data_type, node_name, timestamps, values = item
+                _, usage_field = HISTORY_TABLES[data_type]
+                buffer = buffers[data_type]
+                # tolist 转回 Python 原生类型，驱动不认识 NumPy 标量
+                buffer.extend({'node': node_name, 'timestamp': ts, usage_field: value}
+                              for ts, value in zip(timestamps.tolist(), values.tolist()))
+                while len(buffer) >= batch_size:
+                    await flush(data_type, buffer[:batch_size])
+                    del buffer[:batch_size]
+            for data_type, buffer in buffers.items():
+                if buffer:
+                    await flush(data_type, buffer)
+
+        writers = [asyncio.create_task(writer()) for _ in range(cfg.getint('history', 'write_workers', fallback=2))]
+        async with AsyncHpcApi() as aapi:
+            await asyncio.gather(*[fetcher(aapi) for _ in range(cfg.getint('history', 'fetch_workers', fallback=32))])
+        for _ in writers:
+            await samples.put(None)
+        await asyncio.gather(*writers)
+
+        for (data_type, node_name), timestamp in new_marks.items():
+            if (data_type, node_name) not in failed:
+                history_watermark.advance(data_type, node_name, timestamp)
+        return stats
+
+    def _save_history_with_dedup(self, rows, model_class):
         """
         批量保存历史记录，自动过滤重复的(node, timestamp)组合（跳过重复记录）
         
         使用 MySQL 的 INSERT IGNORE 优化性能，避免先查询再插入的两步操作
         
         Args:
-            models: 要保存的模型对象列表
+            rows: 要保存的记录，字典列表 {'node', 'timestamp', 使用率字段}，直接用于 core insert，不构造 ORM 对象
             model_class: 模型类（TNodeCpuHistoryInfo/TNodeMemHistoryInfo/TNodeGpuHistoryInfo）
-            history_type: 历史类型名称（用于日志），如'CPU'、'内存'、'GPU'
+
+        Returns:
+            是否所有记录都已入库（插入成功或因重复被跳过），有记录写入失败时返回 False
         """
         start_time = time.time()
-        if not models:
-            return
+        if not rows:
+            return True
         
-        # 确定字段名
+        # 确定历史类型名称（用于日志）
         if model_class == TNodeCpuHistoryInfo:
-            usage_field = 'cpu_usage'
             history_type = 'CPU'
         elif model_class == TNodeMemHistoryInfo:
-            usage_field = 'mem_usage'
             history_type = '内存'
         elif model_class == TNodeGpuHistoryInfo:
-            usage_field = 'gpu_usage'
             history_type = 'GPU'
         else:
-            return
-        
-        # 转换为字典列表，用于批量插入
-        data_list = [
-            {
-                'node': m.node,
-                'timestamp': m.timestamp,
-                usage_field: getattr(m, usage_field)
-            }
-            for m in models
-        ]
+            return False
+        data_list = rows
         
         # 使用 MySQL 的 INSERT IGNORE，让数据库自动忽略重复键，完全避免查询步骤
         with get_db_context_session() as session:
             # 分批插入，每批1000条，平衡性能和内存
             batch_size = 1000
             total_inserted = 0
+            failed = 0
             
             for i in range(0, len(data_list), batch_size):
                 batch = data_list[i:i + batch_size]
@@ -526,28 +781,31 @@ class HpcManager:
                                 continue
                             except Exception as e2:
                                 session.rollback()
+                                failed += 1
                                 logger.error(f"插入单条{history_type}历史信息失败: {e2}")
         
-        skipped_count = len(models) - total_inserted
+        skipped_count = len(rows) - total_inserted
         end_time = time.time()
         logger.info(f"保存历史信息完成，{history_type}：{total_inserted}条（跳过{skipped_count}条重复记录），耗时：{round(end_time - start_time, 2)}秒")
+        return failed == 0
     
     def daily_statistic(self):
         today = datetime.now().strftime('%Y-%m-%d')
+        snapshot = self.snapshot
         with get_db_context_session() as session:
             daily_report = session.query(TDailyReportInfo).filter(TDailyReportInfo.date == today).first()
             if not daily_report:
                 partition_info = list(map(lambda x: x.statistic(), 
-                    self.partitions.values()))
+                    snapshot.partitions.values()))
                 exception_nodes = list(map(lambda x: x.get_daily_report(), 
-                    filter(lambda x: not x.active, Node.nodes_info)))
-                queuing_jobs = list(map(lambda x: Task(x['slurmJobId']).get_daily_report(), 
-                    filter(lambda x: x['status'] == '排队中', Task.tasks_info)))
+                    filter(lambda x: not x.active, snapshot.nodes)))
+                queuing_jobs = list(map(lambda x: Task(x).get_daily_report(), 
+                    filter(lambda x: x['status'] == '排队中', snapshot.tasks)))
                 daily_report = TDailyReportInfo(
                     date=today, 
                     partition_info=partition_info,
-                    total_users=self.total_user,
-                    online_users=self.user_active,
+                    total_users=snapshot.total_user,
+                    online_users=snapshot.user_active,
                     exception_nodes=exception_nodes,
                     queuing_jobs=queuing_jobs,
                 )
@@ -566,13 +824,101 @@ class HpcManager:
                 return {}
         return daily_report.to_dict()
 
+    def get_queue_wait_percentiles(self, start, end, by_card_type=True):
+        '''[start, end) 内开始运行的作业按分区（和卡型）的排队时长 p50/p90/p99（秒），由小时草图合并得到'''
+        try:
+            return queue_wait_sketches.percentiles(start, end, by_card_type=by_card_type)
+        except Exception as e:
+            logger.error(f"获取排队时长分位数失败: {e}")
+            return []
+
     @property
     def total_user(self):
-        return self.user_total['total']
+        return self.snapshot.total_user
 
     @property
     def user_active(self):
-        return self.user_total['active']
+        return self.snapshot.user_active
+
+    def get_nodes_history(self, history_type, nodes, recent_days=7, max_points=500):
+        '''多个节点同一指标的历史曲线（每个时间桶取均值），一条分组语句，返回 {节点: [{'timestamp': ..., 使用率字段: ...}]}'''
+        start_timestampe = time.time()
+        _, usage_field = HISTORY_TABLES[history_type]
+        start_time, interval, level = history_window(recent_days, max_points)
+        histories = {node: [] for node in nodes}
+        try:
+            for node, timestamp, mean_val, _ in history_batch.series(history_type, nodes, start_time, interval, level):
+                histories[node].append({'timestamp': timestamp, usage_field: float(mean_val)})
+        except Exception as e:
+            logger.error(f"获取节点{list(nodes)}{history_type}历史信息失败: {e}")
+        logger.info(f"get_nodes_history {history_type} 节点数:{len(nodes)} start: {start_time} step: {interval} 用时：{time.time() - start_timestampe:.3f}s")
+        return histories
+
+    def get_partition_history(self, partition_name, history_type, recent_days=7, max_points=500):
+        '''分区所有节点同一指标按时间桶聚合，返回 [{'timestamp', 'sum', 'mean', 'p95', 'nodes'}]，由数据库一条语句算出'''
+        start_timestampe = time.time()
+        partition = self.snapshot.partitions.get(partition_name)
+        if partition is None:
+            return []
+        start_time, interval, level = history_window(recent_days, max_points)
+        try:
+            rows = history_batch.aggregate(history_type, list(partition.nodes), start_time, interval, level)
+        except Exception as e:
+            logger.error(f"获取分区{partition_name}{history_type}历史信息失败: {e}")
+            return []
+        logger.info(f"get_partition_history {history_type} 分区:{partition_name} start: {start_time} step: {interval} 用时：{time.time() - start_timestampe:.3f}s")
+        return [{'timestamp': row[0], 'sum': float(row[1]), 'mean': float(row[2]), 'p95': float(row[3]), 'nodes': int(row[4])} for row in rows]
+
+    def get_heatmap(self, history_type, recent_days=7, max_columns=720):
+        '''
+        全集群 节点 × 时间 使用率热力图，返回可直接交给前端的字典，矩阵为 uint8 的 base64 编码：
+            {'nodes': [...], 'start': 起点, 'step': 列宽秒数, 'rows': 行数, 'cols': 列数, 'missing': 无数据取值, 'data': base64}
+
+        时间窗按整点对齐，同一小时内同一节点列表的结果直接复用缓存，进入下一小时时清空。
+        '''
+        start_timestampe = time.time()
+        nodes = tuple(node.node for node in self.snapshot.nodes)
+        hour = int(time.time()) // 3600
+        key = (history_type, recent_days, max_columns, nodes)
+        with self._heatmaps_lock:
+            cached = self._heatmaps.get(hour, {}).get(key)
+        if cached is not None:
+            return cached
+
+        end_time = (hour + 1) * 3600
+        step = max(1, recent_days * 86400 // max_columns)
+        # 至少使用 5 分钟汇总，列宽取所选汇总级别桶宽的整数倍
+        level = history_rollup.level_for(step) or 0
+        width = ROLLUP_LEVELS[level][0]
+        step = math.ceil(step / width) * width
+        start_time = (end_time - recent_days * 86400) // step * step
+        columns = math.ceil((end_time - start_time) / step)
+        try:
+            matrix = history_heatmap.matrix(history_type, nodes, start_time, step, columns, level)
+        except Exception as e:
+            logger.error(f"获取{history_type}热力图失败: {e}")
+            return None
+        payload = {
+            'nodes': list(nodes),
+            'start': start_time,
+            'step': step,
+            'rows': len(nodes),
+            'cols': columns,
+            'missing': HEATMAP_MISSING,
+            'data': base64.b64encode(matrix.tobytes()).decode('ascii'),
+        }
+        with self._heatmaps_lock:
+            self._heatmaps = {hour: {**self._heatmaps.get(hour, {}), key: payload}}
+        logger.info(f"get_heatmap {history_type} 节点数:{len(nodes)} 列数:{columns} step: {step} 级别:{level} 用时：{time.time() - start_timestampe:.3f}s")
+        return payload
+
+    def register_task_view(self, name, builder):
+        '''注册作业派生视图，之后每次刷新时随快照预先构建；当前快照上在首次取用时构建'''
+        self.task_views[name] = builder
+
+    @property
+    def partitions(self):
+        return self.snapshot.partitions
 
     @property
     def partition(self):
@@ -0,0 +1,134 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert
+from common import logger, cfg
+from common.utils import GRID_SQL_CONDITIONS
+from models.model import TJobArchive
+from models import get_db_context_session
+
+# 进入归档的最终状态
+FINAL_STATUSES = ('已完成', '失败')
+
+# 作业字段 -> 归档表的列
+ARCHIVE_COLUMNS = {
+    'slurmJobId': 'job_id',
+    'name': 'name',
+    'status': 'status',
+    'partition': 'partition_name',
+    'nodes': 'nodes',
+    'createBy': 'create_by',
+    'submitTime': 'submit_time',
+    'startTime': 'start_time',
+    'endTime': 'end_time',
+    'duration': 'duration',
+    'cpu': 'cpu',
+    'mem': 'mem',
+    'card': 'card',
+    'card_type': 'card_type',
+}
+TIME_COLUMNS = ('submit_time', 'start_time', 'end_time')
+TIME_FMT = '%Y-%m-%d %H:%M:%S'
+
+
+class JobArchive:
+    '''
+    已结束作业归档（t_job_archive）：刷新时把本轮拉取到的已完成/失败作业按 job_id 覆盖写入，
+    内存里的作业列表只保留最近的若干个，更早的作业从这里按时间范围和索引查询，不再翻上游的分页接口。
+
+    索引都是 (筛选列, submit_time)，按 分区/节点/状态 等值筛选再按提交时间范围、排序分页，都只扫描索引上的一段；
+    申请人与内存作业列表（TaskStore.user_positions）一样按不区分大小写的包含匹配，只能在索引上逐行比较。
+    '''
+
+    def __init__(self) -> None:
+        self.batch_size = cfg.getint('job_archive', 'batch_size', fallback=500)
+
+    @staticmethod
+    def _to_row(task):
+        row = {column: task.get(field) for field, column in ARCHIVE_COLUMNS.items()}
+        for column in ('name', 'partition_name', 'nodes', 'create_by'):
+            row[column] = row[column] or ''
+        for column in TIME_COLUMNS:
+            # 上游没有的时间是 None 或空字符串
+            row[column] = row[column] or None
+        return row
+
+    @staticmethod
+    def _to_task(record):
+        task = {field: getattr(record, column) for field, column in ARCHIVE_COLUMNS.items()}
+        for field in ('submitTime', 'startTime', 'endTime'):
+            if task[field] is not None:
+                task[field] = task[field].strftime(TIME_FMT)
+        task['node'] = task['nodes'] or None
+        return task
+
+    def save(self, tasks):
+        '''按 job_id 写入或覆盖已结束的作业，其他状态的作业忽略，返回写入的作业数'''
+        rows = [self._to_row(task) for task in tasks if task.get('status') in FINAL_STATUSES and task.get('slurmJobId')]
+        if not rows:
+            return 0
+        try:
+            with get_db_context_session() as session:
+                for i in range(0, len(rows), self.batch_size):
+                    stmt = insert(TJobArchive).values(rows[i:i + self.batch_size])
+                    stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in ARCHIVE_COLUMNS.values() if column != 'job_id'})
+                    session.execute(stmt)
+                session.commit()
+        except Exception as e:
+            logger.error(f"归档已结束作业失败: {e}")
+            return 0
+        return len(rows)
+
+    @staticmethod
+    def _filtered_query(session, start=None, end=None, status=None, partition=None, node=None, user=None, filters=()):
+        query = session.query(TJobArchive)
+        query = query.filter(TJobArchive.status.in_(FINAL_STATUSES) if not status else TJobArchive.status == status)
+        if partition:
+            query = query.filter(TJobArchive.partition_name == partition)
+        if node:
+            query = query.filter(TJobArchive.nodes == node)
+        if user:
+            # 与 TaskStore.user_positions 相同：不区分大小写的包含匹配，排队中/运行中与已完成/失败的结果一致
+            query = query.filter(func.lower(TJobArchive.create_by).contains(user.lower(), autoescape=True))
+        if start:
+            query = query.filter(TJobArchive.submit_time >= start)
+        if end:
+            query = query.filter(TJobArchive.submit_time < end)
+        for field, kind, value in filters:
+            condition = GRID_SQL_CONDITIONS.get(kind)
+            if condition and field in ARCHIVE_COLUMNS:
+                query = query.filter(condition(getattr(TJobArchive, ARCHIVE_COLUMNS[field]), value))
+        return query
+
+    def query(self, start=None, end=None, status=None, partition=None, node=None, user=None,
+              sort_keys=(), filters=(), start_row=0, end_row=100):
+        '''
+        按提交时间范围 [start, end) 和条件分页查询已结束的作业，排序、筛选、分页都在数据库中完成
+        :param status: 已完成/失败，为空表示两者都要
+        :param sort_keys: [(作业字段, 是否降序)]，默认按提交时间倒序
+        :param filters: [(作业字段, 匹配方式, 值)]，匹配方式见 common.utils.GRID_SQL_CONDITIONS
+        :return: (与内存作业同格式的作业字典列表, 符合条件的总数)
+        '''
+        with get_db_context_session() as session:
+            query = self._filtered_query(session, start, end, status, partition, node, user, filters)
+            total = query.with_entities(func.count(TJobArchive.job_id)).scalar()
+            order = []
+            for field, descending in sort_keys or [('submitTime', True)]:
+                if field not in ARCHIVE_COLUMNS:
+                    continue
+                column = getattr(TJobArchive, ARCHIVE_COLUMNS[field])
+                # 作业ID是数字字符串，先比长度再比字符串即按数值排序
+                columns = [func.char_length(column), column] if field == 'slurmJobId' else [column]
+                order.extend(c.desc() if descending else c for c in columns)
+            records = query.order_by(*order, TJobArchive.job_id).offset(start_row).limit(end_row - start_row).all()
+            return [self._to_task(record) for record in records], total
+
+    def between(self, start, end, column='submit_time'):
+        '''按 submit_time 或 start_time 取 [start, end) 内的全部已结束作业，供统计使用'''
+        if column not in ('submit_time', 'start_time'):
+            raise ValueError(f'不支持按{column}查询')
+        time_column = getattr(TJobArchive, column)
+        with get_db_context_session() as session:
+            records = session.query(TJobArchive).filter(time_column >= start, time_column < end).order_by(time_column).all()
+            return [self._to_task(record) for record in records]
+
+
+job_archive = JobArchive()
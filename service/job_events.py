@@ -0,0 +1,189 @@
+import time
+from sqlalchemy import text, bindparam, tuple_
+from sqlalchemy.dialects.mysql import insert
+from common import logger, cfg
+from common.sketch import QuantileSketch
+from models.model import TJobEvent, TQueueWaitSketch
+from models import get_db_context_session
+
+# 事件类型，表中存 tinyint
+EVENT_SUBMITTED = 1
+EVENT_STARTED = 2
+EVENT_FINISHED = 3
+EVENT_FAILED = 4
+EVENT_NAMES = {EVENT_SUBMITTED: 'submitted', EVENT_STARTED: 'started', EVENT_FINISHED: 'finished', EVENT_FAILED: 'failed'}
+
+# 作业状态 -> 进入该状态时（连同之前必然经过的状态）产生的事件
+STATUS_EVENTS = {
+    '排队中': (EVENT_SUBMITTED,),
+    '运行中': (EVENT_SUBMITTED, EVENT_STARTED),
+    '已完成': (EVENT_SUBMITTED, EVENT_STARTED, EVENT_FINISHED),
+    '失败': (EVENT_SUBMITTED, EVENT_STARTED, EVENT_FAILED),
+}
+
+TIME_FMT = '%Y-%m-%d %H:%M:%S'
+
+
+def _timestamp(value):
+    '''上游的本地时间字符串转时间戳，没有时间返回 None'''
+    if not value:
+        return None
+    try:
+        return int(time.mktime(time.strptime(value, TIME_FMT)))
+    except ValueError:
+        return None
+
+
+class JobEventLog:
+    '''
+    作业状态变化事件（t_job_event，只追加）：每次刷新把本轮作业状态与上一轮对比，只对新出现或状态变化的作业生成事件，一次批量写入。
+
+    事件时间取上游的 submitTime/startTime/endTime，而不是发现变化的刷新时刻；started 事件带排队时长 startTime - submitTime，
+    写入时同时并入 QueueWaitSketches 的小时草图，按分区统计排队时长不必再扫描作业列表。
+    两轮之间跳过的状态（例如排队中直接变成已完成）会一并补上；(job_id, event) 为主键，重启后重复生成的事件被 INSERT IGNORE 丢弃。
+
+    self.states 只在 refresh_info 所在的调度线程里读写。
+    '''
+
+    def __init__(self) -> None:
+        self.batch_size = cfg.getint('job_events', 'batch_size', fallback=1000)
+        # slurmJobId -> 上一轮的状态
+        self.states = {}
+
+    @staticmethod
+    def _events(task):
+        submit, start = _timestamp(task.get('submitTime')), _timestamp(task.get('startTime'))
+        times = {
+            EVENT_SUBMITTED: submit,
+            EVENT_STARTED: start,
+            # 上游没有结束时间时，用发现结束的时刻
+            EVENT_FINISHED: _timestamp(task.get('endTime')) or int(time.time()),
+            EVENT_FAILED: _timestamp(task.get('endTime')) or int(time.time()),
+        }
+        for event in STATUS_EVENTS.get(task['status'], ()):
+            if times[event] is None:
+                continue
+            yield {
+                'job_id': task['slurmJobId'],
+                'event': event,
+                'ts': times[event],
+                'partition_name': task.get('partition') or '',
+                'create_by': task.get('createBy') or '',
+                'card_type': task.get('card_type'),
+                'wait_seconds': max(start - submit, 0) if event == EVENT_STARTED and submit is not None else None,
+            }
+
+    def diff(self, tasks):
+        '''对比上一轮状态，返回 (本轮状态, 需要写入的事件)'''
+        states = {}
+        events = []
+        for task in tasks:
+            job_id = task.get('slurmJobId')
+            if not job_id:
+                continue
+            states[job_id] = task['status']
+            if self.states.get(job_id) != task['status']:
+                events.extend(self._events(task))
+        return states, events
+
+    def _new_started(self, session, events):
+        '''started 事件中表里还没有的（重启后重复生成的已经计入过排队时长草图）'''
+        started = [event for event in events if event['event'] == EVENT_STARTED]
+        existing = set()
+        sql = text(f"SELECT job_id FROM {TJobEvent.__tablename__} WHERE event = :event AND job_id IN :ids").bindparams(bindparam('ids', expanding=True))
+        for i in range(0, len(started), self.batch_size):
+            ids = [event['job_id'] for event in started[i:i + self.batch_size]]
+            existing.update(row[0] for row in session.execute(sql, {'event': EVENT_STARTED, 'ids': ids}))
+        return [event for event in started if event['job_id'] not in existing]
+
+    def record(self, tasks):
+        '''
+        生成并写入本轮的状态变化事件，返回写入的事件数；新开始的作业计入排队时长草图。
+        事件和草图在一个显式事务里写入：连接默认 autocommit（models/base.py），不开事务时事件先提交、草图失败，
+        下一轮重新生成的 started 事件会被 _new_started 当作已计入而跳过，排队时长就永远漏掉了。
+        写入失败时整体回滚、不更新状态，下一轮重新生成
+        '''
+        states, events = self.diff(tasks)
+        try:
+            if events:
+                with get_db_context_session() as session:
+                    session.execute(text('START TRANSACTION'))
+                    try:
+                        started = self._new_started(session, events)
+                        for i in range(0, len(events), self.batch_size):
+                            session.execute(insert(TJobEvent).prefix_with('IGNORE').values(events[i:i + self.batch_size]))
+                        queue_wait_sketches.add(session, started)
+                        session.commit()
+                    except Exception:
+                        session.rollback()
+                        raise
+        except Exception as e:
+            logger.error(f"写入作业事件失败（{len(events)}个）: {e}")
+            return 0
+        self.states = states
+        return len(events)
+
+
+class QueueWaitSketches:
+    '''
+    排队时长分位数草图（t_queue_wait_sketch）：按 (小时, 分区, 卡型) 各存一个 QuantileSketch，作业开始时把排队时长并入所在小时的草图。
+    任意时间窗口的 p50/p90/p99 只需取出窗口内的几十到几百个小时草图合并，不扫描作业或事件；窗口按整点对齐。
+    修改 [queue_sketch] relative_accuracy 后旧草图无法与新草图合并，会被跳过。
+    '''
+
+    def __init__(self) -> None:
+        self.relative_accuracy = cfg.getfloat('queue_sketch', 'relative_accuracy', fallback=0.01)
+
+    def add(self, session, events):
+        '''把 started 事件的排队时长并入对应小时的草图，在调用方的事务里读改写；只有调度线程写入'''
+        groups = {}
+        for event in events:
+            if event.get('wait_seconds') is None:
+                continue
+            key = (event['ts'] // 3600 * 3600, event['partition_name'], event['card_type'] or '')
+            groups.setdefault(key, []).append(event['wait_seconds'])
+        if not groups:
+            return
+        keys = list(groups)
+        existing = {}
+        for i in range(0, len(keys), 500):
+            rows = session.query(TQueueWaitSketch.hour, TQueueWaitSketch.partition_name, TQueueWaitSketch.card_type, TQueueWaitSketch.sketch) \
+                .filter(tuple_(TQueueWaitSketch.hour, TQueueWaitSketch.partition_name, TQueueWaitSketch.card_type).in_(keys[i:i + 500])).all()
+            existing.update({(hour, partition, card_type): sketch for hour, partition, card_type, sketch in rows})
+        values = []
+        for key, waits in groups.items():
+            sketch = QuantileSketch.from_dict(existing[key]) if key in existing else QuantileSketch(self.relative_accuracy)
+            if sketch.relative_accuracy != self.relative_accuracy:
+                logger.warning(f"排队时长草图{key}的精度为{sketch.relative_accuracy}，与配置不同，重新开始统计")
+                sketch = QuantileSketch(self.relative_accuracy)
+            sketch.add(waits)
+            values.append({'hour': key[0], 'partition_name': key[1], 'card_type': key[2], 'cnt': sketch.count, 'sketch': sketch.to_dict()})
+        stmt = insert(TQueueWaitSketch).values(values)
+        stmt = stmt.on_duplicate_key_update(cnt=stmt.inserted.cnt, sketch=stmt.inserted.sketch)
+        session.execute(stmt)
+
+    def percentiles(self, start, end, by_card_type=True, qs=(0.5, 0.9, 0.99)):
+        '''
+        [start, end) 内开始运行的作业的排队时长分位数（秒），按 分区（和卡型）合并小时草图。
+        返回 [{'partition', 'card_type', 'count', 'mean', 'p50', 'p90', 'p99'}]，分位数的键由 qs 决定
+        '''
+        with get_db_context_session() as session:
+            rows = session.query(TQueueWaitSketch.partition_name, TQueueWaitSketch.card_type, TQueueWaitSketch.sketch) \
+                .filter(TQueueWaitSketch.hour >= start // 3600 * 3600, TQueueWaitSketch.hour < end).all()
+        merged = {}
+        for partition, card_type, data in rows:
+            sketch = QuantileSketch.from_dict(data)
+            if sketch.relative_accuracy != self.relative_accuracy:
+                continue
+            key = (partition, card_type if by_card_type else None)
+            merged[key] = merged[key].merge(sketch) if key in merged else sketch
+        result = []
+        for (partition, card_type), sketch in sorted(merged.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            row = {'partition': partition, 'card_type': card_type, 'count': sketch.count, 'mean': sketch.mean}
+            row.update({f'p{round(q * 100)}': value for q, value in zip(qs, sketch.quantiles(qs))})
+            result.append(row)
+        return result
+
+
+job_events = JobEventLog()
+queue_wait_sketches = QueueWaitSketches()
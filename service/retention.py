@@ -0,0 +1,134 @@
+import calendar
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from common import logger, cfg
+from models.model import TNodeCpuHistoryInfo, TNodeGpuHistoryInfo, TNodeMemHistoryInfo, TNodeHistory, \
+    TNodeHistoryRollup5m, TNodeHistoryRollup1h, TNodeHistoryRollup1d
+from models import get_db_context_session
+from service.history import history_rollup, HISTORY_TABLES, HISTORY_STORAGE, ROLLUP_LEVELS
+
+# (表, 分区列, [retention] 中的保留天数配置项)
+PARTITIONED_TABLES = [
+    (TNodeCpuHistoryInfo, 'timestamp', 'raw_days'),
+    (TNodeMemHistoryInfo, 'timestamp', 'raw_days'),
+    (TNodeGpuHistoryInfo, 'timestamp', 'raw_days'),
+    (TNodeHistory, 'ts', 'raw_days'),
+    (TNodeHistoryRollup5m, 'bucket', 'rollup_5m_days'),
+    (TNodeHistoryRollup1h, 'bucket', 'rollup_1h_days'),
+    (TNodeHistoryRollup1d, 'bucket', 'rollup_1d_days'),
+]
+
+
+def _month_start(year, month):
+    '''UTC 月初的时间戳；分区边界按 UTC 对齐，保证 5 分钟/1 小时/1 天汇总桶都不会跨分区'''
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+
+class HistoryRetention:
+    '''
+    历史表按月 RANGE 分区后的定期维护（分区 DDL 见 docs/db.sql）：
+        1. 把 pmax 拆分出未来 [retention] future_months 个月的分区，写入始终落在已存在的月分区里；
+        2. 即将过期的分区删除前，检查以它为数据源的那一级汇总，只补算样本数对不上的天（压实），保证长范围曲线不丢；
+        3. DROP PARTITION 删除过期分区，耗时与行数无关，不会像 DELETE 那样长时间锁表、拖慢写入。
+    保留天数为 0 表示永久保留；尚未分区的表只记录日志并跳过。
+    '''
+
+    def __init__(self) -> None:
+        self.future_months = cfg.getint('retention', 'future_months', fallback=3)
+        self.days = {key: cfg.getint('retention', key, fallback=fallback)
+                     for key, fallback in (('raw_days', 90), ('rollup_5m_days', 365), ('rollup_1h_days', 1095), ('rollup_1d_days', 0))}
+
+    @staticmethod
+    def _partitions(session, table):
+        '''返回 [(分区名, 上界时间戳)]，MAXVALUE 分区的上界为 None；表未分区时返回空列表'''
+        rows = session.execute(text("""SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION"""), {'table': table.__tablename__}).fetchall()
+        return [(name, None if description == 'MAXVALUE' else int(description)) for name, description in rows]
+
+    def _add_future(self, session, table, partitions):
+        '''把 pmax 拆成截至 future_months 个月之后的月分区'''
+        if not partitions or partitions[-1][1] is not None:
+            logger.warning(f"表{table.__tablename__}没有 MAXVALUE 分区，无法预建分区")
+            return []
+        now = datetime.now(timezone.utc)
+        last_bound = max((bound for _, bound in partitions if bound is not None), default=0)
+        new = []
+        for i in range(self.future_months + 1):
+            bound = _month_start(now.year, now.month + i + 1)
+            if bound > last_bound:
+                start = _month_start(now.year, now.month + i)
+                new.append((f"p{time.strftime('%Y%m', time.gmtime(start))}", bound))
+        if new:
+            definitions = ', '.join(f'PARTITION {name} VALUES LESS THAN ({bound})' for name, bound in new)
+            session.execute(text(f"""ALTER TABLE {table.__tablename__} REORGANIZE PARTITION {partitions[-1][0]}
+                INTO ({definitions}, PARTITION {partitions[-1][0]} VALUES LESS THAN MAXVALUE)"""))
+        return [name for name, _ in new]
+
+    @staticmethod
+    def _compaction(table):
+        '''
+        表过期前需要压实到的 (汇总级别, [指标])，不需要时返回 None：
+        原始表只是 5 分钟汇总中自己那个指标的数据源，N 级汇总只是 N+1 级的数据源；
+        最粗一级汇总没有可以压实的去处，非当前存储方式的原始表不是汇总的数据源
+        '''
+        if table is TNodeHistory:
+            return (0, list(HISTORY_TABLES)) if HISTORY_STORAGE == 'wide' else None
+        for data_type, (raw_table, _) in HISTORY_TABLES.items():
+            if table is raw_table:
+                return (0, [data_type]) if HISTORY_STORAGE != 'wide' else None
+        for level, (_, rollup_table) in enumerate(ROLLUP_LEVELS[:-1]):
+            if table is rollup_table:
+                return level + 1, list(HISTORY_TABLES)
+        return None
+
+    @staticmethod
+    def _compact(session, table, column, expired, compaction):
+        '''
+        把即将删除的分区范围压实进目标级别：从第一个过期分区的最小值（第一个分区没有下界）到最后一个过期分区的上界，
+        按天比较样本数，只重算对不上的天；save_history 一直在更新汇总，通常一条也不用重算
+        '''
+        level, data_types = compaction
+        first_name, first_bound = expired[0]
+        lo = session.execute(text(f"SELECT MIN({column}) FROM {table.__tablename__} PARTITION ({first_name})")).scalar()
+        lo = (first_bound if lo is None else lo) // 86400 * 86400
+        hi = expired[-1][1]
+        recomputed = 0
+        for data_type in data_types:
+            for day in history_rollup.stale_days(data_type, level, lo, hi):
+                history_rollup.update_level(data_type, level, day, min(day + 86400, hi))
+                recomputed += 1
+        logger.info(f"表{table.__tablename__}过期分区压实进{ROLLUP_LEVELS[level][1].__tablename__}，范围：{lo} - {hi}，补算{recomputed}天")
+
+    def maintain(self):
+        start_time = time.time()
+        for table, column, days_key in PARTITIONED_TABLES:
+            try:
+                with get_db_context_session() as session:
+                    partitions = self._partitions(session, table)
+                    if not partitions:
+                        logger.warning(f"表{table.__tablename__}尚未分区，跳过维护，分区方法见 docs/db.sql")
+                        continue
+                    added = self._add_future(session, table, partitions)
+
+                    days = self.days[days_key]
+                    expired = []
+                    if days > 0:
+                        cutoff = int(time.time()) - days * 86400
+                        # 只删除上界早于截止时间的整月分区，且至少保留最后一个有上界的分区承接更早的数据
+                        bounded = [(name, bound) for name, bound in partitions if bound is not None]
+                        expired = [(name, bound) for name, bound in bounded[:-1] if bound <= cutoff]
+                    compaction = self._compaction(table)
+                    if expired and compaction:
+                        self._compact(session, table, column, expired, compaction)
+                    if expired:
+                        session.execute(text(f"ALTER TABLE {table.__tablename__} DROP PARTITION {', '.join(name for name, _ in expired)}"))
+                logger.info(f"表{table.__tablename__}分区维护完成，新增分区：{added}，删除分区：{[name for name, _ in expired]}")
+            except Exception as e:
+                logger.error(f"表{table.__tablename__}分区维护失败: {e}")
+        logger.info(f"历史表分区维护完成，耗时：{round(time.time() - start_time, 2)}秒")
+
+
+history_retention = HistoryRetention()
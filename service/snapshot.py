@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+
+def freeze(mapping) -> Mapping:
+    '''只读视图，发布后的快照不允许再被修改'''
+    return MappingProxyType(dict(mapping))
+
+
+@dataclass(frozen=True)
+class ClusterSnapshot:
+    '''
+    一次 refresh_info 得到的集群状态，构建完成后只读。
+
+    refresh_info 每次构建一个新快照，再通过一次引用赋值发布（HpcManager.snapshot），
+    页面回调在开头取一次 hpc_manager.snapshot，之后只读这个对象，不需要加锁也不会读到刷新到一半的数据。
+    version 单调递增，下游缓存可以用它作为失效键。
+    '''
+    version: int
+    built_at: float
+    partitions: Mapping
+    nodes: tuple
+    tasks: tuple
+    task_store: object
+    tasks_by_node: Mapping
+    tasks_by_partition: Mapping
+    tasks_by_id: Mapping
+    user_total: Mapping
+
+    @property
+    def total_user(self):
+        return self.user_total['total']
+
+    @property
+    def user_active(self):
+        return self.user_total['active']
+
+    def get_node(self, node_name):
+        return next((node for node in self.nodes if node.node == node_name), None)
@@ -0,0 +1,125 @@
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+# 作业在进程内保留的字段，其余上游字段在 Task.normalize 时丢弃
+TASK_FIELDS = ('slurmJobId', 'name', 'status', 'partition', 'nodes', 'node', 'createBy',
+               'submitTime', 'startTime', 'endTime', 'duration', 'cpu', 'mem', 'card', 'card_type')
+
+# 取值重复度高的列存为 category，并按列值建立行号索引
+INDEXED_COLUMNS = ('status', 'partition', 'node', 'createBy')
+CATEGORY_COLUMNS = INDEXED_COLUMNS + ('mem', 'card_type')
+
+EMPTY_POSITIONS = np.empty(0, dtype=np.int64)
+
+# 表格列筛选（AG Grid 文本筛选）支持的匹配方式，不区分大小写
+TEXT_FILTERS = {
+    'contains': lambda s, v: s.str.contains(v, regex=False),
+    'notContains': lambda s, v: ~s.str.contains(v, regex=False),
+    'equals': lambda s, v: s == v,
+    'notEqual': lambda s, v: s != v,
+    'startsWith': lambda s, v: s.str.startswith(v),
+    'endsWith': lambda s, v: s.str.endswith(v),
+}
+
+# 排序时需要换算的列：作业ID是数字字符串，按数值排序
+SORT_KEYS = {'slurmJobId': lambda s: pd.to_numeric(s, errors='coerce')}
+
+
+class TaskStore:
+    '''
+    作业列存：一个快照内的全部作业存成一张只含 TASK_FIELDS 的 DataFrame，低基数列为 category，
+    cpu/card 为可空整数。构建时按 状态/分区/节点/用户 建立 列值 -> 行号数组 的索引、按作业ID建立 作业ID -> 行号，
+    按这些条件筛选只是查索引、求行号交集，不再扫描或重建整张表。
+
+    与快照一起构建、一起发布，发布后只读。页面需要的派生表（例如带 HTML 的作业行）通过 view 按名字缓存在同一个对象上，
+    随快照一起替换，不需要另外的失效逻辑。
+    '''
+
+    def __init__(self, tasks) -> None:
+        frame = pd.DataFrame.from_records(list(tasks), columns=list(TASK_FIELDS))
+        for column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        for column in ('cpu', 'card'):
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('Int32')
+        self.frame = frame
+        self.index = {column: dict(frame.groupby(column, observed=True, sort=False).indices) for column in INDEXED_COLUMNS}
+        self.positions_by_id = {job_id: i for i, job_id in enumerate(frame['slurmJobId'])}
+        self._views = {}
+        self._views_lock = Lock()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def positions(self, column, value):
+        '''某一列等于 value 的行号数组'''
+        return self.index[column].get(value, EMPTY_POSITIONS)
+
+    def user_positions(self, keyword):
+        '''申请人包含 keyword（不区分大小写）的行号数组：只在去重后的用户名上匹配，再合并对应的索引'''
+        keyword = keyword.lower()
+        matched = [positions for user, positions in self.index['createBy'].items() if keyword in str(user).lower()]
+        return np.sort(np.concatenate(matched)) if matched else EMPTY_POSITIONS
+
+    def select(self, status=None, partition=None, node=None, user=None):
+        '''按条件筛选，返回升序行号数组；条件为空表示不限'''
+        selected = None
+        for positions in (self.positions('status', status) if status else None,
+                          self.positions('partition', partition) if partition else None,
+                          self.positions('node', node) if node else None,
+                          self.user_positions(user) if user else None):
+            if positions is None:
+                continue
+            selected = positions if selected is None else np.intersect1d(selected, positions, assume_unique=True)
+        return np.arange(len(self.frame)) if selected is None else selected
+
+    def filter_text(self, positions, column, kind, value):
+        '''在 positions 中按列做文本筛选；category 列只在去重后的取值上匹配，再按编码取行'''
+        match = TEXT_FILTERS.get(kind)
+        if match is None or value is None:
+            return positions
+        value = str(value).lower()
+        series = self.frame[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = pd.Series(series.cat.categories.astype(str)).str.lower()
+            hit = np.flatnonzero(match(categories, value).to_numpy(dtype=bool))
+            keep = np.isin(series.cat.codes.to_numpy()[positions], hit)
+        else:
+            values = series.iloc[positions].fillna('').astype(str).str.lower()
+            keep = match(values, value).to_numpy(dtype=bool)
+        return positions[keep]
+
+    def rank(self, column):
+        '''列的排序名次（相同的值名次相同，缺失值排最后），每个快照每列只计算一次'''
+        def build(store):
+            values = store.frame[column]
+            if column in SORT_KEYS:
+                values = SORT_KEYS[column](values)
+            return values.rank(method='dense', na_option='bottom').to_numpy(dtype=np.int64)
+        return self.view(f'rank:{column}', build)
+
+    def sort(self, positions, keys):
+        '''按 [(列, 是否降序)] 对行号排序，前面的列优先；只对名次数组做 lexsort，不排序整张表'''
+        if not keys:
+            return positions
+        ranks = [-self.rank(column)[positions] if descending else self.rank(column)[positions]
+                 for column, descending in reversed(keys)]
+        return positions[np.lexsort(ranks)]
+
+    def rows(self, positions):
+        '''按行号取出子表'''
+        return self.frame.iloc[positions]
+
+    def get(self, job_id):
+        i = self.positions_by_id.get(job_id)
+        return None if i is None else self.frame.iloc[i].to_dict()
+
+    def view(self, name, builder):
+        '''按名字缓存 builder(self) 的结果，每个快照只构建一次；并发请求同一个视图时只有一个线程构建'''
+        view = self._views.get(name)
+        if view is None:
+            with self._views_lock:
+                view = self._views.get(name)
+                if view is None:
+                    view = self._views[name] = builder(self)
+        return view
@@ -2,51 +2,96 @@ from models.model import THpcUserInfo
 from models import get_db_context_session
 import time
 from infra.hpc_api import api
-from sqlalchemy import insert, or_
+from sqlalchemy import insert, or_, func
 from common import logger
+from common.utils import GRID_SQL_CONDITIONS
+
 
 class User:
     def __init__(self):
         pass
 
-    def get_and_update_users(self, username=None, status=None, role=None):
+    def _filtered_query(self, session, username=None, status=None, role=None, filters=()):
+        users = session.query(THpcUserInfo)
+        if username:
+            users = users.filter(or_(THpcUserInfo.username.like(f'%{username}%'),
+                THpcUserInfo.realname.like(f'%{username}%')))
+        if status:
+            users = users.filter(THpcUserInfo.status == status)
+        if role:
+            users = users.filter(THpcUserInfo.role_name.like(f'%{role}%'))
+        for column, kind, value in filters:
+            condition = GRID_SQL_CONDITIONS.get(kind)
+            if condition:
+                users = users.filter(condition(getattr(THpcUserInfo, column), value))
+        return users
+
+    def query_users(self, username=None, status=None, role=None, sort_keys=(), filters=(), start_row=0, end_row=100):
+        '''
+        分页查询用户，排序、筛选、分页都在数据库中完成，只返回 [start_row, end_row) 这一段
+        :param sort_keys: [(列名, 是否降序)]，按 id 兜底保证分页稳定
+        :param filters: [(列名, 匹配方式, 值)]，匹配方式见 common.utils.GRID_SQL_CONDITIONS
+        :return: (用户信息列表, 符合条件的总数)
+        '''
+        if not start_row and not filters and not self._count(username, status, role):
+            # 本地还没有符合条件的用户，与 get_and_update_users 一样先从接口同步一次
+            self.get_and_update_users(username=username or '', status=status, role=role)
+        with get_db_context_session() as session:
+            users = self._filtered_query(session, username, status, role, filters)
+            total = users.order_by(None).with_entities(func.count(THpcUserInfo.id)).scalar()
+            order = [getattr(THpcUserInfo, column).desc() if descending else getattr(THpcUserInfo, column)
+                     for column, descending in sort_keys]
+            rows = users.order_by(*order, THpcUserInfo.id).offset(start_row).limit(end_row - start_row).all()
+            return [row.to_dict() for row in rows], total
+
+    def _count(self, username=None, status=None, role=None):
+        with get_db_context_session() as session:
+            return self._filtered_query(session, username, status, role).with_entities(func.count(THpcUserInfo.id)).scalar()
+
+    def get_and_update_users(self, username=None, status=None, role=None, collect=False):
         '''
         获取并更新用户信息
-        :param username: 用户名，如果为None，则更新所有用户并返回，如果为空字符串，则获取所有用户，否则获取指定用户
-        :return: 用户信息列表
+        :param username: 用户名，如果为None，则更新所有用户，如果为空字符串，则获取所有用户，否则获取指定用户
+        :param collect: 是否返回从接口拉取到的用户；定时全量同步不需要返回值，不收集，内存里只有正在入库的几页
+        :return: 本地已有符合条件的用户时返回本地的用户信息列表；否则 collect 为 True 时返回拉取到的用户信息列表，为 False 时返回 None
         '''
         if username is not None or status is not None or role is not None:
             with get_db_context_session() as session:
-                users = session.query(THpcUserInfo)
-                if username:
-                    users = users.filter(or_(THpcUserInfo.username.like(f'%{username}%'), 
-                        THpcUserInfo.realname.like(f'%{username}%')))
-                if status:
-                    users = users.filter(THpcUserInfo.status == status)
-                if role:
-                    users = users.filter(THpcUserInfo.role_name.like(f'%{role}%'))
-                users = users.all()
+                users = self._filtered_query(session, username, status, role).all()
                 if users:
                     return list(map(lambda x: x.to_dict(), users))
 
         start = time.time()
-        all_users = api.get_all_users(username=username)
-        all_users = list(map(lambda x: {
-            'hpc_id': x['id'],
-            'username': x['username'],
-            'realname': x['realname'],
-            'email': x['email'],
-            'phone': x['phone'],
-            'role_name': ','.join(x['roleNameList']),
-            'register_time': x['createTime'],
-            'status': x['status_dictText'],
-        }, all_users))
-        with get_db_context_session() as session:
-            stmt = insert(THpcUserInfo).prefix_with('IGNORE').values(all_users)
-            session.execute(stmt)
-            session.commit()
+        all_users = []
+        count = 0
+        # 逐页拉取、逐页入库，内存里只保留精简后的用户字段
+        try:
+            for records in api.iter_all_users(username=username):
+                users = list(map(lambda x: {
+                    'hpc_id': x['id'],
+                    'username': x['username'],
+                    'realname': x['realname'],
+                    'email': x['email'],
+                    'phone': x['phone'],
+                    'role_name': ','.join(x['roleNameList']),
+                    'register_time': x['createTime'],
+                    'status': x['status_dictText'],
+                }, records))
+                if not users:
+                    continue
+                with get_db_context_session() as session:
+                    stmt = insert(THpcUserInfo).prefix_with('IGNORE').values(users)
+                    session.execute(stmt)
+                    session.commit()
+                count += len(users)
+                if collect:
+                    all_users.extend(users)
+        except RuntimeError as e:
+            logger.error(f"拉取用户列表失败，已入库{count}个：{e}")
         end = time.time()
-        logger.info(f"更新所有用户完成，耗时：{end - start}秒, 用户数：{len(all_users)}")
+        logger.info(f"更新所有用户完成，耗时：{end - start}秒, 用户数：{count}")
+        if not collect:
+            return None
         if status:
             all_users = list(filter(lambda x: x['status'] == status, all_users))
         return all_users